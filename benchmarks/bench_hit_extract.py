@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+bench_hit_extract.py
+
+Hit extraction from a Censys query dump: the original
+get_dns_names_from_query / get_ips_from_query / flatten_array path against
+the single-pass extractor in utils/fig2_blocklist_utils.py.
+
+The dump's pages are repeated --scale times to mimic larger dumps.
+
+    python benchmarks/bench_hit_extract.py [dump.json] [--scale 20] [--repeat 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.fig2_blocklist_utils import extract_query_hits
+
+DEFAULT_DUMP = 'data/raw/fig2/censys_manual.json'
+
+
+# what the fig2 notebook used to run
+def original_get_dns_names_from_query(data):
+    count = 0
+    dns_names = []
+    for i in range(len(data['result']['hits'])):
+        if 'dns' in data['result']['hits'][i].keys():
+            result = data['result']['hits'][i]['dns']['reverse_dns']['names']
+            dns_names.append(result)
+            count += len(result)
+    return dns_names
+
+
+def original_get_ips_from_query(data):
+    count = 0
+    ips = []
+    for i in range(len(data['result']['hits'])):
+        if 'dns' in data['result']['hits'][i].keys():
+            result = data['result']['hits'][i]['ip']
+            ips.append(result)
+            count += len(result)
+    return ips
+
+
+def original_flatten_array(arr):
+    for item in arr:
+        if isinstance(item, list):
+            yield from original_flatten_array(item)
+        else:
+            yield item
+
+
+def original_path(pages):
+    dns_list = []
+    for page in pages:
+        dns_list.append(original_get_dns_names_from_query(page))
+    dns_list = list(original_flatten_array(dns_list))
+    ip_list = []
+    for page in pages:
+        ip_list.append(original_get_ips_from_query(page))
+    ip_list = list(original_flatten_array(ip_list))
+    return ip_list, dns_list
+
+
+def bench(fn, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(pages)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump', nargs='?', default=DEFAULT_DUMP)
+    parser.add_argument('--scale', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.dump) as f:
+        pages = json.load(f)
+    pages = pages * args.scale
+    n_hits = sum(len(page['result']['hits']) for page in pages)
+    print(f"{len(pages)} pages, {n_hits} hits")
+
+    base_seconds, expected = bench(original_path, pages, args.repeat)
+    print(f"  {'original (3 functions)':<24} {base_seconds * 1000:9.1f} ms  {n_hits / base_seconds / 1e6:6.2f} Mhits/s")
+    seconds, result = bench(extract_query_hits, pages, args.repeat)
+    print(f"  {'extract_query_hits':<24} {seconds * 1000:9.1f} ms  {n_hits / seconds / 1e6:6.2f} Mhits/s"
+          f"  x{base_seconds / seconds:.1f}")
+    if result != expected:
+        sys.exit('extract_query_hits disagrees with the original path')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+bench_html_extract.py
+
+Throughput (MB/s of HTML consumed) of the HTML-to-text extractors in
+utils/fig5_classify_utils.py against the original
+BeautifulSoup(body, "html.parser").get_text() path.
+
+Bodies are read from the given HTML files / directories, JSON / JSONL(.gz)
+files of Censys host records (services[].http.response.body, search spills
+included) or a Censys cache database (.sqlite). Without arguments the
+bodies captured in the local Censys cache and search spills are used, or,
+when there are none, a spread of synthetic pharmacy pages (0.5-300 KB,
+log-normal around 8 KB) like real Censys bodies. Single huge pages such as
+the captured safe.pharmacy listing (4 MB) only exercise the early-exit path.
+
+    python benchmarks/bench_html_extract.py [paths...] [--repeat 5]
+"""
+import os
+import sys
+import gzip
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.fig5_classify_utils import HTML_EXTRACTORS, SNIPPET_CHARS, extract_http_response, get_html_extractor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic_censys import html_body
+
+DEFAULT_CAPTURES = [os.getenv('CENSYS_CACHE_DB', 'censys_cache.sqlite'),
+                    'illicit_pharmacy_search.ndjson.gz', 'manual_hosts.ndjson.gz']
+SYNTHETIC_BODIES = 300
+
+
+def record_bodies(records):
+    for rec in records:
+        body = extract_http_response(rec.get('host', rec) if 'query' in rec else rec)[1]
+        if body:
+            yield body
+
+
+def load_bodies(paths):
+    bodies = []
+    for path in paths:
+        if os.path.isdir(path):
+            bodies.extend(load_bodies([os.path.join(path, p) for p in sorted(os.listdir(path))]))
+        elif path.endswith('.sqlite'):
+            db = sqlite3.connect(path)
+            try:
+                rows = db.execute('SELECT data FROM hosts').fetchall()
+            finally:
+                db.close()
+            bodies.extend(record_bodies(json.loads(row[0]) for row in rows))
+        elif path.endswith(('.jsonl', '.ndjson', '.jsonl.gz', '.ndjson.gz')):
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                bodies.extend(record_bodies(json.loads(line) for line in f if line.strip()))
+        elif path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                records = json.load(f)
+            bodies.extend(record_bodies(records if isinstance(records, list) else [records]))
+        elif path.endswith('.html') or path.endswith('.htm'):
+            with open(path, encoding='utf-8', errors='replace') as f:
+                bodies.append(f.read())
+    return bodies
+
+
+def synthetic_bodies(n=SYNTHETIC_BODIES, seed=0):
+    rng = random.Random(seed)
+    sizes = [min(300000, max(500, int(rng.lognormvariate(math.log(8000), 1.0)))) for _ in range(n)]
+    return [html_body(rng, 'Online Pharmacy', size) for size in sizes]
+
+
+def original_path(body, limit):
+    # what fig5 used to run per host
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(body, "html.parser")
+    text = soup.get_text(separator="\n", strip=True)
+    return text[:limit]
+
+
+def bench(fn, bodies, limit, repeat):
+    total = sum(len(b.encode('utf-8')) for b in bodies)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for body in bodies:
+            fn(body, limit)
+        best = min(best, time.perf_counter() - start)
+    return total / best / 1e6, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.paths:
+        bodies = load_bodies(args.paths)
+        if not bodies:
+            sys.exit('no bodies found')
+    else:
+        bodies = load_bodies([p for p in DEFAULT_CAPTURES if os.path.exists(p)])
+        if not bodies:
+            print("no captured bodies, using synthetic ones")
+            bodies = synthetic_bodies()
+    size = sum(len(b.encode('utf-8')) for b in bodies) / 1e6
+    lengths = sorted(len(b) for b in bodies)
+    print(f"{len(bodies)} bodies, {size:.2f} MB, chars p50 {lengths[len(lengths) // 2]}"
+          f" p90 {lengths[len(lengths) * 9 // 10]} max {lengths[-1]}")
+
+    candidates = {'original (bs4 get_text)': original_path}
+    for name, fn in HTML_EXTRACTORS.items():
+        candidates[name] = fn
+
+    for limit in (SNIPPET_CHARS, None):
+        candidates['auto'] = get_html_extractor('auto', limit)
+        print(f"\nlimit={limit}")
+        baseline = None
+        for name, fn in candidates.items():
+            try:
+                mbps, seconds = bench(fn, bodies, limit, args.repeat)
+            except ImportError as e:
+                print(f"  {name:<24} unavailable ({e})")
+                continue
+            baseline = baseline or mbps
+            print(f"  {name:<24} {mbps:9.2f} MB/s  {seconds * 1000:9.1f} ms  x{mbps / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+run_benchmarks.py
+
+End-to-end benchmarks of the pipeline hot paths on synthetic Censys data
+(see synthetic_censys.py), at several corpus sizes:
+
+  hit_extraction      extract_query_hits over search pages
+  blocklist_matching  parse_blocklist + membership matrix against an ipset and a netset
+  domain_matching     DomainMatcher.match_hosts over reverse-DNS names
+  keyword_scanning    normalizing KeywordMatcher.scan_corpus over HTTP bodies
+  keyword_overlap     keyword_overlap over keyword -> host sets
+  domain_analysis     flatten_host_records + the fig8/9 group-bys
+  html_extraction     get_html_extractor() over HTTP bodies
+
+Each case/size runs in its own subprocess so peak RSS is per case. Reported:
+best-of seconds (at least --repeat runs, more until ~1 s was measured),
+items/s, MB/s (body cases), peak RSS and the RSS added by the measured step
+over the generated input.
+
+Results are compared with benchmarks/baselines.json; --save-baseline
+overwrites the entries that were run, --fail-on-regression exits non-zero
+when a case is slower than baseline by more than --threshold.
+
+    python benchmarks/run_benchmarks.py [--sizes 1000,10000] [--cases hit_extraction,...]
+    python benchmarks/run_benchmarks.py --sizes 1000000 --cases hit_extraction,domain_analysis
+"""
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic_censys import (MEDICATIONS, OBFUSCATED, PHARMACY_PHRASES, generate_hosts, generate_search_pages,
+                              generate_blocklist, generate_domain_list, generate_keyword_hosts)
+
+DEFAULT_SIZES = '1000,10000'
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+# distinct bodies generated for the body cases; larger corpora cycle through them
+BODY_POOL = 2000
+MIN_MEASURE_SECONDS = 1.0
+
+
+###################### CASES ######################
+# each case takes (size, seed) and returns (run, n_items, n_bytes); only run() is timed
+
+def case_hit_extraction(size, seed):
+    from utils.fig2_blocklist_utils import extract_query_hits
+    pages = list(generate_search_pages(size, seed=seed))
+    return (lambda: extract_query_hits(pages)), size, 0
+
+
+def case_blocklist_matching(size, seed):
+    from utils.fig2_blocklist_utils import parse_blocklist, blocklist_membership_matrix
+    hosts = list(generate_hosts(size, seed, with_bodies=False))
+    ips = [host["ip"] for host in hosts]
+    feeds = {
+        "ipset": generate_blocklist(hosts, extra=max(10000, size), seed=seed),
+        "netset": generate_blocklist(hosts, ranges=True, extra=max(10000, size), seed=seed + 1),
+    }
+    del hosts
+
+    def run():
+        indexes = {name: parse_blocklist(text).to_index() for name, text in feeds.items()}
+        return blocklist_membership_matrix(ips, indexes)
+    return run, size, 0
+
+
+def case_domain_matching(size, seed):
+    from utils.fig2_blocklist_utils import DomainMatcher, iter_query_hits
+    hosts = list(iter_query_hits(list(generate_search_pages(size, seed=seed))))
+    listed = generate_domain_list(max(1000, size // 5), seed=seed + 1)
+    matcher = DomainMatcher(listed)
+    return (lambda: matcher.match_hosts(hosts)), size, 0
+
+
+def body_pool(size, seed):
+    pool = []
+    for host in generate_hosts(min(size, BODY_POOL), seed):
+        for service in host["services"]:
+            body = ((service.get("http") or {}).get("response") or {}).get("body")
+            if body:
+                pool.append(body)
+                break
+    return [pool[i % len(pool)] for i in range(size)]
+
+
+def case_keyword_scanning(size, seed):
+    from utils.keyword_utils import KeywordMatcher
+    bodies = body_pool(size, seed)
+    matcher = KeywordMatcher(MEDICATIONS + OBFUSCATED + PHARMACY_PHRASES, normalize=True)
+    return (lambda: matcher.scan_corpus(bodies)), size, sum(len(b.encode('utf-8')) for b in bodies)
+
+
+def case_keyword_overlap(size, seed):
+    from utils.keyword_utils import keyword_overlap
+    keyword_hosts = generate_keyword_hosts(200, size, mean_hits=max(10, size // 100), seed=seed)
+    return (lambda: keyword_overlap(keyword_hosts)), size, 0
+
+
+def case_domain_analysis(size, seed):
+    from utils.censys_utils import flatten_host_records
+    hosts = list(generate_hosts(size, seed, with_bodies=False))
+
+    def run():
+        # the aggregations of fig89_domainAnalysis.analyze_search_results2
+        tables = flatten_host_records(hosts, include_bodies=False)
+        hosts_df, services, names = tables["hosts"], tables["services"], tables["names"]
+        return (hosts_df["country"].value_counts(), hosts_df["asn_name"].value_counts(),
+                names["tld"].value_counts(), hosts_df["reg_year"].value_counts().sort_index(),
+                services.groupby("port").size(), names.drop_duplicates("domain")[["domain", "tld"]])
+    return run, size, 0
+
+
+def case_html_extraction(size, seed):
+    from utils.fig5_classify_utils import get_html_extractor, SNIPPET_CHARS
+    bodies = body_pool(size, seed)
+    extract = get_html_extractor(limit=SNIPPET_CHARS)
+    return (lambda: [extract(body, SNIPPET_CHARS) for body in bodies]), size, sum(len(b.encode('utf-8')) for b in bodies)
+
+
+CASES = {
+    "hit_extraction": case_hit_extraction,
+    "blocklist_matching": case_blocklist_matching,
+    "domain_matching": case_domain_matching,
+    "keyword_scanning": case_keyword_scanning,
+    "keyword_overlap": case_keyword_overlap,
+    "domain_analysis": case_domain_analysis,
+    "html_extraction": case_html_extraction,
+}
+
+
+###################### MEASUREMENT ######################
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure(case, size, seed, repeat):
+    start = time.perf_counter()
+    run, n_items, n_bytes = CASES[case](size, seed)
+    setup_seconds = time.perf_counter() - start
+    setup_rss = peak_rss_mb()
+    # at least `repeat` runs, more for fast cases so sub-millisecond timings settle
+    best = float('inf')
+    runs = spent = 0
+    while runs < repeat or (spent < MIN_MEASURE_SECONDS and runs < 1000):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        runs += 1
+    peak = peak_rss_mb()
+    return {
+        "seconds": best,
+        "items_per_s": n_items / best,
+        "mb_per_s": n_bytes / best / 1e6 if n_bytes else None,
+        "peak_rss_mb": peak,
+        "step_rss_mb": peak - setup_rss,
+        "setup_seconds": setup_seconds,
+        "runs": runs,
+    }
+
+
+def run_isolated(case, size, seed, repeat):
+    # a fresh interpreter per case so ru_maxrss is not shared between cases
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', case, str(size),
+                           '--seed', str(seed), '--repeat', str(repeat)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+###################### BASELINES ######################
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines, results):
+    baselines.update({key: value for key, value in results.items() if "error" not in value})
+    baselines["_meta"] = {"python": platform.python_version(), "machine": platform.machine(),
+                          "saved_at": time.strftime("%Y-%m-%d")}
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+
+def format_row(key, result, base, threshold):
+    if "error" in result:
+        return f"  {key:<28} ERROR {result['error']}", False
+    mb = f"{result['mb_per_s']:7.1f} MB/s" if result["mb_per_s"] else " " * 12
+    row = (f"  {key:<28} {result['seconds'] * 1000:9.1f} ms {result['items_per_s']:11.0f} items/s {mb}"
+           f" {result['peak_rss_mb']:7.0f} MB peak {result['step_rss_mb']:+6.0f} MB step")
+    if not base:
+        return row + "   (no baseline)", False
+    ratio = result["seconds"] / base["seconds"]
+    rss_ratio = result["peak_rss_mb"] / base["peak_rss_mb"]
+    regressed = ratio > threshold
+    return row + f"   time x{ratio:.2f} rss x{rss_ratio:.2f}" + ("  REGRESSION" if regressed else ""), regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default=DEFAULT_SIZES)
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baselines', default=DEFAULT_BASELINES)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=1.5)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--child', nargs=2, metavar=('CASE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        case, size = args.child
+        print(json.dumps(measure(case, int(size), args.seed, args.repeat)))
+        return
+
+    cases = [c for c in args.cases.split(',') if c]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        sys.exit(f"unknown cases: {', '.join(unknown)} (known: {', '.join(CASES)})")
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+
+    baselines = load_baselines(args.baselines)
+    results = {}
+    regressions = []
+    for case in cases:
+        for size in sizes:
+            key = f"{case}/{size}"
+            results[key] = run_isolated(case, size, args.seed, args.repeat)
+            row, regressed = format_row(key, results[key], baselines.get(key), args.threshold)
+            print(row, flush=True)
+            if regressed:
+                regressions.append(key)
+
+    if args.save_baseline:
+        save_baselines(args.baselines, baselines, results)
+        print(f"baselines written to {args.baselines}")
+    if regressions and args.fail_on_regression:
+        sys.exit(f"{len(regressions)} regression(s) over x{args.threshold}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+synthetic_censys.py
+
+Deterministic fake Censys data shaped like the real API responses, so the
+figure pipelines can be measured without credentials:
+
+  generate_hosts(n)          host records (location, autonomous_system,
+                             services with HTTP bodies, dns names, certificate)
+  generate_search_pages(n)   search pages like data/raw/fig2/censys_manual.json
+  generate_blocklist(hosts)  ipset / netset text covering part of the hosts
+  generate_domain_list(...)  plain domain list (pharmacy.safe style)
+  generate_keyword_hosts(n)  fig3-style keyword -> set of host ids
+
+Everything is seeded; the same arguments give the same data.
+
+    python benchmarks/synthetic_censys.py hosts 10000 -o hosts.jsonl
+    python benchmarks/synthetic_censys.py pages 5000 -o dump.json
+"""
+import sys
+import json
+import random
+import argparse
+
+MEDICATIONS = [
+    "viagra", "cialis", "levitra", "xanax", "valium", "ambien", "tramadol", "adderall",
+    "oxycontin", "vicodin", "percocet", "hydrocodone", "phentermine", "clonazepam", "modafinil",
+]
+OBFUSCATED = ["v1agra", "vi@gra", "x@nax", "tr@m@dol", "0xycodone", "phentermin3", "add3rall"]
+PHARMACY_PHRASES = [
+    "no prescription required", "no prescription needed", "buy without prescription",
+    "online pharmacy", "canadian pharmacy", "cheap pills", "discreet shipping",
+    "overnight delivery", "bitcoin accepted", "bonus pills", "fda approved", "best prices online",
+]
+FILLER = (
+    "the and for with your our all you can order now today free fast secure worldwide "
+    "quality trusted customer support satisfaction guarantee delivery shipping products "
+    "health care service price discount offer save generic brand tablets capsules mg "
+    "dosage information about contact privacy policy terms home shop cart checkout"
+).split()
+BRAND_PARTS = ["rx", "med", "meds", "pharma", "pill", "drug", "care", "health", "cheap", "best",
+               "express", "direct", "online", "global", "shop", "store", "plus", "now", "24"]
+TLDS = [".com", ".net", ".org", ".info", ".biz", ".ru", ".top", ".xyz", ".shop", ".co.uk", ".com.au"]
+COUNTRIES = [("United States", "US"), ("Germany", "DE"), ("Netherlands", "NL"), ("Russia", "RU"),
+             ("China", "CN"), ("India", "IN"), ("Canada", "CA"), ("France", "FR"),
+             ("United Kingdom", "GB"), ("Singapore", "SG")]
+ASNS = [(13335, "CLOUDFLARENET"), (16509, "AMAZON-02"), (24940, "HETZNER-AS"), (14061, "DIGITALOCEAN-ASN"),
+        (16276, "OVH"), (20473, "AS-CHOOPA"), (63949, "AKAMAI-LINODE-AP"), (398779, "ACEHOST"),
+        (9009, "M247"), (49505, "SELECTEL")]
+SERVICES = [(80, "HTTP"), (443, "HTTP"), (8080, "HTTP"), (22, "SSH"), (21, "FTP"), (25, "SMTP"),
+            (587, "SMTP"), (993, "IMAP"), (3306, "MYSQL"), (53, "DNS")]
+
+
+def ip_from_int(value):
+    return ".".join(str((value >> shift) & 255) for shift in (24, 16, 8, 0))
+
+
+def domain_name(rng):
+    parts = rng.sample(BRAND_PARTS, rng.randint(2, 3))
+    return "".join(parts) + str(rng.randint(0, 99) if rng.random() < 0.3 else "") + rng.choice(TLDS)
+
+
+def html_body(rng, title, size):
+    # a page-shaped body: head with script/style, nav, paragraphs of pharmacy copy
+    words = []
+    length = 0
+    while length < size:
+        r = rng.random()
+        if r < 0.06:
+            words.append(rng.choice(MEDICATIONS).capitalize())
+        elif r < 0.075:
+            words.append(rng.choice(OBFUSCATED))
+        elif r < 0.09:
+            words.append(rng.choice(PHARMACY_PHRASES))
+        elif r < 0.1:
+            words.append(f"${rng.randint(1, 300)}.{rng.randint(0, 99):02d}")
+        else:
+            words.append(rng.choice(FILLER))
+        length += len(words[-1]) + 1
+    paragraphs = []
+    for i in range(0, len(words), 60):
+        paragraphs.append("<p>" + " ".join(words[i:i + 60]) + "</p>")
+    return (f"<!DOCTYPE html><html><head><title>{title}</title>"
+            "<style>body{font-family:sans-serif}.nav a{color:#333}</style>"
+            "<script>var cart=[];function add(id){cart.push(id)}</script></head>"
+            "<body><div class=\"nav\"><a href=\"/\">Home</a> <a href=\"/shop\">Shop</a> "
+            "<a href=\"/contact\">Contact</a></div>" + "\n".join(paragraphs) + "</body></html>")
+
+
+def generate_host(rng, index, body_size=2000, with_bodies=True):
+    ip_value = rng.randint(0x01000000, 0xDFFFFFFF)
+    country, country_code = rng.choice(COUNTRIES)
+    asn, asn_name = rng.choice(ASNS)
+    name = domain_name(rng)
+    services = []
+    for port, service_name in rng.sample(SERVICES, rng.randint(1, 4)):
+        service = {"port": port, "service_name": service_name, "transport_protocol": "TCP",
+                   "extended_service_name": service_name}
+        if service_name == "HTTP":
+            title = f"{name.split('.')[0].title()} - {rng.choice(PHARMACY_PHRASES).title()}"
+            response = {"status_code": 200, "html_title": title}
+            if with_bodies:
+                response["body"] = html_body(rng, title, rng.randint(body_size // 2, body_size * 3 // 2))
+            service["http"] = {"request": {"method": "GET", "uri": f"http://{name}/"}, "response": response}
+        services.append(service)
+    host = {
+        "ip": ip_from_int(ip_value),
+        "location": {"country": country, "country_code": country_code, "continent": "Earth"},
+        "autonomous_system": {"asn": asn, "name": asn_name, "bgp_prefix": ip_from_int(ip_value & 0xFFFFFF00) + "/24"},
+        "services": services,
+        "last_updated_at": "2025-05-04T20:10:03.610Z",
+    }
+    if rng.random() < 0.7:
+        names = [name] + [f"www.{name}"] * (rng.random() < 0.5)
+        host["dns"] = {"names": names, "reverse_dns": {"names": [rng.choice([name, f"host-{index}.{rng.choice(ASNS)[1].lower()}.net"])]}}
+    if rng.random() < 0.6:
+        host["certificate"] = {"registered": f"{rng.randint(2012, 2025)}-{rng.randint(1, 12):02d}-01"}
+    return host
+
+
+def generate_hosts(n, seed=0, body_size=2000, with_bodies=True):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield generate_host(rng, i, body_size, with_bodies)
+
+
+def generate_search_pages(n_hits, per_page=50, seed=0):
+    # search pages as stored in censys_manual.json; hits carry no bodies
+    hits = []
+    page_no = 0
+    for host in generate_hosts(n_hits, seed, with_bodies=False):
+        hits.append(host)
+        if len(hits) == per_page:
+            yield _page(hits, page_no, n_hits)
+            hits = []
+            page_no += 1
+    if hits:
+        yield _page(hits, page_no, n_hits)
+
+
+def _page(hits, page_no, total):
+    return {"code": 200, "status": "OK",
+            "result": {"query": "synthetic", "total": total, "duration": 100, "hits": hits,
+                       "links": {"next": f"page-{page_no + 1}", "prev": f"page-{page_no - 1}" if page_no else ""}}}
+
+
+def generate_blocklist(hosts, fraction=0.05, ranges=False, extra=10000, seed=0):
+    # ipset (or netset with ranges=True) text listing `fraction` of the hosts
+    # plus `extra` unrelated entries, with a FireHOL-style header
+    rng = random.Random(seed)
+    lines = ["#", "# synthetic", "#", f"# ipv4 hash:{'net' if ranges else 'ip'} ipset", "#"]
+    for host in hosts:
+        if rng.random() < fraction:
+            ip = host["ip"]
+            lines.append(ip.rsplit(".", 1)[0] + ".0/24" if ranges and rng.random() < 0.3 else ip)
+    for _ in range(extra):
+        value = rng.randint(0x01000000, 0xDFFFFFFF)
+        lines.append(ip_from_int(value & 0xFFFFF000) + "/20" if ranges and rng.random() < 0.2 else ip_from_int(value))
+    return "\n".join(lines) + "\n"
+
+
+def generate_domain_list(n, seed=0):
+    rng = random.Random(seed)
+    return [domain_name(rng) for _ in range(n)]
+
+
+def generate_keyword_hosts(n_keywords, n_hosts, mean_hits=100, seed=0):
+    # keyword -> set of host ids with a heavy-tailed hit count, like fig3's keyword_to_sites
+    rng = random.Random(seed)
+    keywords = (MEDICATIONS + OBFUSCATED + PHARMACY_PHRASES + [f"kw{i}" for i in range(n_keywords)])[:n_keywords]
+    return {kw: set(rng.sample(range(n_hosts), min(n_hosts, int(rng.paretovariate(1.5) * mean_hits / 3))))
+            for kw in keywords}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kind', choices=['hosts', 'pages'])
+    parser.add_argument('n', type=int)
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--body-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        if args.kind == 'hosts':
+            # NDJSON, one host per line
+            for host in generate_hosts(args.n, args.seed, args.body_size):
+                out.write(json.dumps(host) + "\n")
+        else:
+            json.dump(list(generate_search_pages(args.n, seed=args.seed)), out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,17 @@ API_ID = "YOUR_CENSYS_API_ID"
 API_SECRET = "YOUR_CENSYS_API_SECRET"
 
 import os
-import time
-from collections import defaultdict
+import sys
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 import seaborn as sns
-import pandas as pd
-from censys.search import CensysHosts
-from censys.common.exceptions import CensysException
 
-# Init Censys API
-hosts = CensysHosts(api_id=API_ID, api_secret=API_SECRET)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import cached_censys_hosts, KeywordQueryEngine
+from utils.keyword_utils import keyword_overlap, CoverageIndex, WordFrequencyCounter, InvertedIndex, collapse_keywords
+
+# Init Censys API (searches are cached locally, see utils/censys_utils.py)
+hosts = cached_censys_hosts(api_id=API_ID, api_secret=API_SECRET)
 
 openai_keywords = [
   "viagra",
@@ -318,50 +318,43 @@ baseline_keywords = [
 ]
 
 # === Step 3: Crawl and Store Content ===
-keyword_to_sites = defaultdict(dict)
-def _handle_single_result(keyword, result):
-    ip = result.get("ip")
-    if not ip:
-        return
-    for service in result.get("services", []):
-        if service.get("service_name") == "HTTP":
-            title = service.get("http", {}).get("response", {}).get("html_title", "")
-            body = service.get("http", {}).get("response", {}).get("body", "")
-            keyword_to_sites[keyword][ip] = {"title": title, "body": body}
-def run_query_with_content(keyword, max_results=100):
-    query = f'services.http.response.body: "{keyword}"'
-    try:
-        search_results = hosts.search(query=query, per_page=100, max_records=max_results)
-
-        for result in search_results:
-            # 如果 result 是列表（某些版本 SDK 有这种行为）
-            if isinstance(result, list):
-                for item in result:
-                    _handle_single_result(keyword, item)
-            elif isinstance(result, dict):
-                _handle_single_result(keyword, result)
-
-        time.sleep(1)
-
-    except CensysException as e:
-        print(f"[Error] {keyword}: {e}")
+# Searches run concurrently under one rate limit; every host body is kept once
+# in engine.store and each keyword only keeps the set of host ids it returned.
+engine = KeywordQueryEngine(
+    hosts,
+    rate=float(os.getenv("CENSYS_RATE", "1.0")),   # requests / second
+    workers=int(os.getenv("CENSYS_WORKERS", "4")),
+    max_results=100,
+)
+keyword_to_sites = engine.keyword_hosts
 
 
 # === Step 4: Run Search ===
+# Contribution scores are maintained incrementally, so keywords and baselines
+# can be added or dropped later without re-running the other searches.
+coverage = CoverageIndex()
+
 print("Collecting baseline...")
-baseline_set = set()
+engine.run(baseline_keywords)
 for kw in baseline_keywords:
-    run_query_with_content(kw)
-    baseline_set |= set(keyword_to_sites[kw].keys())
+    coverage.add_keyword(kw, keyword_to_sites[kw], baseline=True)
+baseline_set = coverage.baseline_hosts()
 
 print("Collecting LLM keywords...")
+engine.run(llm_keywords)
 llm_unique_counts = {}
 for kw in llm_keywords:
-    run_query_with_content(kw)
-    llm_sites = set(keyword_to_sites[kw].keys())
-    unique_sites = llm_sites - baseline_set
-    llm_unique_counts[kw] = len(unique_sites)
-    print(f"[LLM Keyword] {kw} → {len(unique_sites)} unique sites")
+    if kw not in coverage.baselines:
+        coverage.add_keyword(kw, keyword_to_sites[kw])
+for kw in llm_keywords:
+    llm_unique_counts[kw] = coverage.marginal.get(kw, 0)
+    print(f"[LLM Keyword] {kw} → {llm_unique_counts[kw]} unique sites")
+
+# Smallest (greedy) set of LLM keywords that still finds 90% of their hosts
+print("Greedy keyword ranking (90% coverage):")
+for kw, gain, covered in coverage.greedy_cover(0.9, keywords=coverage.candidate_keywords(),
+                                               universe=coverage.covered_hosts() - baseline_set):
+    print(f"  {kw}: +{gain} hosts ({covered:.1%})")
 
 # Calculate total keywords and those with zero unique sites
 total_keywords = len(llm_unique_counts)
@@ -382,18 +375,36 @@ plt.gca().invert_yaxis()
 plt.savefig("llm_keyword_effectiveness2.pdf")
 plt.show()
 
+# === Step 5: Score Further Keyword Lists Offline ===
+# Every crawled title/body goes into a local positional index that persists
+# across runs, so keyword lists that haven't been searched live yet are scored
+# against the corpus first; only promising ones need to spend query quota.
+index = InvertedIndex(os.getenv("KEYWORD_INDEX", "keyword_index"))
+index.add_store(engine.store)
+index.save()
+baseline_ips = {engine.store.ip(host_id) for host_id in baseline_set}
+candidate_keywords = [kw for kw in gemini_keywords + claude_keywords if kw not in keyword_to_sites]
+canonical_terms = collapse_keywords(candidate_keywords)
+print(f"{len(candidate_keywords)} candidate keywords → {len(canonical_terms)} canonical terms")
+offline_scores = index.score_keywords(list(canonical_terms), leet=True, known=baseline_ips)
+offline_scores["variants"] = offline_scores["keyword"].map(lambda term: ", ".join(canonical_terms[term]))
+print(f"Offline keyword scores ({len(index)} indexed hosts):")
+print(offline_scores.head(20).to_string(index=False))
+
 # === Step 6: Word Cloud from HTML Content ===
 def generate_wordcloud():
-    all_text = ""
-    for site_dict in keyword_to_sites.values():
-        for meta in site_dict.values():
-            all_text += " " + (meta.get("title") or "") + " " + (meta.get("body") or "")
+    # stream titles and bodies through the counter instead of concatenating them
+    counter = WordFrequencyCounter()
+    for title, body in engine.store.iter_content():
+        counter.update(title or "")
+        counter.update(body or "")
 
-    if not all_text.strip():
+    frequencies = counter.frequencies(max_words=200)
+    if not frequencies:
         print("[Warning] No website content available to generate word cloud.")
         return
 
-    wordcloud = WordCloud(width=1600, height=800, background_color='white').generate(all_text)
+    wordcloud = WordCloud(width=1600, height=800, background_color='white').generate_from_frequencies(frequencies)
     plt.figure(figsize=(15, 7))
     plt.imshow(wordcloud, interpolation='bilinear')
     plt.axis("off")
@@ -407,15 +418,8 @@ generate_wordcloud()
 # === Step 7: Keyword Overlap Matrix ===
 def plot_keyword_overlap():
     all_keywords = baseline_keywords + llm_keywords
-    keyword_ip_sets = {k: set(keyword_to_sites[k].keys()) for k in all_keywords}
-    matrix = []
-    for k1 in all_keywords:
-        row = []
-        for k2 in all_keywords:
-            overlap = len(keyword_ip_sets[k1] & keyword_ip_sets[k2])
-            row.append(overlap)
-        matrix.append(row)
-    df = pd.DataFrame(matrix, index=all_keywords, columns=all_keywords)
+    stats = keyword_overlap(keyword_to_sites, all_keywords)
+    df = stats["overlap"]
     plt.figure(figsize=(14, 12))
     sns.heatmap(df, annot=True, fmt="d", cmap="YlGnBu")
     plt.title("Keyword Overlap: Shared IPs Across Keywords")
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib_venn import venn2
-from censys.search import CensysHosts
 import math
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import cached_censys_hosts, iter_search_hosts, hit_name_or_ip
+
+# hand-off files (overridable, see scripts/run_pipeline.py)
+LLM_HOSTS_CSV = os.getenv('LLM_HOSTS_CSV', 'data/raw/llm_hosts.csv')
+OVERLAP_CSV = os.getenv('OVERLAP_CSV', 'manual_llm_overlap.csv')
+
 # 1. Load LLM‐generated hosts
-llm_df = pd.read_csv('data/raw/llm_hosts.csv', header=None, names=['host'])
+llm_df = pd.read_csv(LLM_HOSTS_CSV, header=None, names=['host'])
 llm_hosts = set(llm_df['host'].str.lower())
 
 # 2. Define manual keywords and build a full-text query
@@ -58,18 +66,19 @@ manual_query = f"({noprescription}) OR ({meds})"
 
 
 # 3. Fetch manual hosts from Censys
-api = CensysHosts()
+api = cached_censys_hosts()
 manual_hosts = set()
-for page in api.search(manual_query, per_page=100, pages=math.ceil(2000/100)):
-    page = page if isinstance(page, list) else [page]
-    for hit in page:
-        name = hit.get('name')
-        if name:
-            manual_hosts.add(name.lower())
-        else:
-            ip = hit.get('ip')
-            if ip:
-                manual_hosts.add(ip)
+# hits are distinct per virtual host (name), several names can share one ip
+for hit in iter_search_hosts(api, manual_query, per_page=100, pages=math.ceil(2000/100),
+                             spill=os.getenv('FIG4_SEARCH_SPILL', 'manual_hosts.ndjson.gz'),
+                             key=hit_name_or_ip):
+    name = hit.get('name')
+    if name:
+        manual_hosts.add(name.lower())
+    else:
+        ip = hit.get('ip')
+        if ip:
+            manual_hosts.add(ip)
 
 # 4. Compute overlap
 only_manual = manual_hosts - llm_hosts
@@ -107,5 +116,5 @@ for host in sorted(both):
     rows.append({'host': host, 'category': 'both'})
 
 result_df = pd.DataFrame(rows, columns=['host', 'category'])
-result_df.to_csv('manual_llm_overlap.csv', index=False)
-print(f"Saved {len(result_df)} records to manual_llm_overlap.csv (categories: only_manual, only_llm, both)")
\ No newline at end of file
+result_df.to_csv(OVERLAP_CSV, index=False)
+print(f"Saved {len(result_df)} records to {OVERLAP_CSV} (categories: only_manual, only_llm, both)")
\ No newline at end of file
@@ -6,36 +6,49 @@ classify_hosts.py
 2. Uses Censys Hosts API to fetch HTTP title and body snippet
 3. Uses OpenAI (v1.x) client.chat.completions.create to classify each as
    an illicit pharmacy
-4. Saves results to 'classified_hosts.csv'
+4. Saves results to 'classified_hosts2.csv' (per-host results are journaled
+   to 'classified_hosts2.jsonl' as they complete)
 5. Plots a bar chart of classification counts by original category
 """
-from bs4 import BeautifulSoup
-
-
 import os
-import math
+import sys
 import csv
-import json
 import pandas as pd
 import matplotlib.pyplot as plt
-from censys.search import CensysHosts
 from openai import OpenAI  # new import for v1.x SDK  [oai_citation:0‡Stack Overflow](https://stackoverflow.com/questions/77505030/openai-api-error-you-tried-to-access-openai-chatcompletion-but-this-is-no-lon?utm_source=chatgpt.com)
 from matplotlib_venn import venn2
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import cached_censys_hosts
+from utils.fig5_classify_utils import run_classification_pipeline, MockLLMClient
+from utils.replay_utils import llm_replay_from_env
+
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 #  Configuration
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 openai_api_key = os.getenv("OPENAI_API_KEY")
 CENSYS_API_ID  = os.getenv("CENSYS_API_ID")
 CENSYS_API_SECRET = os.getenv("CENSYS_API_SECRET")
+# hand-off files (overridable, see scripts/run_pipeline.py)
+OVERLAP_CSV = os.getenv("OVERLAP_CSV", "data/raw/manual_llm_overlap.csv")
+CLASSIFIED_CSV = os.getenv("CLASSIFIED_CSV", "classified_hosts2.csv")
 
 # Initialize the new client-based OpenAI SDK  [oai_citation:1‡Stack Overflow](https://stackoverflow.com/questions/77505030/openai-api-error-you-tried-to-access-openai-chatcompletion-but-this-is-no-lon?utm_source=chatgpt.com)
-client = OpenAI(api_key=openai_api_key)
+def make_llm_client():
+    if os.getenv("OPENAI_MOCK") == "1":
+        # deterministic local backend, no API calls
+        return MockLLMClient()
+    return OpenAI(api_key=openai_api_key)
+
+# OPENAI_REPLAY=archive.ndjson.gz records (OPENAI_REPLAY_MODE=record) or replays
+# completions offline, see utils/replay_utils.py; the client above is then only
+# built when recording
+client = llm_replay_from_env(make_llm_client) or make_llm_client()
 
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 #  1. Load candidate hosts
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
-df = pd.read_csv("data/raw/manual_llm_overlap.csv")  # expects columns: host,category
+df = pd.read_csv(OVERLAP_CSV)  # expects columns: host,category
 df["html_title"]   = ""
 df["body_snippet"] = ""
 df["is_pharmacy"]  = False
@@ -43,105 +56,40 @@ df["confidence"]   = 0.0
 df["reason"]       = ""
 
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
-#  2. Initialize Censys client
+#  2. Initialize Censys client (host records are cached locally, see utils/censys_utils.py)
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
-api = CensysHosts(api_id=CENSYS_API_ID, api_secret=CENSYS_API_SECRET)
-system_msg = {
-  "role": "system",
-  "content": (
-    "You are a JSON‑only API. ALL responses must be a single valid JSON object—"
-    "do not wrap it in markdown, code fences, or any additional text."
-  )
-}
+api = cached_censys_hosts(api_id=CENSYS_API_ID, api_secret=CENSYS_API_SECRET)
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 #  3. Fetch HTTP details and classify with OpenAI
+#     (staged pipeline, see utils/fig5_classify_utils.py)
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
-    # Determine starting position based on host match
-start_host = ''
-if start_host in df['host'].values:
-    start_pos = df.index[df['host'] == start_host][0]
-else:
-    start_pos = 0
-# Iterate from the matching host onward
-for idx in df.index[df.index >= start_pos]:
-    row = df.loc[idx]
-    host = row["host"]
-    try:
-        rec = api.view(host)
-    except Exception as e:
-        print(f"[Censys ERROR] {host}: {e}")
-        continue
-
-    # Extract HTTP title & snippet
-    title = ""
-    body  = ""
-    for svc in rec.get("services", []):
-        http = svc.get("http")
-        if http and http.get("response"):
-            resp = http["response"]
-            title = resp.get("html_title", "") or ""
-            body  = resp.get("body", "") or ""
-            break
-
-    df.at[idx, "html_title"]   = title
-    soup = BeautifulSoup(body, "html.parser")
-    text = soup.get_text(separator="\n", strip=True)
-    df.at[idx, "body_snippet"] = text[:3000]
-
-    # Build classification prompt
-    user_msg = {
-      "role": "user",
-      "content": (
-        "Classify this site as Illicit Online Pharmacy or not using exactly this JSON schema:\n"
-        "{\n"
-        '  "is_pharmacy": boolean,\n'
-        '  "confidence": number,\n'
-        '  "reason": string\n'
-        "}\n\n"
-        f"Host: {host}\nTitle: {title}\nSnippet: {text[:3000]}"
-      )
-    }
-    # Use the new client.chat.completions.create method  [oai_citation:2‡Stack Overflow](https://stackoverflow.com/questions/77505030/openai-api-error-you-tried-to-access-openai-chatcompletion-but-this-is-no-lon?utm_source=chatgpt.com)
-    try:
-        resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[system_msg, user_msg],
-        temperature=0.0,
-        max_tokens=150,
-        # Optionally enable JSON mode for supported models:
-        # response_format={"type":"json_object"},
-        logit_bias={123: 10},
-        )
-
-        content = resp.choices[0].message.content.strip()
-        print(f"[OpenAI RAW] {host}: {repr(content[:200])}")
-
-        try:
-            result = json.loads(content)
-        except json.JSONDecodeError:
-            print(f"[JSON PARSE ERROR] {host}: {repr(content)}")
-            result = {"is_pharmacy": False, "confidence": 0.0, "reason": "invalid JSON"}
-
-        df.at[idx, "is_pharmacy"] = result.get("is_pharmacy", False)
-        df.at[idx, "confidence"]  = result.get("confidence", 0.0)
-        df.at[idx, "reason"]      = result.get("reason", "")
-    except Exception as e:
-        print(f"[OpenAI ERROR] {host}: {e}")
-        # Save intermediate results after classifying this host
-        # df.to_csv("classified_hosts.csv", index=False)
-    # break
-    # Save intermediate results after each host, regardless of success or error
-    df.to_csv(
-        "classified_hosts2.csv",
-        index=False,
-        quoting=csv.QUOTE_ALL,
-        escapechar="\\"
-    )
+JOURNAL_FILE = os.path.splitext(CLASSIFIED_CSV)[0] + ".jsonl"
+records = run_classification_pipeline(
+    df["host"],
+    api,
+    client,
+    JOURNAL_FILE,
+    censys_rate=float(os.getenv("CENSYS_RATE", "1.0")),   # requests / second
+    llm_rate=float(os.getenv("OPENAI_RATE", "5.0")),      # requests / second
+    # pack several hosts per chat completion when a token budget is given
+    batch_token_budget=int(os.getenv("OPENAI_BATCH_TOKENS")) if os.getenv("OPENAI_BATCH_TOKENS") else None,
+)
+
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 #  4. Save results
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
-# df.to_csv("classified_hosts.csv", index=False)
-print("Saved classified_hosts.csv")
+results = pd.DataFrame(records).drop_duplicates("host", keep="last").set_index("host")
+for col in ["html_title", "body_snippet", "is_pharmacy", "confidence", "reason"]:
+    if col in results.columns:
+        df[col] = df["host"].map(results[col]).fillna(df[col])
+df["is_pharmacy"] = df["is_pharmacy"].astype(bool)
+df.to_csv(
+    CLASSIFIED_CSV,
+    index=False,
+    quoting=csv.QUOTE_ALL,
+    escapechar="\\"
+)
+print(f"Saved {CLASSIFIED_CSV}")
 
 # —––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––—
 #  5. Plot classification counts
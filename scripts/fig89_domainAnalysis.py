@@ -1,4 +1,4 @@
-from censys.search import CensysHosts
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -6,20 +6,47 @@ import json
 from collections import Counter
 import os
 from datetime import datetime
-from collections import defaultdict
 from wordcloud import WordCloud
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import cached_censys_hosts, flatten_host_records, iter_search_hosts
+from utils.keyword_utils import KeywordMatcher, WordFrequencyCounter
+
 # Your Censys API credentials
 API_ID = "xxxxx"
 API_SECRET = "xxxx"
 
+# Append-only archive of every search page (NDJSON, gzip-compressed)
+SEARCH_SPILL = os.getenv("FIG89_SEARCH_SPILL", "illicit_pharmacy_search.ndjson.gz")
+
+# Pharmacy-related keywords to look for
+MEDICATIONS = [
+    "viagra", "cialis", "levitra", "xanax", "valium", "ambien", "tramadol",
+    "adderall", "oxycontin", "vicodin", "percocet", "hydrocodone", "fentanyl"
+]
+NO_PRESCRIPTION_PHRASES = ["no prescription", "without prescription", "no rx"]
+
+# one automaton for all terms: each body is scanned once instead of once per term.
+# Bodies are canonicalized first, so v1agra / vi@gra / "No-Prescription" count too
+RX_MATCHER = KeywordMatcher(MEDICATIONS + NO_PRESCRIPTION_PHRASES, normalize=True)
+
+
+def match_body(body):
+    """
+    Returns (medications mentioned in body, whether it advertises no prescription)
+    """
+    found = RX_MATCHER.present(body)
+    meds = [med for med in MEDICATIONS if med in found]
+    no_prescription = any(phrase in found for phrase in NO_PRESCRIPTION_PHRASES)
+    return meds, no_prescription
+
 def search_illicit_pharmacies():
     """
     Use Censys Hosts API to identify potential illicit online pharmacies
     """
     try:
-        # Initialize Censys Hosts client with API credentials
-        h = CensysHosts()
+        # Initialize Censys Hosts client with API credentials (searches are cached locally)
+        h = cached_censys_hosts()
         
         # Search queries for identifying potential illicit pharmacies
         search_queries = [
@@ -30,41 +57,17 @@ def search_illicit_pharmacies():
             # "services.http.response.body: (viagra OR cialis OR tramadol) AND services.http.response.body: (buy OR order)"
         ]
         
-        all_results = []
-        
-        # Execute each search query
-        for idx, query in enumerate(search_queries):
-            print(f"Executing search query: {query}")
-            try:
-                # Get search results (paginated)
-                search_results = h.search(query, per_page=100, pages=1)
-                
-                # print(json.dumps(search_results))
-                # with open(f'query_{idx}.json', 'w') as f:
-                #     json.dump(list(search_results), f, ensure_ascii=False, indent=2)
-                    # json.dump(search_results, f)
-                # exit()
-                # Extract results
-                for page in search_results:
-                    # print(page)
-                    with open('data.json', 'w') as f:
-                       json.dump(page,f) 
-                    all_results.extend(page)
-                
-                print(f"Found {len(all_results)} potential results")
-            
-            except Exception as e:
-                print(f"Error executing query '{query}': {e}")
-        
-        # Deduplicate results based on IP
-        unique_ips = {}
-        for result in all_results:
-            ip = result.get("ip")
-            if ip and ip not in unique_ips:
-                unique_ips[ip] = result
-        
-        print(f"Found {len(unique_ips)} unique hosts")
-        return list(unique_ips.values())
+        # Hosts stream in page by page, deduplicated by IP as they arrive; every
+        # page is also appended to SEARCH_SPILL so partial runs are kept
+        unique_hosts = []
+        for host in iter_search_hosts(h, search_queries, per_page=100, pages=1, spill=SEARCH_SPILL):
+            if host.get("ip"):
+                unique_hosts.append(host)
+                if len(unique_hosts) % 100 == 0:
+                    print(f"Found {len(unique_hosts)} potential results")
+
+        print(f"Found {len(unique_hosts)} unique hosts")
+        return unique_hosts
     
     except Exception as e:
         print(f"Error initializing Censys client: {e}")
@@ -78,77 +81,39 @@ def analyze_search_results(results):
         print("No results to analyze.")
         return
     
-    # Extract relevant fields for analysis
-    ip_addresses = []
-    domains = []
-    countries = []
-    asn_names = []
-    http_titles = []
-    http_bodies = []
+    # Flatten the raw records into columnar tables in one pass
+    tables = flatten_host_records(results)
+    hosts = tables["hosts"]
+    services = tables["services"]
+    domains = tables["names"]["domain"]
     
-    # Pharmacy-related keywords to look for
-    medications = [
-        "viagra", "cialis", "levitra", "xanax", "valium", "ambien", "tramadol", 
-        "adderall", "oxycontin", "vicodin", "percocet", "hydrocodone", "fentanyl"
-    ]
-    
-    for result in results:
-        # Basic host information
-        ip_addresses.append(result.get("ip", ""))
-        countries.append(result.get("location", {}).get("country", "unknown"))
-        
-        # AS information
-        if "autonomous_system" in result:
-            asn_names.append(result["autonomous_system"].get("name", "unknown"))
-        else:
-            asn_names.append("unknown")
-        
-        # Extract domains if available
-        if "dns" in result and "names" in result["dns"]:
-            domains.extend(result["dns"]["names"])
-        
-        # Extract HTTP title and body content if available
-        http_services = result.get("services", [])
-        for service in http_services:
-            if service.get("service_name") == "HTTP":
-                if "http" in service and "response" in service["http"]:
-                    response = service["http"]["response"]
-                    if "html_title" in response:
-                        http_titles.append(response["html_title"].lower())
-                    if "body" in response:
-                        http_bodies.append(response["body"].lower())
+    # HTTP bodies (only services that actually returned one)
+    http_bodies = services.loc[services["is_http"] & services["has_body"], "body"]
     
     # Count medication mentions in HTTP bodies
     medication_mentions = Counter()
     no_prescription_count = 0
     
     for body in http_bodies:
-        # Check medication mentions
-        for med in medications:
-            if med in body:
-                medication_mentions[med] += 1
-        
-        # Check for no prescription mentions
-        if any(phrase in body for phrase in ["no prescription", "without prescription", "no rx"]):
+        # Check medication and no prescription mentions in one pass
+        meds, no_prescription = match_body(body)
+        medication_mentions.update(meds)
+        if no_prescription:
             no_prescription_count += 1
     
     # Create a DataFrame for further analysis
-    host_data = pd.DataFrame({
-        "ip": ip_addresses,
-        "country": countries,
-        "asn": asn_names
-    })
+    host_data = hosts[["ip", "country", "asn_name"]].rename(columns={"asn_name": "asn"})
     
     # Geographic distribution
-    country_counts = Counter(countries)
+    country_counts = hosts["country"].value_counts()
     print("\nTop countries hosting potential illicit pharmacies:")
-    for country, count in country_counts.most_common(10):
+    for country, count in country_counts.head(10).items():
         print(f"  {country}: {count}")
     
     # ASN distribution
-    asn_counts = Counter(asn_names)
+    asn_counts = hosts["asn_name"].value_counts()
     print("\nTop ASNs hosting potential illicit pharmacies:")
-    for asn, count in asn_counts.most_common(10):
+    for asn, count in asn_counts.head(10).items():
         print(f"  {asn}: {count}")
     
     # Medication analysis
@@ -158,7 +123,7 @@ def analyze_search_results(results):
     
     # No prescription mentions
     print(f"\nHosts explicitly mentioning 'no prescription required': {no_prescription_count}")
-    if http_bodies:
+    if len(http_bodies):
         print(f"Percentage: {no_prescription_count/len(http_bodies)*100:.1f}%")
     
     # Create output directory
@@ -169,7 +134,7 @@ def analyze_search_results(results):
     
     # Visualization 1: Country distribution
     plt.figure(figsize=(12, 8))
-    country_df = pd.DataFrame(country_counts.most_common(10), columns=["Country", "Count"])
+    country_df = country_counts.head(10).rename_axis("Country").reset_index(name="Count")
     sns.barplot(x="Count", y="Country", data=country_df)
     plt.title("Top 10 Countries Hosting Potential Illicit Pharmacies")
     plt.tight_layout()
@@ -177,7 +142,7 @@ def analyze_search_results(results):
     
     # Visualization 2: ASN distribution
     plt.figure(figsize=(12, 8))
-    asn_df = pd.DataFrame(asn_counts.most_common(10), columns=["ASN", "Count"])
+    asn_df = asn_counts.head(10).rename_axis("ASN").reset_index(name="Count")
     sns.barplot(x="Count", y="ASN", data=asn_df)
     plt.title("Top 10 ASNs Hosting Potential Illicit Pharmacies")
     plt.tight_layout()
@@ -199,13 +164,13 @@ def analyze_search_results(results):
     report = {
         "analysis_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "total_hosts_analyzed": len(results),
-        "unique_domains": len(set(domains)),
-        "top_countries": dict(country_counts.most_common(10)),
-        "top_asns": dict(asn_counts.most_common(10)),
+        "unique_domains": int(domains.nunique()),
+        "top_countries": {k: int(v) for k, v in country_counts.head(10).items()},
+        "top_asns": {k: int(v) for k, v in asn_counts.head(10).items()},
         "medication_mentions": dict(medication_mentions.most_common()),
         "no_prescription_mentions": {
             "count": no_prescription_count,
-            "percentage": f"{no_prescription_count/len(http_bodies)*100:.1f}%" if http_bodies else "N/A"
+            "percentage": f"{no_prescription_count/len(http_bodies)*100:.1f}%" if len(http_bodies) else "N/A"
         }
     }
     
@@ -221,97 +186,67 @@ def analyze_search_results2(results):
         print("No results to analyze.")
         return
 
-    # Data collections
-    ip_addresses = []
-    countries = []
-    asn_names = []
-    domains = []
-    tlds = []
-    reg_years = []
-    http_titles = []
-    http_bodies = []
-    port_usage = defaultdict(int)
-
-    medications = [
-        "viagra", "cialis", "levitra", "xanax", "valium", "ambien", "tramadol",
-        "adderall", "oxycontin", "vicodin", "percocet", "hydrocodone", "fentanyl"
-    ]
+    # Flatten the raw records into columnar tables in one pass
+    tables = flatten_host_records(results)
+    hosts = tables["hosts"]
+    services = tables["services"]
+    names = tables["names"]
+
+    # Bodies of HTTP services: one matcher pass each, streamed into the word counter
+    body_words = WordFrequencyCounter()
     medication_mentions = Counter()
     no_prescription_count = 0
+    http_bodies = services.loc[services["is_http"], "body"].fillna("")
+    for body in http_bodies:
+        body_words.update(body)
+        meds, no_prescription = match_body(body)
+        medication_mentions.update(meds)
+        if no_prescription:
+            no_prescription_count += 1
 
-    for result in results:
-        ip_addresses.append(result.get("ip", ""))
-        countries.append(result.get("location", {}).get("country", "unknown"))
-
-        asn_names.append(result.get("autonomous_system", {}).get("name", "unknown"))
-
-        for service in result.get("services", []):
-            port_usage[service.get("port", -1)] += 1
-
-            if service.get("service_name") == "HTTP" and "http" in service:
-                http = service["http"]
-                response = http.get("response", {})
-                title = response.get("html_title", "").lower()
-                body = response.get("body", "").lower()
-                http_titles.append(title)
-                http_bodies.append(body)
-
-                for med in medications:
-                    if med in body:
-                        medication_mentions[med] += 1
-
-                if any(phrase in body for phrase in ["no prescription", "without prescription", "no rx"]):
-                    no_prescription_count += 1
-
-        if "dns" in result:
-            names = result["dns"].get("names", [])
-            domains.extend(names)
-            for name in names:
-                if "." in name:
-                    tld = name.split(".")[-1]
-                    tlds.append(f".{tld}")
-
-        if "certificate" in result:
-            reg_date = result["certificate"].get("registered")
-            if reg_date and len(reg_date) >= 4:
-                reg_years.append(reg_date[:4])
+    # Aggregations as group-bys over the tables
+    country_counts = hosts["country"].value_counts()
+    asn_counts = hosts["asn_name"].value_counts()
+    tld_counts = names["tld"].value_counts()
+    year_counts = hosts["reg_year"].value_counts().sort_index()
+    port_usage = services.groupby("port").size()
 
     # Output directory
     output_dir = "illicit_pharmacy_analysis"
     os.makedirs(output_dir, exist_ok=True)
 
     # Save CSV of domains
-    domain_df = pd.DataFrame({"domain": list(set(domains)), "tld": tlds})
+    domain_df = names.drop_duplicates("domain")[["domain", "tld"]]
     domain_df.to_csv(f"{output_dir}/domain_data.csv", index=False)
 
     # Figures
 
     # 1. Country Distribution
     plt.figure(figsize=(10, 6))
-    pd.Series(countries).value_counts().head(10).plot(kind='barh')
+    country_counts.head(10).plot(kind='barh')
     plt.title("Top Hosting Countries")
     plt.tight_layout()
     plt.savefig(f"{output_dir}/top_countries.png")
 
     # 2. ASN Distribution
     plt.figure(figsize=(10, 6))
-    pd.Series(asn_names).value_counts().head(10).plot(kind='barh')
+    asn_counts.head(10).plot(kind='barh')
     plt.title("Top ASNs Hosting Illicit Pharmacies")
     plt.tight_layout()
     plt.savefig(f"{output_dir}/top_asns.png")
 
     # 3. TLD Distribution
-    if tlds:
+    if len(names) and tld_counts.sum():
         plt.figure(figsize=(10, 6))
-        pd.Series(tlds).value_counts().head(10).plot(kind='barh')
+        tld_counts.head(10).plot(kind='barh')
         plt.title("Top-level Domains (TLDs) Used")
         plt.tight_layout()
         plt.savefig(f"{output_dir}/top_tlds.png")
 
     # 4. Registration Year Histogram
-    if reg_years:
+    if year_counts.sum():
         plt.figure(figsize=(10, 6))
-        pd.Series(reg_years).value_counts().sort_index().plot(kind='bar')
+        year_counts[year_counts > 0].plot(kind='bar')
         plt.title("Domain Certificate Registration Years")
         plt.xlabel("Year")
         plt.tight_layout()
@@ -327,9 +262,9 @@ def analyze_search_results2(results):
 
     # 6. Port Distribution (Top 15 Ports)
     # 6. Port Distribution (Top 15 Ports)
-    if port_usage:
+    if len(port_usage):
         # Top 15 ports
-        port_series = pd.Series(port_usage).sort_values(ascending=False).head(15)
+        port_series = port_usage.sort_values(ascending=False).head(15)
 
         # 映射常见端口到服务名（你可以补充更多）
         port_map = {
@@ -372,9 +307,9 @@ def analyze_search_results2(results):
 
 
     # 7. Word Cloud from bodies
-    if http_bodies:
-        wc_text = " ".join(http_bodies)
-        wc = WordCloud(width=800, height=400, background_color="white").generate(wc_text)
+    body_frequencies = body_words.frequencies(max_words=200)
+    if body_frequencies:
+        wc = WordCloud(width=800, height=400, background_color="white").generate_from_frequencies(body_frequencies)
         plt.figure(figsize=(12, 6))
         plt.imshow(wc, interpolation="bilinear")
         plt.axis("off")
@@ -385,10 +320,10 @@ def analyze_search_results2(results):
     # Summary
     report = {
         "total_hosts": len(results),
-        "unique_domains": len(set(domains)),
-        "top_countries": dict(Counter(countries).most_common(10)),
-        "top_asns": dict(Counter(asn_names).most_common(10)),
-        "tlds": dict(Counter(tlds).most_common(10)),
+        "unique_domains": int(names["domain"].nunique()),
+        "top_countries": {k: int(v) for k, v in country_counts.head(10).items()},
+        "top_asns": {k: int(v) for k, v in asn_counts.head(10).items()},
+        "tlds": {k: int(v) for k, v in tld_counts.head(10).items() if v},
         "medications": dict(medication_mentions),
         # "no_prescription": {
         #     "count": no_prescription_count,
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+run_pipeline.py
+
+All figure scripts as one DAG. A stage only reruns when its code, its input
+files or its parameters changed; otherwise its outputs are reused (or
+restored) from .pipeline_cache. Independent stages run in parallel.
+
+  fig2_blocklists  notebooks/fig2_blocklist_analysis.ipynb  -> figures/fig2_blocklist_manual_llm.jpg
+  fig3_keywords    scripts/fig3_keyword_compare.py          -> keyword figures
+  fig4_overlap     scripts/fig4_censyscompare.py            -> manual_llm_overlap.csv
+  fig5_classify    scripts/fig5_determineIOP.py             -> classified_hosts2.csv (needs fig4_overlap)
+  fig89_domains    scripts/fig89_domainAnalysis.py          -> illicit_pharmacy_analysis/
+
+    python scripts/run_pipeline.py                      # everything out of date
+    python scripts/run_pipeline.py fig5_classify        # one figure and what it needs
+    python scripts/run_pipeline.py --dry-run
+    python scripts/run_pipeline.py fig3_keywords --force fig3_keywords --jobs 2
+
+Stage output goes to .pipeline_cache/logs/<stage>.log. Stages that query
+Censys / the LLM are keyed on the settings below, not on the live API, so
+use --force to refetch (or CENSYS_REPLAY / OPENAI_REPLAY archives, which are
+hashed as inputs). The Censys stages share one API quota and each rate
+limits itself, so they run one at a time.
+"""
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.pipeline_utils import Artifact, Pipeline, script_stage
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# environment read by the scripts / utils that changes what they produce (rates and
+# worker counts only change how fast, so they are left out)
+CENSYS_PARAMS = ("CENSYS_OFFLINE", "CENSYS_CACHE_MAX_AGE", "CENSYS_REPLAY")
+# stages calling the Censys API; their per-process rate limits only hold if they don't overlap
+CENSYS_QUOTA = ("censys",)
+FIG2_INPUTS = [
+    "censys_manual.json", "manual_llm_overlap.csv",
+    "blocklist_pharmacy_safe_ip.txt", "blocklist_pharmacy_safe2_ip.txt", "blocklist_pharmacy_list_fda_warnings_ip.txt",
+    "blocklist_firehol_level1.netset", "blocklist_de.ipset", "blocklist_net_ua.ipset",
+    "blocklist_botscout_30d.ipset", "blocklist_spamhaus_drop.netset", "whitelist_pharmacy_safe_ip.txt",
+    "blocklist_pharmacy_safe.txt", "blocklist_pharmacy_safe2.txt", "blocklist_pharmacy_list_fda_warnings.txt",
+    "whitelist_pharmacy_safe.txt",
+]
+
+
+def replay_inputs(*variables):
+    # recorded API archives are inputs like any data file
+    return [os.getenv(v) for v in variables if os.getenv(v)]
+
+
+def build_stages():
+    return [
+        script_stage(
+            "fig2_blocklists", "notebooks/fig2_blocklist_analysis.ipynb", ROOT,
+            inputs=[f"data/raw/fig2/{name}" for name in FIG2_INPUTS],
+            outputs=[Artifact("figures/fig2_blocklist_manual_llm.jpg")],
+        ),
+        script_stage(
+            "fig3_keywords", "scripts/fig3_keyword_compare.py", ROOT,
+            inputs=replay_inputs("CENSYS_REPLAY"),
+            outputs=[Artifact("llm_keyword_effectiveness2.pdf"), Artifact("website_wordcloud2.pdf"),
+                     Artifact("keyword_overlap_matrix2.png")],
+            params=CENSYS_PARAMS,
+            resources=CENSYS_QUOTA,
+        ),
+        script_stage(
+            "fig4_overlap", "scripts/fig4_censyscompare.py", ROOT,
+            inputs=["data/raw/fig4-5/llm_hosts.csv"] + replay_inputs("CENSYS_REPLAY"),
+            outputs=[Artifact("manual_llm_overlap.csv", columns=("host", "category"))],
+            env={"LLM_HOSTS_CSV": "data/raw/fig4-5/llm_hosts.csv", "OVERLAP_CSV": "manual_llm_overlap.csv"},
+            params=CENSYS_PARAMS,
+            resources=CENSYS_QUOTA,
+        ),
+        script_stage(
+            "fig5_classify", "scripts/fig5_determineIOP.py", ROOT,
+            inputs=["manual_llm_overlap.csv"] + replay_inputs("CENSYS_REPLAY", "OPENAI_REPLAY"),
+            outputs=[Artifact("classified_hosts2.csv", columns=("host", "category", "is_pharmacy", "confidence"))],
+            env={"OVERLAP_CSV": "manual_llm_overlap.csv", "CLASSIFIED_CSV": "classified_hosts2.csv"},
+            params=CENSYS_PARAMS + ("OPENAI_MOCK", "OPENAI_BATCH_TOKENS", "HTML_EXTRACTOR"),
+            resources=CENSYS_QUOTA,
+        ),
+        script_stage(
+            "fig89_domains", "scripts/fig89_domainAnalysis.py", ROOT,
+            inputs=replay_inputs("CENSYS_REPLAY"),
+            outputs=[Artifact("illicit_pharmacy_analysis", kind="dir")],
+            params=CENSYS_PARAMS,
+            resources=CENSYS_QUOTA,
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets', nargs='*', help='stages to bring up to date (default: all)')
+    parser.add_argument('--force', action='append', default=[], help='rerun this stage even if cached ("all" for every stage)')
+    parser.add_argument('--jobs', type=int, default=int(os.getenv("PIPELINE_JOBS", "4")))
+    parser.add_argument('--cache-dir', default=os.getenv("PIPELINE_CACHE", ".pipeline_cache"))
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    pipeline = Pipeline(build_stages(), root=ROOT, cache_dir=args.cache_dir, jobs=args.jobs)
+    if args.dry_run:
+        for name, status in pipeline.plan(args.targets, args.force).items():
+            deps = pipeline.deps[name]
+            print(f"  {name:<16} {status:<7}" + (f" (after {', '.join(deps)})" if deps else ""))
+        return
+
+    status = pipeline.run(args.targets, args.force)
+    failed = [name for name, s in status.items() if s in ('failed', 'blocked')]
+    if failed:
+        sys.exit(f"{len(failed)} stage(s) did not complete: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
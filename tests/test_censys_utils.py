@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import CachedCensysHosts, KeywordQueryEngine, hit_name_or_ip, iter_search_hosts, read_spill
+
+
+###################### SEARCH CACHE ######################
+
+class FakeCensysHosts:
+    # pages of `per_page` hits up to `n_hits` per query, counting page requests
+    def __init__(self, n_hits):
+        self.n_hits = n_hits
+        self.calls = 0
+
+    def search(self, query, per_page=100, max_records=None, **kwargs):
+        limit = min(self.n_hits, max_records) if max_records is not None else self.n_hits
+        for start in range(0, limit, per_page):
+            self.calls += 1
+            yield [{"ip": f"10.0.{start // 256}.{start % 256 + i}",
+                    "services": [{"service_name": "HTTP",
+                                  "http": {"response": {"html_title": query, "body": "cheap pills"}}}]}
+                   for i in range(min(per_page, limit - start))]
+
+
+def run_keywords(api, db_path, keywords, offline=False, max_results=100, per_page=10, rate=None):
+    cache = CachedCensysHosts(api=api, db_path=db_path, offline=offline)
+    engine = KeywordQueryEngine(cache, rate=rate, workers=2, max_results=max_results, per_page=per_page)
+    try:
+        return {kw: engine.keyword_ips(kw) for kw in engine.run(keywords)}
+    finally:
+        cache.close()
+
+
+def test_short_page_search_is_cached(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite")
+    api = FakeCensysHosts(n_hits=25)
+    first = run_keywords(api, db_path, ["viagra", "xanax"])
+    assert api.calls == 6 and all(len(ips) == 25 for ips in first.values())
+
+    rerun = FakeCensysHosts(n_hits=25)
+    assert run_keywords(rerun, db_path, ["viagra", "xanax"]) == first
+    assert rerun.calls == 0
+    assert run_keywords(None, db_path, ["viagra", "xanax"], offline=True) == first
+
+
+def test_max_results_search_is_cached(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite")
+    api = FakeCensysHosts(n_hits=500)
+    first = run_keywords(api, db_path, ["tramadol"], max_results=30)
+    assert api.calls == 3 and len(first["tramadol"]) == 30
+
+    rerun = FakeCensysHosts(n_hits=500)
+    assert run_keywords(rerun, db_path, ["tramadol"], max_results=30) == first
+    assert rerun.calls == 0
+
+
+def test_abandoned_search_is_not_cached(tmp_path):
+    # a caller that stops after a full page has not seen the whole result set
+    db_path = str(tmp_path / "cache.sqlite")
+    cache = CachedCensysHosts(api=FakeCensysHosts(n_hits=50), db_path=db_path)
+    pages = cache.search("q", per_page=10)
+    next(pages)
+    pages.close()
+    assert not cache.has_search("q", per_page=10)
+    cache.close()
+
+
+def test_cached_pages_take_no_rate_token(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite")
+    first = run_keywords(FakeCensysHosts(n_hits=55), db_path, ["viagra", "xanax"])
+
+    # 12 cached pages at 2 requests / second would wait ~5 s if they were throttled
+    start = time.monotonic()
+    assert run_keywords(FakeCensysHosts(n_hits=55), db_path, ["viagra", "xanax"], rate=2.0) == first
+    assert time.monotonic() - start < 1.0
+
+    cache = CachedCensysHosts(api=FakeCensysHosts(n_hits=55), db_path=db_path)
+    assert cache.has_search('services.http.response.body: "viagra"', per_page=10, max_records=100)
+    assert not cache.has_search('services.http.response.body: "cialis"', per_page=10, max_records=100)
+    cache.close()
+
+
+###################### SEARCH HOST STREAM ######################
+
+class FakeVirtualHostSearch:
+    # web-property hits: several names on one ip, one name-less hit per ip
+    def search(self, query, per_page=100, pages=1):
+        yield [{"ip": "192.0.2.1", "name": "rx-shop.example"},
+               {"ip": "192.0.2.1", "name": "cheap-meds.example"},
+               {"ip": "192.0.2.1"}]
+        yield [{"ip": "192.0.2.1", "name": "RX-SHOP.example"},
+               {"ip": "192.0.2.2"},
+               {"name": "no-ip.example"}]
+
+
+def test_iter_search_hosts_dedup_key(tmp_path):
+    api = FakeVirtualHostSearch()
+    by_ip = list(iter_search_hosts(api, "q"))
+    assert [(h.get("ip"), h.get("name")) for h in by_ip] == \
+        [("192.0.2.1", "rx-shop.example"), ("192.0.2.2", None), (None, "no-ip.example")]
+
+    spill = str(tmp_path / "spill.ndjson.gz")
+    by_name = list(iter_search_hosts(api, ["q", "q2"], spill=spill, key=hit_name_or_ip))
+    assert [hit_name_or_ip(h) for h in by_name] == \
+        ["rx-shop.example", "cheap-meds.example", "192.0.2.1", "192.0.2.2", "no-ip.example"]
+    # the spill keeps every hit of every page
+    assert len(list(read_spill(spill))) == 12
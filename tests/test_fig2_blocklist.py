@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import random
+import socket
+import struct
+import asyncio
+import ipaddress
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import fig2_blocklist_utils
+from utils.fig2_blocklist_utils import (DNS_TYPE_A, DNS_TYPE_AAAA, AsyncResolver, BlocklistIndex, DNSCache,
+                                        DomainMatcher, load_public_suffix_list, merge_range_arrays, merge_ranges,
+                                        parse_blocklist)
+
+
+###################### IP RANGE INDEX ######################
+
+ENTRIES = [
+    "10.0.0.0/24", "10.0.0.128/25",          # nested
+    "10.0.1.0/24", "10.0.2.0/23",            # adjacent: one interval 10.0.0.0-10.0.3.255
+    "192.168.1.0/30", "192.168.1.2/31",      # overlapping
+    "192.168.1.8/32", "192.168.1.9",         # /32 and a plain address, adjacent
+    "172.16.0.5-172.16.0.20",
+    "2001:db8::/126", "2001:db8::4/127",     # adjacent ipv6
+    "bogus",
+]
+
+
+def brute_force_contains(entries, ip):
+    address = ipaddress.ip_address(ip)
+    for entry in entries:
+        if '-' in entry:
+            first, last = (ipaddress.ip_address(part) for part in entry.split('-'))
+            if first.version == address.version and first <= address <= last:
+                return True
+            continue
+        try:
+            net = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            continue
+        if net.version == address.version and address in net:
+            return True
+    return False
+
+
+def boundary_candidates(entries):
+    # every range edge and its neighbours, where an off-by-one would show
+    candidates = set()
+    for entry in entries:
+        try:
+            if '-' in entry:
+                first, last = (ipaddress.ip_address(part) for part in entry.split('-'))
+            else:
+                net = ipaddress.ip_network(entry, strict=False)
+                first, last = net.network_address, net.broadcast_address
+        except ValueError:
+            continue
+        top = (1 << first.max_prefixlen) - 1
+        for value in (int(first) - 1, int(first), int(first) + 1, int(last) - 1, int(last), int(last) + 1):
+            if 0 <= value <= top:
+                candidates.add(str(ipaddress.ip_address(value) if first.version == 4
+                                   else ipaddress.IPv6Address(value)))
+    return sorted(candidates)
+
+
+def test_index_matches_ipaddress_at_boundaries():
+    candidates = boundary_candidates(ENTRIES) + ["0.0.0.0", "255.255.255.255", "::", "garbage"]
+    index = BlocklistIndex(ENTRIES)
+    feed_index = parse_blocklist("\n".join(ENTRIES), fmt="netset").to_index()
+    expected = [ip != "garbage" and brute_force_contains(ENTRIES, ip) for ip in candidates]
+    assert list(index.contains(candidates)) == expected
+    assert list(feed_index.contains(candidates)) == expected
+    assert index.n_invalid == 1 and len(index) == len(ENTRIES) - 1
+
+
+def test_adjacent_and_overlapping_ranges_merge():
+    index = BlocklistIndex(ENTRIES)
+    assert [str(ipaddress.IPv4Address(int(s))) for s in index.starts4] == \
+        ["10.0.0.0", "172.16.0.5", "192.168.1.0", "192.168.1.8"]
+    assert int(index.ends4[0]) == int(ipaddress.IPv4Address("10.0.3.255"))
+    assert len(index.starts6) == 1 and index.ends6[0] - index.starts6[0] == 5
+    assert index.num_addresses() == 1024 + 16 + 4 + 2 + 6
+
+
+def test_slash_zero_covers_everything():
+    index = BlocklistIndex(["0.0.0.0/0", "1.2.3.4/32"])
+    assert len(index.starts4) == 1 and int(index.ends4[0]) == 2 ** 32 - 1
+    assert list(index.contains(["0.0.0.0", "255.255.255.255", "8.8.8.8", "::1"])) == [True, True, True, False]
+
+
+def test_merge_range_arrays_matches_merge_ranges():
+    rng = random.Random(0)
+    for _ in range(200):
+        ranges = []
+        for _ in range(rng.randint(1, 40)):
+            start = rng.randint(0, 300)
+            ranges.append((start, start + rng.randint(0, 20)))
+        starts, ends = merge_range_arrays(np.array([r[0] for r in ranges], dtype=np.uint64),
+                                          np.array([r[1] for r in ranges], dtype=np.uint64))
+        assert [[int(s), int(e)] for s, e in zip(starts, ends)] == merge_ranges(ranges)
+    starts, ends = merge_range_arrays(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64))
+    assert len(starts) == 0 and len(ends) == 0
+
+
+def test_random_candidates_match_ipaddress():
+    rng = random.Random(1)
+    entries = [f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.0/{rng.randint(20, 32)}" for _ in range(50)]
+    candidates = [f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}" for _ in range(2000)]
+    index = BlocklistIndex(entries)
+    assert list(index.contains(candidates)) == [brute_force_contains(entries, ip) for ip in candidates]
+
+
+###################### ASYNC DNS RESOLUTION ######################
+
+class StubDNSServer(asyncio.DatagramProtocol):
+    """
+    Local UDP resolver answering by name:
+      a.test     A 192.0.2.1 (ttl 120) and AAAA 2001:db8::1 (ttl 60)
+      nx.test    NXDOMAIN
+      retry.test drops the first query of each type, then answers like a.test
+      bad.test   malformed replies first (truncated, garbage), then answers
+      junk.test  only ever truncated replies
+      dead.test  never answers
+    """
+
+    def __init__(self):
+        self.queries = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        qid, = struct.unpack('>H', data[:2])
+        pos = 12
+        labels = []
+        while data[pos]:
+            labels.append(data[pos + 1:pos + 1 + data[pos]].decode())
+            pos += data[pos] + 1
+        name = '.'.join(labels)
+        qtype, = struct.unpack('>H', data[pos + 1:pos + 3])
+        question = data[12:pos + 5]
+        n = self.queries[name, qtype] = self.queries.get((name, qtype), 0) + 1
+
+        if name == 'dead.test' or (name == 'retry.test' and n == 1):
+            return
+        if name == 'junk.test' or (name == 'bad.test' and n == 1):
+            # header claims an answer the message does not contain
+            reply = struct.pack('>HHHHHH', qid, 0x8180, 1, 1, 0, 0) + question + b'\xc0\x0c\x00'
+        elif name == 'bad.test' and n == 2:
+            reply = struct.pack('>H', qid) + b'\xff'
+        elif name == 'nx.test':
+            reply = struct.pack('>HHHHHH', qid, 0x8183, 1, 0, 0, 0) + question
+        else:
+            if qtype == DNS_TYPE_A:
+                rdata, ttl = socket.inet_pton(socket.AF_INET, '192.0.2.1'), 120
+            else:
+                rdata, ttl = socket.inet_pton(socket.AF_INET6, '2001:db8::1'), 60
+            answer = b'\xc0\x0c' + struct.pack('>HHIH', qtype, 1, ttl, len(rdata)) + rdata
+            reply = struct.pack('>HHHHHH', qid, 0x8180, 1, 1, 0, 0) + question + answer
+        self.transport.sendto(reply, addr)
+
+
+def resolve_with_stub(domains, cache, retries=2):
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, server = await loop.create_datagram_endpoint(StubDNSServer, local_addr=('127.0.0.1', 0))
+        try:
+            resolver = AsyncResolver('127.0.0.1', transport.get_extra_info('sockname')[1],
+                                     timeout=0.2, retries=retries, cache=cache)
+            return await resolver.resolve_many(domains), server.queries
+        finally:
+            transport.close()
+    return asyncio.run(run())
+
+
+def test_resolver_answers_and_nxdomain():
+    cache = DNSCache(min_ttl=0)
+    resolved, queries = resolve_with_stub(['a.test', 'nx.test'], cache)
+    assert resolved == {'a.test': ['192.0.2.1', '2001:db8::1'], 'nx.test': []}
+    # the entry lives as long as the smallest record ttl; NXDOMAIN is cached negatively
+    assert 59 < cache.entries['a.test']['expires'] - time.time() <= 60
+    assert cache.entries['nx.test']['ips'] == []
+    assert queries[('a.test', DNS_TYPE_A)] == 1 and queries[('a.test', DNS_TYPE_AAAA)] == 1
+
+
+def test_resolver_retries_timeouts_and_malformed_replies():
+    cache = DNSCache()
+    resolved, queries = resolve_with_stub(['retry.test', 'bad.test', 'junk.test', 'dead.test'], cache)
+    assert resolved['retry.test'] == ['192.0.2.1', '2001:db8::1']
+    assert resolved['bad.test'] == ['192.0.2.1', '2001:db8::1']
+    assert queries[('retry.test', DNS_TYPE_A)] == 2 and queries[('bad.test', DNS_TYPE_A)] == 3
+    # every attempt failed: no answer and nothing cached, so the next run asks again
+    assert resolved['junk.test'] == [] and resolved['dead.test'] == []
+    assert queries[('dead.test', DNS_TYPE_A)] == 3
+    assert 'junk.test' not in cache.entries and 'dead.test' not in cache.entries
+
+
+def test_resolver_cache_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fig2_blocklist_utils.time, 'time', lambda: now[0])
+    cache = DNSCache(min_ttl=0)
+    resolve_with_stub(['a.test'], cache)
+    assert cache.get('a.test') == ['192.0.2.1', '2001:db8::1']
+
+    now[0] += 59
+    resolved, queries = resolve_with_stub(['a.test'], cache)
+    assert resolved['a.test'] == ['192.0.2.1', '2001:db8::1'] and queries == {}
+
+    now[0] += 2
+    assert cache.get('a.test') is None
+    resolved, queries = resolve_with_stub(['a.test'], cache)
+    assert queries[('a.test', DNS_TYPE_A)] == 1
+
+
+def test_dns_cache_persists_live_entries(tmp_path):
+    path = str(tmp_path / "dns.json")
+    cache = DNSCache(path, min_ttl=0)
+    cache.put('live.test', ['192.0.2.1'], 300)
+    cache.put('stale.test', ['192.0.2.2'], -1)
+    cache.save()
+    assert DNSCache(path).entries.keys() == {'live.test'}
+
+
+###################### DOMAIN SUFFIX MATCHING ######################
+
+LISTED_DOMAINS = ["rx-meds.com", "https://WWW.Cheap-Pills.co.uk/shop", "shop.pharma.net", "evil.blogspot.com",
+                  "co.uk", "com", "192.0.2.1", "not a domain"]
+
+
+def test_exact_and_subdomain_matches():
+    matcher = DomainMatcher(LISTED_DOMAINS)
+    assert len(matcher) == 4 and matcher.n_invalid == 4
+    assert matcher.match("RX-MEDS.com.") == ("exact", "rx-meds.com")
+    assert matcher.match("http://a.b.rx-meds.com:8080/x") == ("subdomain", "rx-meds.com")
+    assert matcher.match("www.cheap-pills.co.uk") == ("exact", "www.cheap-pills.co.uk")
+    assert matcher.match("img.www.cheap-pills.co.uk") == ("subdomain", "www.cheap-pills.co.uk")
+    # neither a listed domain nor a child of one
+    for name in ["meds.com", "xrx-meds.com", "pharma.net", "other.co.uk", "cheap-pills.co.uk", "192.0.2.1"]:
+        assert matcher.match(name) is None, name
+
+
+def test_registrable_is_opt_in_with_the_builtin_suffixes():
+    # the built-in list lacks blogspot.com, so its registrable domain would be wrong
+    matcher = DomainMatcher(LISTED_DOMAINS)
+    assert not matcher.match_registrable
+    assert matcher.match("good.blogspot.com") is None
+    assert matcher.match("cheap-pills.co.uk") is None
+
+    opted_in = DomainMatcher(LISTED_DOMAINS, registrable=True)
+    assert opted_in.match("cheap-pills.co.uk") == ("registrable", "www.cheap-pills.co.uk")
+    assert opted_in.match("deals.pharma.net") == ("registrable", "shop.pharma.net")
+    assert opted_in.match("good.blogspot.com") == ("registrable", "evil.blogspot.com")
+
+
+def test_registrable_with_a_full_suffix_list(tmp_path):
+    path = tmp_path / "public_suffix_list.dat"
+    path.write_text("// ===BEGIN ICANN DOMAINS===\ncom\nnet\nuk\nco.uk\n*.ck\n!www.ck\n"
+                    "// ===BEGIN PRIVATE DOMAINS===\nblogspot.com\n", encoding="utf-8")
+    psl = load_public_suffix_list(str(path))
+    assert psl.complete
+    assert psl.registrable_domain("a.b.evil.blogspot.com") == "evil.blogspot.com"
+    assert psl.registrable_domain("shop.foo.ck") == "shop.foo.ck" and psl.registrable_domain("a.www.ck") == "www.ck"
+    assert psl.is_public_suffix("foo.ck") and not psl.is_public_suffix("www.ck")
+
+    matcher = DomainMatcher(LISTED_DOMAINS + ["blogspot.com"], psl)
+    assert matcher.match_registrable and matcher.n_invalid == 5
+    assert matcher.match("good.blogspot.com") is None
+    assert matcher.match("cdn.cheap-pills.co.uk") == ("registrable", "www.cheap-pills.co.uk")
+    assert DomainMatcher(LISTED_DOMAINS, psl, registrable=False).match("cdn.cheap-pills.co.uk") is None
+
+
+def test_match_hosts_prefers_the_closest_kind():
+    matcher = DomainMatcher(LISTED_DOMAINS, registrable=True)
+    hosts = [("192.0.2.10", ["deals.pharma.net", "a.shop.pharma.net", "shop.pharma.net"]),
+             ("192.0.2.11", ["cheap-pills.co.uk", "cdn.www.cheap-pills.co.uk"]),
+             ("192.0.2.12", ["unrelated.org"]),
+             ("192.0.2.13", None)]
+    assert matcher.match_hosts(hosts) == {
+        "192.0.2.10": ("exact", "shop.pharma.net", "shop.pharma.net"),
+        "192.0.2.11": ("subdomain", "www.cheap-pills.co.uk", "cdn.www.cheap-pills.co.uk"),
+    }
+    assert matcher.match_hosts(hosts, kinds=("registrable",)) == {
+        "192.0.2.10": ("registrable", "shop.pharma.net", "deals.pharma.net"),
+        "192.0.2.11": ("registrable", "www.cheap-pills.co.uk", "cheap-pills.co.uk"),
+    }
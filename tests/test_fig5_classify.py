@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import TokenBucket
+from utils import fig5_classify_utils
+from utils.fig5_classify_utils import (STATUS_CLASSIFIED, STATUS_FAILED, STATUS_FETCHED, ContentDeduper,
+                                       MockLLMClient, classify_batch, classify_host, read_journal,
+                                       run_classification_pipeline, simhash)
+
+
+###################### FAKE BACKENDS ######################
+
+def pharmacy_page(i):
+    return f"Rx Shop {i}", f"<p>Buy viagra and xanax pills without prescription, order {'x' * i}</p>"
+
+
+def blog_page(i):
+    return f"Garden blog {i}", f"<p>Tomatoes and roses, week {'y' * i}</p>"
+
+
+class FakeCensysHosts:
+    # CensysHosts.view over host -> (title, body); hosts in `down` always raise
+    def __init__(self, pages, down=()):
+        self.pages = pages
+        self.down = set(down)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def view(self, host):
+        with self.lock:
+            self.calls.append((host, time.monotonic()))
+        if host in self.down:
+            raise ConnectionError(f"{host} unreachable")
+        title, body = self.pages[host]
+        return {"ip": host, "services": [{"service_name": "HTTP",
+                                          "http": {"response": {"html_title": title, "body": body}}}]}
+
+
+class RecordingLLMClient(MockLLMClient):
+    # MockLLMClient that remembers the hosts it was asked about and fails for `broken` ones
+    def __init__(self, known, broken=(), **kwargs):
+        super().__init__(**kwargs)
+        self.known = list(known)
+        self.broken = set(broken)
+        self.hosts = []
+
+    def create(self, model=None, messages=None, **kwargs):
+        content = messages[-1]["content"]
+        asked = [h for h in self.known if f'"host": "{h}"' in content or f"Host: {h}\n" in content]
+        with self.lock:
+            self.hosts.extend(asked)
+        if self.broken.intersection(asked):
+            raise RuntimeError("500 Internal Server Error")
+        return super().create(model=model, messages=messages, **kwargs)
+
+
+def make_backends(n_pharmacies=6, n_blogs=4, down=(), broken=(), **client_kwargs):
+    pages = {}
+    for i in range(n_pharmacies):
+        pages[f"10.0.0.{i}"] = pharmacy_page(i)
+    for i in range(n_blogs):
+        pages[f"10.0.1.{i}"] = blog_page(i)
+    client = RecordingLLMClient(list(pages) + list(down), broken, **client_kwargs)
+    return pages, FakeCensysHosts(pages, down), client
+
+
+def run(hosts, api, client, journal, **kwargs):
+    options = dict(censys_rate=None, llm_rate=None, retries=1, backoff=0.0)
+    options.update(kwargs)
+    return {rec["host"]: rec for rec in run_classification_pipeline(hosts, api, client, journal, **options)}
+
+
+###################### PIPELINE ######################
+
+def test_pipeline_classifies_every_host_once(tmp_path):
+    pages, api, client = make_backends()
+    hosts = list(pages) + list(pages)[:3]
+    journal = str(tmp_path / "journal.jsonl")
+    results = run(hosts, api, client, journal)
+
+    assert set(results) == set(pages)
+    assert all(rec["status"] == STATUS_CLASSIFIED for rec in results.values())
+    assert [results[h]["is_pharmacy"] for h in pages] == [h.startswith("10.0.0.") for h in pages]
+    assert sorted(h for h, _ in api.calls) == sorted(pages)
+    # per host: fetched is journaled before classified, and each verdict exactly once
+    events = {}
+    for rec in read_journal(journal):
+        events.setdefault(rec["host"], []).append(rec["status"])
+    assert all(statuses == [STATUS_FETCHED, STATUS_CLASSIFIED] for statuses in events.values())
+
+
+def test_pipeline_isolates_errors(tmp_path):
+    pages, api, client = make_backends(down=["10.9.9.9"], broken=["10.0.0.2"])
+    results = run(list(pages) + ["10.9.9.9"], api, client, str(tmp_path / "journal.jsonl"))
+
+    assert results["10.9.9.9"]["status"] == STATUS_FAILED and results["10.9.9.9"]["stage"] == "fetch"
+    assert "unreachable" in results["10.9.9.9"]["error"]
+    assert results["10.0.0.2"]["status"] == STATUS_FAILED and results["10.0.0.2"]["stage"] == "classify"
+    assert all(rec["status"] == STATUS_CLASSIFIED for h, rec in results.items() if h not in ("10.9.9.9", "10.0.0.2"))
+    # retries=1: every failing call was made twice
+    assert [h for h, _ in api.calls].count("10.9.9.9") == 2 and client.hosts.count("10.0.0.2") == 2
+
+
+def test_pipeline_respects_censys_rate(tmp_path):
+    pages, api, client = make_backends(n_pharmacies=10, n_blogs=0)
+    start = time.monotonic()
+    run(list(pages), api, client, str(tmp_path / "journal.jsonl"), censys_rate=5.0, fetch_workers=8)
+    # a full bucket (5 tokens) goes at once, the other 5 fetches wait 1 / rate each
+    assert time.monotonic() - start >= 0.9
+    times = sorted(t for _, t in api.calls)
+    assert times[-1] - times[5] >= 0.7
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(20.0, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert 0.45 <= time.monotonic() - start < 1.0
+
+    unlimited = TokenBucket(None)
+    start = time.monotonic()
+    for _ in range(10000):
+        unlimited.acquire()
+    assert time.monotonic() - start < 0.5
+
+
+###################### RESUME ######################
+
+def test_restart_resumes_from_journal(tmp_path):
+    pages, api, client = make_backends(down=["10.9.9.9"], broken=["10.0.1.0"])
+    journal = str(tmp_path / "journal.jsonl")
+    run(list(pages) + ["10.9.9.9"], api, client, journal)
+
+    # cut the journal to what a run killed partway leaves behind: some hosts
+    # classified, some only fetched, two failed, the rest not reached and a
+    # half-written last line
+    done = {"10.0.0.0", "10.0.0.1", "10.0.1.1"}
+    fetched = {"10.0.0.2", "10.0.0.3"}
+    failed = {"10.9.9.9", "10.0.1.0"}
+    kept = [rec for rec in read_journal(journal)
+            if rec["host"] in done | failed or (rec["host"] in fetched and rec["status"] == STATUS_FETCHED)]
+    with open(journal, "w") as f:
+        f.writelines(json.dumps(rec) + "\n" for rec in kept)
+        f.write('{"host": "10.0.0.4", "sta')
+
+    pages["10.9.9.9"] = pharmacy_page(9)
+    api = FakeCensysHosts(pages)
+    client = RecordingLLMClient(pages)
+    results = run(list(pages), api, client, journal)
+
+    untouched = set(pages) - done - fetched - failed
+    assert {h for h, _ in api.calls} == untouched | {"10.9.9.9"}
+    assert sorted(client.hosts) == sorted(untouched | fetched | failed)
+    assert all(rec["status"] == STATUS_CLASSIFIED for rec in results.values()) and set(results) == set(pages)
+    assert results["10.9.9.9"]["is_pharmacy"] and not results["10.0.1.0"]["is_pharmacy"]
+
+
+###################### BATCHES ######################
+
+class BadBatchClient(RecordingLLMClient):
+    # answers single-site prompts, but batch answers are broken JSON or
+    # carry an invalid item for `invalid` hosts
+    def __init__(self, known, invalid=(), broken_json=True):
+        super().__init__(known)
+        self.invalid = set(invalid)
+        self.broken_json = broken_json
+        self.batch_sizes = []
+
+    def create(self, model=None, messages=None, **kwargs):
+        response = super().create(model=model, messages=messages, **kwargs)
+        if "\nSites:\n" not in messages[-1]["content"]:
+            return response
+        with self.lock:
+            self.batch_sizes.append(len(json.loads(messages[-1]["content"].split("\nSites:\n", 1)[1])))
+        if self.broken_json:
+            response.choices[0].message.content = '{"results": [{"host": '
+        else:
+            items = json.loads(response.choices[0].message.content)["results"]
+            for item in items:
+                if item["host"] in self.invalid:
+                    item["confidence"] = "high"
+            response.choices[0].message.content = json.dumps({"results": items})
+        return response
+
+
+def test_mock_client_is_deterministic():
+    pages, _, _ = make_backends()
+    recs = [{"host": h, "html_title": t, "body_snippet": b} for h, (t, b) in pages.items()]
+    client = MockLLMClient()
+    single = {r["host"]: classify_host(client, r["host"], r["html_title"], r["body_snippet"]) for r in recs}
+    batch = classify_batch(client, recs)
+    assert batch == classify_batch(MockLLMClient(), recs)
+    assert set(batch) == set(pages) and client.calls == len(recs) + 1
+    assert all(batch[h]["is_pharmacy"] == single[h]["is_pharmacy"] == h.startswith("10.0.0.") for h in pages)
+    # drop_every=3 leaves every third site out of a batch answer
+    assert list(classify_batch(MockLLMClient(drop_every=3), recs)) == [r["host"] for i, r in enumerate(recs)
+                                                                       if (i + 1) % 3]
+
+
+def test_batches_requeue_only_missing_sites(tmp_path):
+    pages, api, client = make_backends(n_pharmacies=8, n_blogs=4, drop_every=3)
+    results = run(list(pages), api, client, str(tmp_path / "journal.jsonl"), retries=3,
+                  batch_token_budget=100000, max_batch=12)
+    assert all(rec["status"] == STATUS_CLASSIFIED for rec in results.values()) and set(results) == set(pages)
+    assert [results[h]["is_pharmacy"] for h in pages] == [h.startswith("10.0.0.") for h in pages]
+    # 12 sites, 4 dropped; 4 re-queued, 1 dropped; 1 re-queued and answered
+    assert client.calls == 3 and len(client.hosts) == 12 + 4 + 1
+
+
+def test_invalid_batch_items_are_requeued(tmp_path):
+    pages, api, _ = make_backends()
+    client = BadBatchClient(pages, invalid=["10.0.0.1"], broken_json=False)
+    results = run(list(pages), api, client, str(tmp_path / "journal.jsonl"), retries=2,
+                  batch_token_budget=100000)
+    # the invalid item is asked again in batches of one, then on its own
+    assert client.batch_sizes == [len(pages), 1, 1]
+    assert client.hosts.count("10.0.0.1") == 4
+    assert results["10.0.0.1"]["status"] == STATUS_CLASSIFIED and results["10.0.0.1"]["is_pharmacy"]
+
+
+def test_bad_batch_response_falls_back_to_single_sites(tmp_path):
+    pages, api, _ = make_backends()
+    client = BadBatchClient(pages)
+    results = run(list(pages), api, client, str(tmp_path / "journal.jsonl"), retries=1,
+                  batch_token_budget=100000)
+    assert client.batch_sizes == [len(pages), len(pages)]
+    assert client.calls == 2 + len(pages)
+    assert all(rec["status"] == STATUS_CLASSIFIED for rec in results.values()) and set(results) == set(pages)
+    assert [results[h]["is_pharmacy"] for h in pages] == [h.startswith("10.0.0.") for h in pages]
+
+
+###################### DEDUPLICATION ######################
+
+BASE_FINGERPRINT = 0x0123456789ABCDEF
+
+
+def flip(fingerprint, *bits):
+    for bit in bits:
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def site(host, text):
+    return {"host": host, "html_title": "", "body_snippet": text}
+
+
+def test_simhash_threshold(monkeypatch):
+    # fingerprints chosen by hand: within max_distance bits joins the group, one more does not,
+    # including differences spread over every band
+    fingerprints = {
+        "base": BASE_FINGERPRINT,
+        "three bits": flip(BASE_FINGERPRINT, 0, 1, 2),
+        "spread": flip(BASE_FINGERPRINT, 3, 20, 60),
+        "four bits": flip(BASE_FINGERPRINT, 5, 21, 37, 53),
+    }
+    monkeypatch.setattr(fig5_classify_utils, "simhash", lambda text: fingerprints[text])
+    deduper = ContentDeduper(near_duplicates=True, max_distance=3)
+    assert deduper.add(site("a", "base")) == ("leader", None)
+    assert deduper.add(site("b", "three bits")) == ("follower", "a")
+    assert deduper.add(site("c", "spread")) == ("follower", "a")
+    assert deduper.add(site("d", "four bits")) == ("leader", None)
+    assert deduper.stats() == {"hosts": 4, "unique": 2, "dedup_ratio": 0.5}
+
+
+def test_simhash_separates_near_and_unrelated_pages():
+    words = ("buy cheap viagra cialis online pharmacy no prescription needed discreet shipping "
+             "worldwide bonus pills with every order secure checkout trusted generic tablets").split()
+    page = [words[(i * 7) % len(words)] for i in range(120)]
+    edited = list(page)
+    edited[50] = "tramadol"
+    unrelated = " ".join(["garden", "tomatoes", "roses", "soil", "water", "seeds"] * 20)
+    near = bin(simhash(" ".join(page)) ^ simhash(" ".join(edited))).count("1")
+    far = bin(simhash(" ".join(page)) ^ simhash(unrelated)).count("1")
+    assert near <= 10 < 20 <= far
+
+
+def test_exact_duplicates_ignore_case_space_and_digits():
+    deduper = ContentDeduper()
+    assert deduper.add(site("a", "Cheap  Viagra $19.99")) == ("leader", None)
+    assert deduper.add(site("b", "cheap viagra $24.50\n")) == ("follower", "a")
+    assert deduper.add(site("c", "cheap cialis $24.50")) == ("leader", None)
+    # a follower that shows up after the verdict gets it right away
+    assert deduper.resolve("a", STATUS_CLASSIFIED, {"is_pharmacy": True}) == ["b"]
+    assert deduper.add(site("d", "CHEAP VIAGRA $5.00")) == ("resolved", ("a", STATUS_CLASSIFIED, {"is_pharmacy": True}))
+
+
+def test_verdict_fans_out_to_every_cluster_member(tmp_path, monkeypatch):
+    pages = {}
+    for i in range(4):
+        pages[f"10.0.0.{i}"] = ("Rx Shop", f"<p>Buy viagra and xanax pills, now only ${10 + i}.99</p>")
+    for i, word in enumerate(["alpha", "beta", "gamma"]):
+        pages[f"10.0.1.{i}"] = ("Storefront", f"<p>Buy cialis and tramadol pills, {word} edition</p>")
+    pages["10.0.2.0"] = ("Garden blog", "<p>Tomatoes and roses</p>")
+    real_simhash = fig5_classify_utils.simhash
+
+    def fake_simhash(text):
+        for i, word in enumerate(["alpha", "beta", "gamma"]):
+            if word in text:
+                return flip(BASE_FINGERPRINT, 20 * i)
+        return real_simhash(text)
+    monkeypatch.setattr(fig5_classify_utils, "simhash", fake_simhash)
+
+    api = FakeCensysHosts(pages)
+    client = RecordingLLMClient(pages)
+    results = run(list(pages), api, client, str(tmp_path / "journal.jsonl"), near_duplicates=True)
+
+    # one LLM call per cluster, whichever host of it was fetched first
+    assert len(client.hosts) == 3
+    leaders = {}
+    for host, rec in results.items():
+        assert rec["status"] == STATUS_CLASSIFIED
+        leaders.setdefault(rec.get("dedup_of", host), []).append(host)
+    assert sorted(len(members) for members in leaders.values()) == [1, 3, 4]
+    for leader, members in leaders.items():
+        assert leader in client.hosts
+        assert all((results[m]["is_pharmacy"], results[m]["reason"]) ==
+                   (results[leader]["is_pharmacy"], results[leader]["reason"]) for m in members)
+    assert not results["10.0.2.0"]["is_pharmacy"] and results["10.0.1.2"]["is_pharmacy"]
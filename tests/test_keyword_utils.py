@@ -0,0 +1,123 @@
+import os
+import sys
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.censys_utils import HostContentStore
+from utils.keyword_utils import CoverageIndex, InvertedIndex
+
+
+###################### INCREMENTAL COVERAGE SCORING ######################
+
+def brute_force_scores(keyword_hosts, baselines):
+    baseline_hosts = set().union(*(keyword_hosts[kw] for kw in baselines))
+    marginal = {kw: len(hosts - baseline_hosts) for kw, hosts in keyword_hosts.items()}
+    exclusive = {}
+    for kw, hosts in keyword_hosts.items():
+        others = set().union(*(h for other, h in keyword_hosts.items() if other != kw))
+        exclusive[kw] = len(hosts - others)
+    return marginal, exclusive, baseline_hosts
+
+
+def check_against_brute_force(index, keyword_hosts, baselines):
+    marginal, exclusive, baseline_hosts = brute_force_scores(keyword_hosts, baselines)
+    assert index.marginal == marginal
+    assert index.exclusive == exclusive
+    assert index.baseline_hosts() == baseline_hosts
+    assert index.covered_hosts() == set().union(*keyword_hosts.values())
+    assert sorted(index.candidate_keywords()) == sorted(set(keyword_hosts) - baselines)
+
+
+def test_incremental_scores_match_brute_force():
+    rng = random.Random(0)
+    for _ in range(30):
+        index = CoverageIndex()
+        keyword_hosts = {}
+        baselines = set()
+        for _ in range(60):
+            keyword = f"kw{rng.randint(0, 9)}"
+            if keyword in keyword_hosts and rng.random() < 0.3:
+                index.remove_keyword(keyword)
+                del keyword_hosts[keyword]
+                baselines.discard(keyword)
+            else:
+                # re-adding a keyword replaces its hosts and may flip it between baseline and candidate
+                hosts = set(rng.sample(range(40), rng.randint(0, 12)))
+                baseline = rng.random() < 0.3
+                index.add_keyword(keyword, hosts, baseline=baseline)
+                keyword_hosts[keyword] = hosts
+                baselines.discard(keyword)
+                if baseline:
+                    baselines.add(keyword)
+            check_against_brute_force(index, keyword_hosts, baselines)
+
+
+def test_greedy_cover_takes_the_largest_gain_each_step():
+    rng = random.Random(1)
+    for _ in range(50):
+        index = CoverageIndex()
+        keyword_hosts = {f"kw{i}": set(rng.sample(range(60), rng.randint(1, 15))) for i in range(12)}
+        for kw, hosts in keyword_hosts.items():
+            index.add_keyword(kw, hosts)
+        universe = set().union(*keyword_hosts.values())
+        target = rng.choice([0.5, 0.9, 1.0])
+        ranking = index.greedy_cover(target)
+
+        covered = set()
+        for kw, gain, fraction in ranking:
+            assert len(covered) < target * len(universe)
+            best = max(len(hosts - covered) for hosts in keyword_hosts.values())
+            assert gain == len(keyword_hosts[kw] - covered) == best
+            covered |= keyword_hosts[kw]
+            assert fraction == len(covered) / len(universe)
+        assert len(covered) >= target * len(universe)
+
+
+def test_greedy_cover_within_universe():
+    index = CoverageIndex()
+    index.add_keyword("viagra", {1, 2, 3, 4})
+    index.add_keyword("cialis", {4, 5})
+    index.add_keyword("xanax", {6})
+    assert index.greedy_cover(1.0, universe={4, 5, 6}) == [("cialis", 2, 2 / 3), ("xanax", 1, 1.0)]
+    assert index.greedy_cover(1.0, keywords=["xanax"]) == [("xanax", 1, 1 / 6)]
+    assert index.greedy_cover(universe=()) == []
+
+
+###################### INVERTED INDEX ######################
+
+KEYWORDS = ["viagra", "cheap pills", "no prescription", "v1agra", "rx-meds", "xanax", "garden"]
+
+
+def host_store(n, start=0):
+    store = HostContentStore()
+    words = ["buy", "viagra", "v1agra", "cheap", "pills", "no", "prescription", "rx", "meds", "xanax", "order"]
+    for i in range(start, start + n):
+        body = " ".join(words[(i * j + j) % len(words)] for j in range(40))
+        store.add(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", f"Shop {i}", body)
+    return store
+
+
+def scores(index, known=()):
+    return {leet: index.score_keywords(KEYWORDS, leet=leet, known=known).to_dict("records") for leet in (False, True)}
+
+
+def test_index_survives_reopen_and_resave(tmp_path):
+    path = str(tmp_path / "keyword_index")
+    index = InvertedIndex(path).add_store(host_store(2000))
+    index.save()
+    expected = scores(index, known=["10.0.0.1"])
+
+    # reopened columns are memory-mapped from the files save() writes
+    reopened = InvertedIndex(path)
+    reopened.add_store(host_store(2000))
+    reopened.save()
+    assert scores(reopened, known=["10.0.0.1"]) == expected
+    assert scores(InvertedIndex(path), known=["10.0.0.1"]) == expected
+
+    # growing a reopened index matches building it in one go
+    grown = InvertedIndex(path).add_store(host_store(500, start=2000))
+    grown.save()
+    fresh = InvertedIndex().add_store(host_store(2000)).add_store(host_store(500, start=2000))
+    assert len(InvertedIndex(path)) == 2500
+    assert scores(InvertedIndex(path)) == scores(fresh)
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
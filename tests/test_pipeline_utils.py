@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.pipeline_utils import STATUS_RAN, Pipeline, Stage
+
+# writes "<start> <end>" (monotonic seconds) to its output after sleeping a bit
+TIMED_STEP = ("import sys, time; start = time.monotonic(); time.sleep(0.3); "
+              "open(sys.argv[1], 'w').write(f'{start} {time.monotonic()}')")
+
+
+def timed_stage(name, resources=()):
+    return Stage(name, [sys.executable, '-c', TIMED_STEP, f"{name}.txt"], outputs=[f"{name}.txt"],
+                 resources=resources)
+
+
+def test_stages_sharing_a_resource_do_not_overlap(tmp_path):
+    stages = [timed_stage(f"api{i}", resources=["censys"]) for i in range(3)] + [timed_stage("local")]
+    pipeline = Pipeline(stages, root=str(tmp_path), jobs=4)
+    assert set(pipeline.run().values()) == {STATUS_RAN}
+
+    spans = {}
+    for stage in stages:
+        with open(tmp_path / f"{stage.name}.txt") as f:
+            spans[stage.name] = tuple(map(float, f.read().split()))
+    api = sorted(spans[f"api{i}"] for i in range(3))
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(api, api[1:]))
+    # the stage without the resource runs alongside the first one
+    assert spans["local"][0] < api[0][1]
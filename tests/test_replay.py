@@ -0,0 +1,80 @@
+import os
+import sys
+import gzip
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.replay_utils import ReplayArchive, ReplayCensysHosts, ReplayMiss
+
+
+class FakeCensysHosts:
+    # `n_hits` hits in pages of `per_page`, at most `pages` pages
+    def __init__(self, n_hits):
+        self.n_hits = n_hits
+
+    def search(self, query, per_page=100, pages=1, max_records=None, **kwargs):
+        limit = self.n_hits if max_records is None else min(self.n_hits, max_records)
+        for start in range(0, min(limit, per_page * pages), per_page):
+            yield [{"ip": f"10.0.0.{i}"} for i in range(start, min(start + per_page, limit))]
+
+
+def read_until_short_page(pages, per_page):
+    # stops like KeywordQueryEngine._pages: no further request after a short page
+    hits = []
+    for page in pages:
+        hits.extend(page)
+        if len(page) < per_page:
+            break
+    return hits
+
+
+def test_early_stop_is_recorded(tmp_path):
+    path = str(tmp_path / "censys.ndjson.gz")
+    recorder = ReplayCensysHosts(path, 'record', upstream=lambda: FakeCensysHosts(25))
+    recorded = read_until_short_page(recorder.search("q", per_page=10, pages=5), 10)
+    recorder.archive.close()
+    assert len(recorded) == 25
+
+    replay = ReplayCensysHosts(path)
+    assert read_until_short_page(replay.search("q", per_page=10, pages=5), 10) == recorded
+    assert [hit for page in replay.search("q", per_page=7, pages=10) for hit in page] == recorded
+
+
+def test_abandoned_search_is_partial(tmp_path):
+    path = str(tmp_path / "censys.ndjson.gz")
+    recorder = ReplayCensysHosts(path, 'record', upstream=lambda: FakeCensysHosts(50))
+    pages = recorder.search("q", per_page=10, pages=5)
+    first = next(pages)
+    pages.close()
+    recorder.archive.close()
+
+    replay = ReplayCensysHosts(path)
+    assert list(replay.search("q", per_page=10, pages=1)) == [first]
+    with pytest.raises(ReplayMiss):
+        list(replay.search("q", per_page=10, pages=5))
+
+
+def test_archive_ignores_and_drops_a_truncated_tail(tmp_path):
+    for tail in ('half member', 'half line'):
+        path = str(tmp_path / f"{tail.replace(' ', '_')}.ndjson.gz")
+        archive = ReplayArchive(path)
+        archive.put({'method': 'view', 'ip': '192.0.2.1'}, {'ip': '192.0.2.1'}, 0.5)
+        archive.put({'method': 'view', 'ip': '192.0.2.2'}, {'ip': '192.0.2.2'})
+        archive.close()
+        # what an interrupted recording leaves: a cut gzip member or a cut line
+        member = gzip.compress(b'{"key": "0123", "request": {"method": "view", "ip": "192.0.2.3"}, "resp')
+        with open(path, 'ab') as f:
+            f.write(member[:len(member) // 2] if tail == 'half member' else member)
+
+        archive = ReplayArchive(path)
+        assert len(archive) == 2 and archive.truncated
+        assert archive.get({'method': 'view', 'ip': '192.0.2.1'})['seconds'] == 0.5
+        # recording resumes behind the readable records
+        archive.put({'method': 'view', 'ip': '192.0.2.3'}, {'ip': '192.0.2.3'})
+        archive.close()
+        reopened = ReplayArchive(path)
+        assert len(reopened) == 3 and not reopened.truncated
+        assert reopened.get({'method': 'view', 'ip': '192.0.2.3'})['response'] == {'ip': '192.0.2.3'}
+        with pytest.raises(ReplayMiss):
+            reopened.get({'method': 'view', 'ip': '192.0.2.4'})
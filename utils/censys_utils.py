@@ -0,0 +1,590 @@
+import os
+import gzip
+import json
+import time
+import ipaddress
+import sqlite3
+import pandas as pd
+import threading
+import concurrent.futures
+from collections import defaultdict
+
+try:
+    from utils.keyword_utils import query_form
+    from utils.replay_utils import censys_replay_from_env
+except ImportError:
+    from keyword_utils import query_form
+    from replay_utils import censys_replay_from_env
+
+
+###################### RATE LIMITING ######################
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity`
+    banked. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if self.rate is None:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+###################### CENSYS HOST CACHE ######################
+
+class CensysCacheMiss(KeyError):
+    pass
+
+
+class CachedCensysHosts:
+    """
+    Local SQLite cache in front of CensysHosts.view / CensysHosts.search.
+
+    Host records are keyed by IP, search results by (query, parameters) and
+    page number. Entries older than max_age seconds are refetched, the host
+    table is bounded to max_entries records (least recently used evicted
+    first) and hit/miss counts are kept in self.stats. The CensysHosts client
+    (built from api_kwargs unless given) is only created on the first miss.
+    With offline=True the API is never called and every previously captured
+    record is served regardless of its age.
+    """
+
+    def __init__(self, api=None, api_kwargs=None, db_path='censys_cache.sqlite', max_age=7 * 24 * 3600,
+                 max_entries=None, offline=False):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.offline = offline
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evicted': 0}
+        self._api = api
+        self._api_kwargs = api_kwargs or {}
+        # one connection shared by the fetch threads, serialized by this lock
+        self.lock = threading.RLock()
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS hosts '
+                        '(ip TEXT PRIMARY KEY, fetched_at REAL, accessed_at REAL, data TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS search_pages '
+                        '(key TEXT, page INTEGER, fetched_at REAL, data TEXT, PRIMARY KEY (key, page))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS searches '
+                        '(key TEXT PRIMARY KEY, n_pages INTEGER, fetched_at REAL)')
+        self.db.commit()
+
+    @property
+    def api(self):
+        if self.offline:
+            raise CensysCacheMiss('offline mode: record not in cache')
+        if self._api is None:
+            from censys.search import CensysHosts
+            self._api = CensysHosts(**self._api_kwargs)
+        return self._api
+
+    def _fresh(self, fetched_at):
+        return self.offline or self.max_age is None or time.time() - fetched_at <= self.max_age
+
+    ###################### hosts ######################
+
+    def get_cached(self, ip):
+        with self.lock:
+            row = self.db.execute('SELECT fetched_at, data FROM hosts WHERE ip = ?', (ip,)).fetchone()
+            if row is None:
+                return None
+            if not self._fresh(row[0]):
+                self.stats['stale'] += 1
+                return None
+            self.db.execute('UPDATE hosts SET accessed_at = ? WHERE ip = ?', (time.time(), ip))
+            self.db.commit()
+        return json.loads(row[1])
+
+    def put(self, ip, record):
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?)', (ip, now, now, json.dumps(record)))
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        n = self.db.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+        if n <= self.max_entries:
+            return
+        cur = self.db.execute('DELETE FROM hosts WHERE ip IN '
+                              '(SELECT ip FROM hosts ORDER BY accessed_at ASC LIMIT ?)', (n - self.max_entries,))
+        self.stats['evicted'] += cur.rowcount
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def view(self, ip, **kwargs):
+        record = self.get_cached(ip)
+        if record is not None:
+            self._count('hits')
+            return record
+        self._count('misses')
+        record = self.api.view(ip, **kwargs)
+        self.put(ip, record)
+        return record
+
+    def import_records(self, records):
+        # seed the cache with previously captured host records (e.g. search hits)
+        now = time.time()
+        rows = [(r['ip'], now, now, json.dumps(r)) for r in records if r.get('ip')]
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?)', rows)
+            self._evict()
+            self.db.commit()
+        return len(rows)
+
+    ###################### searches ######################
+
+    @staticmethod
+    def search_key(query, **kwargs):
+        return json.dumps({'q': query, **kwargs}, sort_keys=True)
+
+    def _cached_pages(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT n_pages, fetched_at FROM searches WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if not self._fresh(row[1]):
+                self.stats['stale'] += 1
+                return None
+            rows = self.db.execute('SELECT data FROM search_pages WHERE key = ? ORDER BY page', (key,)).fetchall()
+        if len(rows) != row[0]:
+            return None
+        return [json.loads(r[0]) for r in rows]
+
+    def has_search(self, query, **kwargs):
+        # True when search() would serve this query from the cache without an API call
+        key = self.search_key(query, **kwargs)
+        with self.lock:
+            row = self.db.execute('SELECT n_pages, fetched_at FROM searches WHERE key = ?', (key,)).fetchone()
+            if row is None or not self._fresh(row[1]):
+                return False
+            n_pages = self.db.execute('SELECT COUNT(*) FROM search_pages WHERE key = ?', (key,)).fetchone()[0]
+        return n_pages == row[0]
+
+    def search(self, query, **kwargs):
+        # yields pages like CensysHosts.search; a query is only served from the
+        # cache once all of its pages were captured (a caller that stops on a
+        # short page or at max_records has seen all of them)
+        key = self.search_key(query, **kwargs)
+        pages = self._cached_pages(key)
+        if pages is not None:
+            self._count('hits')
+            yield from pages
+            return
+
+        self._count('misses')
+        with self.lock:
+            self.db.execute('DELETE FROM search_pages WHERE key = ?', (key,))
+            self.db.commit()
+        n_pages = 0
+        n_records = 0
+        exhausted = False
+        try:
+            for page in self.api.search(query, **kwargs):
+                with self.lock:
+                    self.db.execute('INSERT OR REPLACE INTO search_pages VALUES (?, ?, ?, ?)',
+                                    (key, n_pages, time.time(), json.dumps(page)))
+                    self.db.commit()
+                n_pages += 1
+                # a short page or max_records reached ends the result set, so the
+                # search is complete even if the caller stops reading here
+                if isinstance(page, list):
+                    n_records += len(page)
+                    exhausted = (len(page) < kwargs.get('per_page', 100)
+                                 or n_records >= (kwargs.get('max_records') or float('inf')))
+                yield page
+            exhausted = True
+        finally:
+            if exhausted:
+                with self.lock:
+                    self.db.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)', (key, n_pages, time.time()))
+                    self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            for table in ('hosts', 'search_pages', 'searches'):
+                self.db.execute(f'DELETE FROM {table}')
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def cached_censys_hosts(api=None, api_id=None, api_secret=None, **kwargs):
+    # cache settings can be overridden from the environment without editing the scripts
+    api_kwargs = {k: v for k, v in (('api_id', api_id), ('api_secret', api_secret)) if v}
+    if api is None:
+        # CENSYS_REPLAY=archive.ndjson.gz records / replays the API (see utils/replay_utils.py);
+        # the cache then starts empty unless CENSYS_CACHE_DB is set, so every request reaches it
+        api = censys_replay_from_env(api_kwargs)
+        if api is not None:
+            kwargs.setdefault('db_path', os.getenv('CENSYS_CACHE_DB', ':memory:'))
+    kwargs.setdefault('db_path', os.getenv('CENSYS_CACHE_DB', 'censys_cache.sqlite'))
+    if os.getenv('CENSYS_CACHE_MAX_AGE'):
+        kwargs.setdefault('max_age', float(os.getenv('CENSYS_CACHE_MAX_AGE')))
+    if os.getenv('CENSYS_CACHE_MAX_ENTRIES'):
+        kwargs.setdefault('max_entries', int(os.getenv('CENSYS_CACHE_MAX_ENTRIES')))
+    kwargs.setdefault('offline', os.getenv('CENSYS_OFFLINE', '') == '1')
+    return CachedCensysHosts(api=api, api_kwargs=api_kwargs, **kwargs)
+
+
+###################### STREAMING SEARCH ######################
+
+def host_key(ip):
+    # IPs are kept as ints (a small int object instead of a string); anything
+    # that doesn't parse as an address is kept as-is
+    try:
+        return int(ipaddress.ip_address(ip))
+    except ValueError:
+        return ip
+
+
+class HostSeenSet:
+    """
+    Compact set of the hosts already seen, keyed by IP (anything that is
+    not an address, e.g. a virtual-host name, is kept as-is).
+    """
+
+    def __init__(self, ips=()):
+        self.keys = set()
+        for ip in ips:
+            self.add(ip)
+
+    def add(self, ip):
+        # returns True the first time an ip is seen
+        key = host_key(ip)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def __contains__(self, ip):
+        return host_key(ip) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class SearchSpill:
+    """
+    Append-only NDJSON archive of search hits (gzip-compressed when the path
+    ends in .gz). Each page is flushed as it arrives, so the hits of an
+    interrupted search are still on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith('.gz'):
+            self.f = gzip.open(path, 'at', encoding='utf-8')
+        else:
+            self.f = open(path, 'a', encoding='utf-8')
+
+    def write_page(self, hits, query=None):
+        for hit in hits:
+            record = {'query': query, 'host': hit} if query is not None else hit
+            self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_spill(path, dedup=False):
+    """
+    Yields the hosts archived by SearchSpill, stopping cleanly at a
+    truncated last line / gzip member left by an interrupted run.
+    """
+    seen = HostSeenSet() if dedup else None
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                host = record['host'] if 'host' in record and 'query' in record else record
+                if seen is None or seen.add(host.get('ip')):
+                    yield host
+        except EOFError:
+            pass
+
+
+def hit_ip(hit):
+    return hit.get('ip')
+
+
+def hit_name_or_ip(hit):
+    # virtual-host hits share an ip but are different sites
+    name = hit.get('name')
+    return name.lower() if name else hit.get('ip')
+
+
+def iter_search_hosts(api, queries, per_page=100, pages=1, spill=None, seen=None, key=hit_ip):
+    """
+    Runs each query and yields every host the first time it is seen, as the
+    pages arrive. `key` maps a hit to what makes it a distinct host (the ip
+    by default, hit_name_or_ip for virtual hosts); hits without a key are
+    always yielded. Only the seen-set is kept in memory; every page is also
+    appended to `spill` (a path or SearchSpill) when given.
+
+    A failing query is reported and skipped, like the fig89 loop did.
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+    seen = seen if seen is not None else HostSeenSet()
+    own_spill = isinstance(spill, str)
+    if own_spill:
+        spill = SearchSpill(spill)
+    try:
+        for query in queries:
+            try:
+                for page in api.search(query, per_page=per_page, pages=pages):
+                    page = page if isinstance(page, list) else [page]
+                    if spill is not None:
+                        spill.write_page(page, query=query)
+                    for hit in page:
+                        hit_key = key(hit)
+                        if hit_key is None or seen.add(hit_key):
+                            yield hit
+            except Exception as e:
+                print(f"[Error] {query}: {e}")
+    finally:
+        if own_spill:
+            spill.close()
+
+
+###################### KEYWORD QUERY ENGINE ######################
+
+class HostContentStore:
+    """
+    Each host's HTTP title/body stored once, under a dense integer host id.
+
+    Keyword results only keep sets of these ids, so memory grows with the
+    number of distinct hosts rather than keywords x bodies.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.ips = []
+        self.titles = []
+        self.bodies = []
+
+    def __len__(self):
+        return len(self.ips)
+
+    def add(self, ip, title="", body=""):
+        with self.lock:
+            host_id = self.ids.get(ip)
+            if host_id is None:
+                host_id = len(self.ips)
+                self.ids[ip] = host_id
+                self.ips.append(ip)
+                self.titles.append(title or "")
+                self.bodies.append(body or "")
+            elif body and not self.bodies[host_id]:
+                self.titles[host_id] = title or ""
+                self.bodies[host_id] = body
+            return host_id
+
+    def ip(self, host_id):
+        return self.ips[host_id]
+
+    def content(self, host_id):
+        return {"title": self.titles[host_id], "body": self.bodies[host_id]}
+
+    def iter_content(self):
+        # (title, body) of every host, once
+        for host_id in range(len(self.ips)):
+            yield self.titles[host_id], self.bodies[host_id]
+
+
+def http_title_and_body(result):
+    # (title, body) of the last HTTP service of a search hit, None without HTTP service
+    content = None
+    for service in result.get("services", []):
+        if service.get("service_name") == "HTTP":
+            response = service.get("http", {}).get("response", {})
+            content = (response.get("html_title", ""), response.get("body", ""))
+    return content
+
+
+class KeywordQueryEngine:
+    """
+    Runs body keyword searches concurrently under a shared rate limit.
+
+    Every page request waits on one token bucket (`rate` requests per second),
+    up to `workers` keywords are in flight, and hosts go into a shared
+    HostContentStore while keyword_hosts maps each keyword to a set of ids.
+    """
+
+    def __init__(self, api, store=None, rate=1.0, workers=4, max_results=100, per_page=100):
+        self.api = api
+        self.store = store if store is not None else HostContentStore()
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.max_results = max_results
+        self.per_page = per_page
+        self.keyword_hosts = {}
+        self.lock = threading.Lock()
+
+    def _pages(self, query):
+        # a token per page request; a short page or max_results reached means no further request.
+        # Pages a caching client serves locally cost no request and take no token.
+        has_search = getattr(self.api, 'has_search', None)
+        live = not (has_search and has_search(query=query, per_page=self.per_page, max_records=self.max_results))
+        pages = iter(self.api.search(query=query, per_page=self.per_page, max_records=self.max_results))
+        n_records = 0
+        try:
+            while True:
+                if live:
+                    self.bucket.acquire()
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    return
+                yield page
+                size = len(page) if isinstance(page, list) else 1
+                n_records += size
+                if isinstance(page, list) and (size < self.per_page or n_records >= self.max_results):
+                    return
+        finally:
+            # closing lets a caching client record the search as complete
+            if hasattr(pages, 'close'):
+                pages.close()
+
+    def query(self, keyword):
+        query = f'services.http.response.body: "{keyword}"'
+        host_ids = set()
+        try:
+            for page in self._pages(query):
+                # some SDK versions yield single hits instead of pages
+                for result in (page if isinstance(page, list) else [page]):
+                    ip = result.get("ip")
+                    content = http_title_and_body(result)
+                    if ip and content is not None:
+                        host_ids.add(self.store.add(ip, *content))
+        except Exception as e:
+            print(f"[Error] {keyword}: {e}")
+        with self.lock:
+            self.keyword_hosts[keyword] = host_ids
+        return host_ids
+
+    def run(self, keywords):
+        # keywords that only differ in case / separators ("rx-meds", "rx meds")
+        # return the same hosts, so each group costs one search
+        groups = defaultdict(list)
+        for kw in dict.fromkeys(keywords):
+            if kw not in self.keyword_hosts:
+                groups[query_form(kw)].append(kw)
+        todo = [variants[0] for variants in groups.values()]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for kw, host_ids in zip(todo, pool.map(self.query, todo)):
+                print(f"[Query] {kw} → {len(host_ids)} hosts")
+        with self.lock:
+            for variants in groups.values():
+                for kw in variants[1:]:
+                    self.keyword_hosts[kw] = set(self.keyword_hosts[variants[0]])
+        return {kw: self.keyword_hosts.get(kw, set()) for kw in keywords}
+
+    def keyword_ips(self, keyword):
+        return {self.store.ip(i) for i in self.keyword_hosts.get(keyword, ())}
+
+
+###################### COLUMNAR HOST RECORDS ######################
+
+def flatten_host_records(results,include_bodies=True):
+    """
+    Flattens raw Censys host dicts into typed tables in one pass.
+
+    Returns a dict of DataFrames sharing a dense host_id:
+      hosts:    one row per record: ip, country, asn, asn_name, reg_year
+                (country / asn_name / reg_year are categoricals)
+      services: one row per service: port, service_name, is_http, html_title,
+                body, has_body (body is None unless include_bodies)
+      names:    one row per dns name: domain, tld (categorical)
+    All aggregations (countries, ASNs, ports, TLDs, years) are then group-bys.
+    """
+    hosts = {"host_id": [], "ip": [], "country": [], "asn": [], "asn_name": [], "reg_year": []}
+    services = {"host_id": [], "port": [], "service_name": [], "is_http": [], "html_title": [],
+                "body": [], "has_body": []}
+    names = {"host_id": [], "domain": []}
+
+    for host_id, result in enumerate(results):
+        asys = result.get("autonomous_system") or {}
+        cert = result.get("certificate") or {}
+        reg_date = cert.get("registered") if isinstance(cert, dict) else None
+        hosts["host_id"].append(host_id)
+        hosts["ip"].append(result.get("ip", ""))
+        hosts["country"].append((result.get("location") or {}).get("country", "unknown"))
+        hosts["asn"].append(asys.get("asn"))
+        hosts["asn_name"].append(asys.get("name", "unknown"))
+        hosts["reg_year"].append(reg_date[:4] if reg_date and len(reg_date) >= 4 else None)
+
+        for service in result.get("services", []):
+            response = None
+            is_http = service.get("service_name") == "HTTP" and "http" in service
+            if is_http:
+                response = (service["http"] or {}).get("response")
+            response = response or {}
+            services["host_id"].append(host_id)
+            services["port"].append(service.get("port", -1))
+            services["service_name"].append(service.get("service_name"))
+            services["is_http"].append(is_http)
+            services["html_title"].append(response.get("html_title"))
+            services["has_body"].append("body" in response)
+            services["body"].append(response.get("body") if include_bodies else None)
+
+        dns = result.get("dns") or {}
+        for name in dns.get("names", []):
+            names["host_id"].append(host_id)
+            names["domain"].append(name)
+
+    hosts = pd.DataFrame(hosts)
+    hosts["asn"] = hosts["asn"].astype("Int64")
+    for col in ("country", "asn_name", "reg_year"):
+        hosts[col] = hosts[col].astype("category")
+
+    services = pd.DataFrame(services)
+    services["port"] = services["port"].astype("int64")
+    services["service_name"] = services["service_name"].astype("category")
+
+    names = pd.DataFrame(names)
+    domain = names["domain"].astype("string")
+    names["tld"] = ("." + domain.str.rsplit(".", n=1).str[-1]).where(domain.str.contains(".", regex=False))
+    names["tld"] = names["tld"].astype("category")
+
+    return {"hosts": hosts, "services": services, "names": names}
@@ -4,32 +4,69 @@ import requests
 from requests.auth import HTTPBasicAuth
 from bs4 import BeautifulSoup
 import json
+import os
+import csv
+import time
+import random
+import struct
 import socket
-import concurrent.futures
+import asyncio
+import hashlib
+import ipaddress
 
 
 ###################### CENSYS QUERY PROCESSING FUNCTIONS ######################
 
-def get_dns_names_from_query(data):
-    count = 0
-    dns_names = []
-    for i in range(len(data['result']['hits'])):
-        if 'dns' in data['result']['hits'][i].keys():
-            result = data['result']['hits'][i]['dns']['reverse_dns']['names']
-            dns_names.append(result)
-            count += len(result)
+def iter_query_hits(data,dns_only=True):
+    """
+    Single pass over search hits, yielding (ip, reverse_dns_names).
+
+    `data` can be one search page, a list / iterable of pages, or an iterable
+    of bare hits (e.g. ijson.items(f, 'item.result.hits.item')). With
+    dns_only=False hits without a dns section are yielded with names None.
+    """
+    if isinstance(data, dict):
+        data = (data,)
+    for item in data:
+        result = item.get('result')
+        hits = result['hits'] if result is not None else (item,)
+        for hit in hits:
+            dns = hit.get('dns')
+            if dns is None:
+                if not dns_only:
+                    yield hit.get('ip', ''), None
+                continue
+            yield hit.get('ip', ''), (dns.get('reverse_dns') or {}).get('names', [])
+
+
+def extract_query_hits(data):
+    # flat (ips, dns_names) of every hit with a dns section, in one pass
+    ips, dns_names = [], []
+    for ip, names in iter_query_hits(data):
+        ips.append(ip)
+        dns_names.extend(names)
+    return ips, dns_names
+
+
+def iter_dump_pages(json_file):
+    # pages of a query dump; streamed with ijson when it's installed so large
+    # dumps are never loaded whole
+    try:
+        import ijson
+    except ImportError:
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+        return
+    with open(json_file, 'rb') as f:
+        yield from ijson.items(f, 'item')
 
-    return dns_names
+
+def get_dns_names_from_query(data):
+    return [names for _, names in iter_query_hits(data)]
 
 def get_ips_from_query(data):
-    count = 0
-    ips = []
-    for i in range(len(data['result']['hits'])):
-        if 'dns' in data['result']['hits'][i].keys():
-            result = data['result']['hits'][i]['ip']
-            ips.append(result)
-            count += len(result)
-    return ips
+    return [ip for ip, _ in iter_query_hits(data)]
 
 
 def flatten_array(arr):
@@ -40,37 +77,158 @@ def flatten_array(arr):
             yield item
 
 
-###################### BLOCKLIST PROCESSING FUNCTIONS ######################
+###################### COMPACT CENSYS DUMP STORE ######################
 
-def convert_dns_files_to_ip(input_dns_file,output_ip_file):
+# A query dump (list of search pages) is converted once into a directory of
+# .npy columns holding only the projected fields. np.load(mmap_mode='r')
+# then opens it without parsing anything:
+#   ips.npy          bytes    ip of every hit, in dump order
+#   has_dns.npy      bool     hit carried a dns section
+#   page.npy         int32    index of the page the hit came from
+#   name_offsets.npy int64    hit i owns names[name_offsets[i]:name_offsets[i+1]]
+#   names.npy        bytes    reverse dns names, flattened
+#   ip_sorted.npy / ip_order.npy   sorted ips + positions, for lookup by ip
+STORE_COLUMNS = ('ips', 'has_dns', 'page', 'name_offsets', 'names', 'ip_sorted', 'ip_order')
 
-    # Read and load the JSON file
-    with open(input_dns_file, "r") as f:
-        blocklist_pharmacy_safe = [line.strip() for line in f]
 
+def censys_store_path(json_file):
+    return os.path.splitext(json_file)[0] + '.store'
 
-    def task(host):
-        try:
-            ip_address = socket.gethostbyname(host)
-            print(f"The IP address of {host} is: {ip_address}")
-            return ip_address
-        except socket.gaierror as e:
-            print(f"Error resolving hostname {host}: {e}")
-            return ''
 
+def convert_censys_dump(json_file,store_dir=None):
+    store_dir = store_dir or censys_store_path(json_file)
+    ips, has_dns, page_ids, names, name_offsets = [], [], [], [], [0]
+    n_pages = 0
+    for page_id, page in enumerate(iter_dump_pages(json_file)):
+        for ip, hit_names in iter_query_hits(page, dns_only=False):
+            ips.append(ip)
+            has_dns.append(hit_names is not None)
+            page_ids.append(page_id)
+            if hit_names:
+                names.extend(hit_names)
+            name_offsets.append(len(names))
+        n_pages += 1
+
+    ips = np.array([ip.encode() for ip in ips], dtype='S')
+    order = np.argsort(ips, kind='stable')
+    columns = {
+        'ips': ips,
+        'has_dns': np.array(has_dns, dtype=bool),
+        'page': np.array(page_ids, dtype=np.int32),
+        'name_offsets': np.array(name_offsets, dtype=np.int64),
+        'names': np.array([name.encode() for name in names], dtype='S') if names else np.zeros(0, dtype='S1'),
+        'ip_sorted': ips[order],
+        'ip_order': order.astype(np.int64),
+    }
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(store_dir, name + '.npy'), column)
+    meta = {'source': os.path.abspath(json_file), 'source_mtime': os.path.getmtime(json_file),
+            'n_pages': n_pages, 'n_hits': len(ips), 'n_names': len(names)}
+    # written last: a store without meta.json is incomplete
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return store_dir
+
+
+class CensysDumpStore:
+    """
+    Read side of convert_censys_dump. Columns are memory-mapped lazily, so
+    only the ones a caller touches are ever paged in.
+    """
+
+    def __init__(self, store_dir, mmap=True):
+        self.store_dir = store_dir
+        self.mmap_mode = 'r' if mmap else None
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.store_dir, name + '.npy'), mmap_mode=self.mmap_mode)
+        return self._columns[name]
+
+    def __len__(self):
+        return self.meta['n_hits']
+
+    def ip(self, i):
+        return self.column('ips')[i].decode()
+
+    def names(self, i):
+        offsets = self.column('name_offsets')
+        return [name.decode() for name in self.column('names')[offsets[i]:offsets[i + 1]]]
+
+    def find(self, ip):
+        # position of the first hit for ip, or None
+        key = ip.encode()
+        ip_sorted = self.column('ip_sorted')
+        pos = np.searchsorted(ip_sorted, key)
+        if pos < len(ip_sorted) and ip_sorted[pos] == key:
+            return int(self.column('ip_order')[pos])
+        return None
+
+    def lookup(self, ip):
+        i = self.find(ip)
+        if i is None:
+            return None
+        return {'ip': ip, 'has_dns': bool(self.column('has_dns')[i]),
+                'page': int(self.column('page')[i]), 'names': self.names(i)}
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit tasks to the executor
-        futures = [executor.submit(task, host) for host in blocklist_pharmacy_safe]
-        # Collect the results
-        results = [future.result() for future in concurrent.futures.as_completed(futures)]
+    def __contains__(self, ip):
+        return self.find(ip) is not None
 
+    def ips(self, dns_only=True):
+        # same hits as get_ips_from_query over every page
+        ips = self.column('ips')
+        if dns_only:
+            ips = ips[self.column('has_dns')]
+        return np.char.decode(ips).tolist()
 
-    filtered_arr = [s for s in results if s != '']
+    def iter_hosts(self):
+        # (ip, reverse dns names) of every hit with a dns section, like iter_query_hits
+        has_dns = self.column('has_dns')
+        for i in np.flatnonzero(has_dns):
+            yield self.ip(i), self.names(i)
+
+    def dns_names(self):
+        # same names, in the same order, as get_dns_names_from_query + flatten_array
+        return np.char.decode(self.column('names')).tolist()
+
+
+def load_censys_dump(json_file,store_dir=None,mmap=True):
+    # converts on first use and again whenever the JSON dump is newer than the store
+    store_dir = store_dir or censys_store_path(json_file)
+    meta_file = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(meta_file) or os.path.getmtime(json_file) > os.path.getmtime(meta_file):
+        convert_censys_dump(json_file, store_dir)
+    return CensysDumpStore(store_dir, mmap=mmap)
+
+
+###################### BLOCKLIST PROCESSING FUNCTIONS ######################
+
+def convert_dns_files_to_ip(input_dns_file,output_ip_file,output_table_file=None,cache_file=None,**resolver_kwargs):
+
+    # Read the domain list
+    with open(input_dns_file, "r") as f:
+        hosts = [line.strip() for line in f if line.strip()]
+
+    resolver = AsyncResolver(cache_file=cache_file, **resolver_kwargs)
+    resolved = resolver.resolve_all(hosts)
+
+    # keep the input order so the ip file can be joined back to the domains
     with open(output_ip_file,'w') as f:
-        for line in filtered_arr:
-            f.write(line + '\n')
+        for host in hosts:
+            for ip in resolved.get(host, []):
+                f.write(ip + '\n')
+
+    if output_table_file is not None:
+        write_dns_table(resolved, output_table_file)
 
+    print(f"Resolved {sum(1 for ips in resolved.values() if ips)}/{len(resolved)} hosts "
+          f"(cache hits: {resolver.cache.hits}, misses: {resolver.cache.misses})")
+    return resolved
 
 
 def fetch_illegal_pharmacies():
@@ -90,7 +248,8 @@ def fetch_illegal_pharmacies():
     pharmacy_links = soup.find_all('a', href=True)
 
     # Extract the text from each link, which represents the pharmacy URL
-    pharmacies = [link.get_text(strip=True).split('/')[0] for link in pharmacy_links if link.get_text(strip=True)]
+    pharmacies = [normalize_domain(link.get_text(strip=True)) for link in pharmacy_links]
+    pharmacies = [domain for domain in pharmacies if domain]
 
     return pharmacies
 
@@ -113,4 +272,817 @@ def get_shared_entries(list1,list2):
 
     # Find intersection
     shared = list(set1.intersection(set2))
-    return shared
\ No newline at end of file
+    return shared
+
+
+###################### CIDR INTERVAL INDEX ######################
+
+def read_ip_ranges(file,offset=0):
+    # same as read_ip_blocklists, but keeps the /prefix of netset entries
+    with open(file) as f:
+        lines = f.readlines()
+
+    lines = lines[offset:]
+    ret = [line.strip() for line in lines]
+    return [line for line in ret if line and not line.startswith('#')]
+
+
+def ip_to_int(ip):
+    # returns (version, integer) or None if the string is not an ip address
+    ip = str(ip).strip()
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except OSError:
+        return None
+
+
+def parse_ip_range(entry):
+    # parses '1.2.3.4', '1.2.3.0/24' or '1.2.3.4-1.2.3.9' into (version, start, end)
+    entry = str(entry).strip()
+    try:
+        if '-' in entry:
+            first, last = entry.split('-', 1)
+            first = ipaddress.ip_address(first.strip())
+            last = ipaddress.ip_address(last.strip())
+            if first.version != last.version:
+                return None
+            return first.version, int(first), int(last)
+        net = ipaddress.ip_network(entry, strict=False)
+    except ValueError:
+        return None
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+
+def merge_ranges(ranges):
+    # merges overlapping/adjacent (start, end) pairs into sorted disjoint intervals
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def merge_range_arrays(starts,ends):
+    # vectorized merge_ranges for uint64 start/end arrays
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64)
+    order = np.lexsort((ends, starts))
+    starts = starts[order]
+    ends = ends[order]
+    reach = np.maximum.accumulate(ends)
+    # a new interval starts wherever the next start is past everything so far (+1: adjacent ranges merge)
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > reach[:-1] + 1
+    first = np.flatnonzero(new)
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+class BlocklistIndex:
+    """
+    Compiled blocklist of IPv4/IPv6 addresses and CIDR ranges.
+
+    Entries are parsed to integer (start, end) pairs, merged and held in
+    sorted NumPy arrays, so membership of many candidates is one
+    searchsorted pass instead of exact string comparison.
+    """
+
+    def __init__(self, entries):
+        if isinstance(entries, BlocklistFeed):
+            self.n_entries = len(entries)
+            self.n_invalid = entries.n_invalid
+            self.starts4, self.ends4 = merge_range_arrays(entries.starts4, entries.ends4)
+            merged6 = merge_ranges(zip(entries.starts6, entries.ends6))
+            self.starts6 = np.array([r[0] for r in merged6], dtype=object)
+            self.ends6 = np.array([r[1] for r in merged6], dtype=object)
+            return
+
+        ranges = {4: [], 6: []}
+        self.n_entries = 0
+        self.n_invalid = 0
+        for entry in entries:
+            parsed = parse_ip_range(entry)
+            if parsed is None:
+                self.n_invalid += 1
+                continue
+            version, start, end = parsed
+            ranges[version].append((start, end))
+            self.n_entries += 1
+
+        merged4 = merge_ranges(ranges[4])
+        merged6 = merge_ranges(ranges[6])
+        # ipv4 fits into uint64, ipv6 needs python ints (object arrays still support searchsorted)
+        self.starts4 = np.array([r[0] for r in merged4], dtype=np.uint64)
+        self.ends4 = np.array([r[1] for r in merged4], dtype=np.uint64)
+        self.starts6 = np.array([r[0] for r in merged6], dtype=object)
+        self.ends6 = np.array([r[1] for r in merged6], dtype=object)
+
+    def __len__(self):
+        return self.n_entries
+
+    def num_addresses(self):
+        n4 = int((self.ends4 - self.starts4).sum()) + len(self.starts4)
+        n6 = sum(int(e) - int(s) + 1 for s, e in zip(self.starts6, self.ends6))
+        return n4 + n6
+
+    @staticmethod
+    def _lookup(starts, ends, values):
+        if len(starts) == 0 or len(values) == 0:
+            return np.zeros(len(values), dtype=bool)
+        pos = np.searchsorted(starts, values, side='right') - 1
+        found = pos >= 0
+        pos[~found] = 0
+        return found & (values <= ends[pos])
+
+    def contains_parsed(self, versions, values4, values6):
+        # versions: int8 array (4, 6 or 0 for unparsable), values: ints for the matching rows
+        hits = np.zeros(len(versions), dtype=bool)
+        is4 = versions == 4
+        is6 = versions == 6
+        hits[is4] = self._lookup(self.starts4, self.ends4, values4)
+        hits[is6] = self._lookup(self.starts6, self.ends6, values6)
+        return hits
+
+    def contains(self, ips):
+        return self.contains_parsed(*parse_ip_array(ips))
+
+    def __contains__(self, ip):
+        return bool(self.contains([ip])[0])
+
+
+def parse_ip_array(ips):
+    # parse candidate ips once: returns (versions, ipv4 ints, ipv6 ints)
+    versions = np.zeros(len(ips), dtype=np.int8)
+    values4 = []
+    values6 = []
+    for i, ip in enumerate(ips):
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            continue
+        versions[i] = parsed[0]
+        if parsed[0] == 4:
+            values4.append(parsed[1])
+        else:
+            values6.append(parsed[1])
+    return versions, np.array(values4, dtype=np.uint64), np.array(values6, dtype=object)
+
+
+def build_blocklist_index(file,offset=0):
+    return BlocklistIndex(read_ip_ranges(file,offset))
+
+
+def get_matching_entries(candidates,index):
+    # CIDR-aware replacement of get_shared_entries: candidates contained in any range of the index
+    if not isinstance(index, BlocklistIndex):
+        index = BlocklistIndex(index)
+    candidates = list(dict.fromkeys(candidates))
+    hits = index.contains(candidates)
+    return [ip for ip, hit in zip(candidates, hits) if hit]
+
+
+###################### BLOCKLIST FEED LOADER ######################
+
+BLOCKLIST_FORMATS = ('ipset', 'netset', 'hosts', 'domains')
+HOSTS_FILE_SINKS = {'0.0.0.0', '127.0.0.1', '::', '::1'}
+BLOCKLIST_CACHE_DIR = '.blocklist_cache'
+
+
+def blocklist_lines(text):
+    # non-empty lines with comments stripped, wherever the '#' appears
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield line
+
+
+def detect_blocklist_format(text,sample=200):
+    # FireHOL feeds declare themselves in the header ('# ipv4 hash:net ipset')
+    for line in text[:4096].splitlines():
+        if line.startswith('#') and 'hash:net' in line:
+            return 'netset'
+        if line.startswith('#') and 'hash:ip' in line:
+            return 'ipset'
+
+    votes = dict.fromkeys(BLOCKLIST_FORMATS, 0)
+    for i, line in enumerate(blocklist_lines(text)):
+        if i >= sample:
+            break
+        tokens = line.split()
+        if len(tokens) >= 2 and tokens[0] in HOSTS_FILE_SINKS:
+            votes['hosts'] += 1
+        elif parse_ip_range(tokens[0]) is None:
+            votes['domains'] += 1
+        elif '/' in tokens[0] or '-' in tokens[0]:
+            votes['netset'] += 1
+        else:
+            votes['ipset'] += 1
+    # any range makes an address list a netset
+    if votes['netset'] and votes['netset'] + votes['ipset'] >= votes['domains']:
+        return 'netset'
+    return max(votes, key=votes.get)
+
+
+class BlocklistFeed:
+    """
+    A parsed blocklist file: integer address ranges for ipset/netset feeds,
+    lower-cased names for hosts/domain lists.
+    """
+
+    def __init__(self, fmt, starts4, ends4, starts6=(), ends6=(), domains=(), n_invalid=0):
+        self.format = fmt
+        self.starts4 = starts4
+        self.ends4 = ends4
+        self.starts6 = list(starts6)
+        self.ends6 = list(ends6)
+        self.domains = list(domains)
+        self.n_invalid = n_invalid
+
+    def __len__(self):
+        return len(self.starts4) + len(self.starts6) + len(self.domains)
+
+    def to_index(self):
+        return BlocklistIndex(self)
+
+
+def parse_blocklist(text,fmt=None):
+    fmt = fmt or detect_blocklist_format(text)
+    if fmt not in BLOCKLIST_FORMATS:
+        raise ValueError(f"unknown blocklist format: {fmt}")
+
+    if fmt in ('hosts', 'domains'):
+        domains = []
+        for line in blocklist_lines(text):
+            tokens = line.split()
+            names = tokens[1:] if fmt == 'hosts' and tokens[0] in HOSTS_FILE_SINKS else tokens[:1]
+            domains.extend(name.lower() for name in names)
+        empty = np.zeros(0, dtype=np.uint64)
+        return BlocklistFeed(fmt, empty, empty, domains=domains)
+
+    starts4, ends4, starts6, ends6 = [], [], [], []
+    n_invalid = 0
+    inet_pton = socket.inet_pton
+    for line in blocklist_lines(text):
+        entry = line.split()[0]
+        try:
+            # plain ipv4 is by far the most common entry
+            value = int.from_bytes(inet_pton(socket.AF_INET, entry), 'big')
+            starts4.append(value)
+            ends4.append(value)
+            continue
+        except OSError:
+            pass
+        parsed = parse_ip_range(entry)
+        if parsed is None:
+            n_invalid += 1
+        elif parsed[0] == 4:
+            starts4.append(parsed[1])
+            ends4.append(parsed[2])
+        else:
+            starts6.append(parsed[1])
+            ends6.append(parsed[2])
+    return BlocklistFeed(fmt, np.array(starts4, dtype=np.uint64), np.array(ends4, dtype=np.uint64),
+                         starts6, ends6, n_invalid=n_invalid)
+
+
+def blocklist_cache_path(file):
+    return os.path.join(os.path.dirname(file), BLOCKLIST_CACHE_DIR, os.path.basename(file) + '.npz')
+
+
+def _split_u128(values):
+    # ipv6 ints -> (high, low) uint64 halves, so the sidecar needs no pickling
+    hi = np.array([v >> 64 for v in values], dtype=np.uint64)
+    lo = np.array([v & 0xFFFFFFFFFFFFFFFF for v in values], dtype=np.uint64)
+    return hi, lo
+
+
+def _join_u128(hi, lo):
+    return [(int(h) << 64) | int(l) for h, l in zip(hi, lo)]
+
+
+def _save_blocklist_cache(path, feed, stat, digest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    starts6_hi, starts6_lo = _split_u128(feed.starts6)
+    ends6_hi, ends6_lo = _split_u128(feed.ends6)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, format=np.array(feed.format), mtime_ns=np.int64(stat.st_mtime_ns), size=np.int64(stat.st_size),
+             sha1=np.array(digest), n_invalid=np.int64(feed.n_invalid), starts4=feed.starts4, ends4=feed.ends4,
+             starts6_hi=starts6_hi, starts6_lo=starts6_lo, ends6_hi=ends6_hi, ends6_lo=ends6_lo,
+             domains=np.array(feed.domains, dtype=str))
+    os.replace(tmp, path)
+
+
+def _load_blocklist_cache(data):
+    return BlocklistFeed(str(data['format']), data['starts4'], data['ends4'],
+                         _join_u128(data['starts6_hi'], data['starts6_lo']),
+                         _join_u128(data['ends6_hi'], data['ends6_lo']),
+                         data['domains'].tolist(), int(data['n_invalid']))
+
+
+def load_blocklist(file,fmt=None,cache=True):
+    """
+    Loads an ipset / netset / hosts / plain-domain feed without a header
+    offset. The parsed arrays are cached in a .npz sidecar; it is reused while
+    the file's mtime and size match, or its sha1 does after a touch/copy.
+    """
+    stat = os.stat(file)
+    path = blocklist_cache_path(file)
+    digest = None
+    if cache and os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                fresh = int(data['mtime_ns']) == stat.st_mtime_ns and int(data['size']) == stat.st_size
+                if not fresh and int(data['size']) == stat.st_size:
+                    with open(file, 'rb') as f:
+                        digest = hashlib.sha1(f.read()).hexdigest()
+                    fresh = digest == str(data['sha1'])
+                if fresh and (fmt is None or fmt == str(data['format'])):
+                    feed = _load_blocklist_cache(data)
+                    if int(data['mtime_ns']) != stat.st_mtime_ns:
+                        _save_blocklist_cache(path, feed, stat, digest)
+                    return feed
+        except (OSError, KeyError, ValueError):
+            pass
+
+    with open(file, 'rb') as f:
+        raw = f.read()
+    feed = parse_blocklist(raw.decode('utf-8', errors='replace'), fmt)
+    if cache:
+        _save_blocklist_cache(path, feed, stat, hashlib.sha1(raw).hexdigest())
+    return feed
+
+
+###################### DOMAIN SUFFIX MATCHING ######################
+
+# Multi-label public suffixes common in the pharmacy lists; every single
+# label (com, net, ru, ...) is a public suffix anyway (the PSL '*' rule).
+# load_public_suffix_list() reads the full publicsuffix.org list instead.
+# This short list is only good enough to reject listed suffixes, not to
+# find registrable domains (a suffix it lacks, e.g. blogspot.com, would
+# make every site under it share one registrable domain).
+DEFAULT_PUBLIC_SUFFIXES = (
+    'co.uk', 'org.uk', 'me.uk', 'ac.uk', 'gov.uk', 'com.au', 'net.au', 'org.au',
+    'co.nz', 'co.in', 'net.in', 'org.in', 'co.za', 'co.jp', 'ne.jp', 'or.jp',
+    'com.br', 'net.br', 'com.cn', 'net.cn', 'org.cn', 'com.hk', 'com.tw', 'com.sg',
+    'com.my', 'com.mx', 'com.ar', 'com.co', 'com.tr', 'com.ua', 'org.ua', 'com.ru',
+    'com.pl', 'co.il', 'co.kr', 'com.ph', 'com.vn', 'com.pk', 'com.ng', 'com.es',
+    'com.de', 'co.com', 'eu.com', 'us.com', 'uk.com',
+)
+
+
+def normalize_domain(name):
+    # 'https://WWW.Shop.com:443/path' -> 'www.shop.com'; None if it isn't a domain
+    name = str(name).strip().lower()
+    if '://' in name:
+        name = name.split('://', 1)[1]
+    name = name.split('/', 1)[0].split('?', 1)[0].split('#', 1)[0]
+    name = name.rsplit('@', 1)[-1].split(':', 1)[0].strip('.')
+    if '.' not in name or any(c.isspace() for c in name) or ip_to_int(name) is not None:
+        return None
+    return name
+
+
+def domain_labels(name):
+    # reversed labels: 'a.shop.com' -> ['com', 'shop', 'a']
+    return name.split('.')[::-1]
+
+
+class PublicSuffixList:
+    """
+    Public suffix rules (exact, '*.' wildcard, '!' exception) held in a
+    reversed-label trie. registrable_domain() gives the eTLD+1 of a name.
+    complete marks the full publicsuffix.org list (see DomainMatcher).
+    """
+
+    def __init__(self, rules=DEFAULT_PUBLIC_SUFFIXES, complete=False):
+        self.complete = complete
+        self.root = {}
+        for rule in rules:
+            rule = rule.strip().lower()
+            if not rule or rule.startswith('//'):
+                continue
+            exception = rule.startswith('!')
+            node = self.root
+            for label in domain_labels(rule.lstrip('!')):
+                node = node.setdefault(label, {})
+            node['!' if exception else '$'] = True
+
+    def suffix_length(self, labels):
+        # number of (reversed) labels that form the public suffix, at least 1
+        length = 1
+        node = self.root
+        for i, label in enumerate(labels):
+            if '*' in node and label not in node:
+                length = max(length, i + 1)
+            node = node.get(label)
+            if node is None:
+                break
+            if '!' in node:
+                return i
+            if '$' in node:
+                length = max(length, i + 1)
+            if '*' in node and i + 1 < len(labels) and '!' not in node.get(labels[i + 1], {}):
+                length = max(length, i + 2)
+        return length
+
+    def is_public_suffix(self, name):
+        labels = domain_labels(name)
+        return self.suffix_length(labels) >= len(labels)
+
+    def registrable_domain(self, name):
+        labels = domain_labels(name)
+        n = self.suffix_length(labels) + 1
+        if n > len(labels):
+            return None
+        return '.'.join(labels[:n][::-1])
+
+
+def load_public_suffix_list(path):
+    # the publicsuffix.org public_suffix_list.dat format
+    with open(path, encoding='utf-8') as f:
+        return PublicSuffixList((line.split()[0] for line in f if line.strip() and not line.startswith('//')),
+                                complete=True)
+
+
+class DomainMatcher:
+    """
+    Domain blocklist as a trie of reversed labels.
+
+    One walk down the trie per candidate name finds a listed domain equal to
+    the name ('exact') or any listed parent of it ('subdomain'). With
+    registrable=True, names sharing a registrable domain with a listed entry
+    match as 'registrable' too; by default that is only on with a complete
+    public suffix list, since the built-in one would give false positives.
+    Entries that are public suffixes are rejected, so a listed 'co.uk'
+    can't match every British site.
+    """
+
+    def __init__(self, domains, psl=None, registrable=None):
+        self.psl = psl or PublicSuffixList()
+        self.match_registrable = self.psl.complete if registrable is None else registrable
+        self.root = {}
+        self.registrable = {}
+        self.n_entries = 0
+        self.n_invalid = 0
+        for domain in domains:
+            name = normalize_domain(domain)
+            if name is None or self.psl.is_public_suffix(name):
+                self.n_invalid += 1
+                continue
+            node = self.root
+            for label in domain_labels(name):
+                node = node.setdefault(label, {})
+            if '$' not in node:
+                node['$'] = name
+                self.n_entries += 1
+            self.registrable.setdefault(self.psl.registrable_domain(name), name)
+
+    def __len__(self):
+        return self.n_entries
+
+    def match(self, name):
+        # (kind, listed domain) for the closest listed match, or None
+        name = normalize_domain(name)
+        if name is None:
+            return None
+        labels = domain_labels(name)
+        node = self.root
+        parent = None
+        for label in labels:
+            node = node.get(label)
+            if node is None:
+                break
+            if '$' in node:
+                parent = node['$']
+        else:
+            if '$' in node:
+                return 'exact', node['$']
+        if parent is not None:
+            return 'subdomain', parent
+        if not self.match_registrable:
+            return None
+        listed = self.registrable.get(self.psl.registrable_domain(name))
+        if listed is not None:
+            return 'registrable', listed
+        return None
+
+    def __contains__(self, name):
+        return self.match(name) is not None
+
+    def match_many(self, names):
+        return [self.match(name) for name in names]
+
+    def match_hosts(self, hosts, kinds=('exact', 'subdomain', 'registrable')):
+        """
+        hosts: iterable of (host, names), e.g. iter_query_hits(pages).
+        Returns {host: (kind, listed domain, matching name)} for hosts with
+        any name matching one of `kinds`; exact beats subdomain beats
+        registrable.
+        """
+        rank = {kind: i for i, kind in enumerate(kinds)}
+        matches = {}
+        for host, names in hosts:
+            for name in names or ():
+                found = self.match(name)
+                if found is None or found[0] not in rank:
+                    continue
+                best = matches.get(host)
+                if best is None or rank[found[0]] < rank[best[0]]:
+                    matches[host] = (found[0], found[1], name)
+        return matches
+
+
+def build_domain_matcher(file,psl=None,registrable=None):
+    return DomainMatcher(load_blocklist(file, fmt='domains').domains, psl, registrable)
+
+
+###################### MULTI-LIST MEMBERSHIP ######################
+
+def blocklist_membership_matrix(candidates,blocklists):
+    """
+    Check one candidate list against many blocklists in a single pass.
+
+    blocklists is a dict of name -> BlocklistIndex (or a list of entries,
+    which is compiled on the fly). Candidates are parsed once and each list
+    only adds one searchsorted column. Returns (matrix, names) where matrix
+    is a (len(candidates), len(blocklists)) boolean array.
+    """
+    names = list(blocklists.keys())
+    parsed = parse_ip_array(list(candidates))
+    matrix = np.zeros((len(parsed[0]), len(names)), dtype=bool)
+    for j, name in enumerate(names):
+        index = blocklists[name]
+        if not isinstance(index, BlocklistIndex):
+            index = BlocklistIndex(index)
+        matrix[:, j] = index.contains_parsed(*parsed)
+    return matrix, names
+
+
+def detection_counts(matrix):
+    return matrix.sum(axis=0)
+
+
+def detection_rates(matrix):
+    if matrix.shape[0] == 0:
+        return np.zeros(matrix.shape[1])
+    return matrix.sum(axis=0) / matrix.shape[0]
+
+
+def blocklist_overlap(matrix):
+    # (lists x lists) number of candidates flagged by both lists
+    m = matrix.astype(np.int64)
+    return m.T @ m
+
+
+def hits_by_host(candidates,matrix,names):
+    # host -> names of the lists that flag it (only hosts with at least one hit)
+    names = np.asarray(names)
+    rows = np.flatnonzero(matrix.any(axis=1))
+    candidates = list(candidates)
+    return {candidates[i]: list(names[matrix[i]]) for i in rows}
+
+
+###################### ASYNC DNS RESOLUTION ######################
+
+DNS_TYPE_A = 1
+DNS_TYPE_AAAA = 28
+DNS_RCODE_NOERROR = 0
+DNS_RCODE_NXDOMAIN = 3
+
+
+def default_nameserver():
+    # first nameserver in resolv.conf, falls back to a public resolver
+    try:
+        with open('/etc/resolv.conf') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    return parts[1]
+    except OSError:
+        pass
+    return '8.8.8.8'
+
+
+def build_dns_query(qid,domain,qtype):
+    header = struct.pack('>HHHHHH', qid, 0x0100, 1, 0, 0, 0)
+    qname = b''
+    for label in domain.strip('.').split('.'):
+        label = label.encode('idna')
+        qname += bytes([len(label)]) + label
+    return header + qname + b'\x00' + struct.pack('>HH', qtype, 1)
+
+
+def _skip_dns_name(msg,pos):
+    while True:
+        length = msg[pos]
+        if length & 0xC0 == 0xC0:
+            return pos + 2
+        if length == 0:
+            return pos + 1
+        pos += length + 1
+
+
+def parse_dns_response(msg):
+    """
+    Returns (qid, rcode, answers) where answers is a list of (ip, ttl)
+    for every A/AAAA record in the answer section.
+    """
+    qid, flags, qdcount, ancount, _, _ = struct.unpack('>HHHHHH', msg[:12])
+    rcode = flags & 0x000F
+    pos = 12
+    for _ in range(qdcount):
+        pos = _skip_dns_name(msg, pos) + 4
+
+    answers = []
+    for _ in range(ancount):
+        pos = _skip_dns_name(msg, pos)
+        rtype, _, ttl, rdlength = struct.unpack('>HHIH', msg[pos:pos + 10])
+        pos += 10
+        rdata = msg[pos:pos + rdlength]
+        pos += rdlength
+        if rtype == DNS_TYPE_A and rdlength == 4:
+            answers.append((socket.inet_ntop(socket.AF_INET, rdata), ttl))
+        elif rtype == DNS_TYPE_AAAA and rdlength == 16:
+            answers.append((socket.inet_ntop(socket.AF_INET6, rdata), ttl))
+    return qid, rcode, answers
+
+
+class DNSCache:
+    """
+    Persistent domain -> ips cache stored as JSON on disk.
+
+    Every entry keeps the absolute expiry time derived from the smallest
+    record TTL, so stale answers are re-resolved on the next run.
+    """
+
+    def __init__(self, path=None, min_ttl=60, negative_ttl=300):
+        self.path = path
+        self.min_ttl = min_ttl
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, domain):
+        entry = self.entries.get(domain)
+        if entry is None or entry['expires'] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['ips']
+
+    def put(self, domain, ips, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl
+        self.entries[domain] = {'ips': ips, 'expires': time.time() + max(ttl, self.min_ttl)}
+
+    def save(self):
+        if self.path is None:
+            return
+        now = time.time()
+        live = {k: v for k, v in self.entries.items() if v['expires'] >= now}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(live, f)
+        os.replace(tmp, self.path)
+
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self):
+        self.pending = {}
+
+    def datagram_received(self, data, addr):
+        try:
+            qid = struct.unpack('>H', data[:2])[0]
+        except struct.error:
+            return
+        future = self.pending.pop(qid, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+
+class AsyncResolver:
+    """
+    Bulk A/AAAA resolver over a single UDP socket.
+
+    At most `concurrency` queries are in flight, each attempt waits at most
+    `timeout` seconds and is retried `retries` times; socket errors and
+    malformed replies are retried like timeouts. Answers are cached in a
+    DNSCache honouring the record TTLs, NXDOMAIN is cached negatively and
+    failures are not cached. Point `nameserver`/`port` at a local stub
+    server to run it offline.
+    """
+
+    def __init__(self, nameserver=None, port=53, concurrency=200, timeout=2.0, retries=2,
+                 qtypes=(DNS_TYPE_A, DNS_TYPE_AAAA), cache_file=None, cache=None):
+        self.nameserver = nameserver or default_nameserver()
+        self.port = port
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.qtypes = qtypes
+        self.cache = cache if cache is not None else DNSCache(cache_file)
+
+    async def _query(self, transport, protocol, semaphore, domain, qtype):
+        # returns (rcode, answers), or None when every attempt timed out, hit a
+        # socket error (e.g. ICMP unreachable) or got an unparseable reply
+        loop = asyncio.get_running_loop()
+        try:
+            query = build_dns_query(0, domain, qtype)
+        except (UnicodeError, ValueError):
+            return None
+        async with semaphore:
+            for _ in range(self.retries + 1):
+                qid = random.randrange(1 << 16)
+                while qid in protocol.pending:
+                    qid = random.randrange(1 << 16)
+                future = loop.create_future()
+                protocol.pending[qid] = future
+                try:
+                    transport.sendto(struct.pack('>H', qid) + query[2:])
+                    data = await asyncio.wait_for(future, self.timeout)
+                    _, rcode, answers = parse_dns_response(data)
+                except (asyncio.TimeoutError, OSError, struct.error, IndexError, ValueError):
+                    protocol.pending.pop(qid, None)
+                    continue
+                return rcode, answers
+        return None
+
+    async def _resolve_one(self, transport, protocol, semaphore, domain):
+        results = await asyncio.gather(*[self._query(transport, protocol, semaphore, domain, qtype)
+                                         for qtype in self.qtypes])
+        ips = []
+        ttls = []
+        failed = False
+        nxdomain = False
+        for result in results:
+            # no reply or a server failure (SERVFAIL, REFUSED, ...) says nothing about the domain
+            if result is None or result[0] not in (DNS_RCODE_NOERROR, DNS_RCODE_NXDOMAIN):
+                failed = True
+                continue
+            nxdomain = nxdomain or result[0] == DNS_RCODE_NXDOMAIN
+            for ip, ttl in result[1]:
+                if ip not in ips:
+                    ips.append(ip)
+                ttls.append(ttl)
+        # failures are not cached; NXDOMAIN for any type means the name does not
+        # exist and is cached negatively even if the other type failed
+        if ips:
+            self.cache.put(domain, ips, min(ttls))
+        elif nxdomain or not failed:
+            self.cache.put(domain, [])
+        return domain, ips
+
+    async def resolve_many(self, domains):
+        results = {}
+        todo = []
+        for domain in dict.fromkeys(domains):
+            cached = self.cache.get(domain)
+            if cached is not None:
+                results[domain] = cached
+            else:
+                todo.append(domain)
+
+        if todo:
+            loop = asyncio.get_running_loop()
+            family = socket.AF_INET6 if ':' in self.nameserver else socket.AF_INET
+            transport, protocol = await loop.create_datagram_endpoint(
+                _DNSProtocol, remote_addr=(self.nameserver, self.port), family=family)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            try:
+                for domain, ips in await asyncio.gather(*[self._resolve_one(transport, protocol, semaphore, d)
+                                                          for d in todo]):
+                    results[domain] = ips
+            finally:
+                transport.close()
+
+        self.cache.save()
+        return results
+
+    def resolve_all(self, domains):
+        return asyncio.run(self.resolve_many(domains))
+
+
+def write_dns_table(resolved,output_file):
+    # long format domain,ip table (domains without answers get an empty ip)
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['domain', 'ip'])
+        for domain, ips in resolved.items():
+            for ip in ips or ['']:
+                writer.writerow([domain, ip])
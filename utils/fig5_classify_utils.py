@@ -0,0 +1,755 @@
+import os
+import re
+import json
+import time
+import hashlib
+import importlib
+import queue
+import threading
+import concurrent.futures
+import numpy as np
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+try:
+    from utils.censys_utils import TokenBucket
+except ImportError:
+    from censys_utils import TokenBucket
+
+
+###################### PROMPTS ######################
+
+SYSTEM_MSG = {
+  "role": "system",
+  "content": (
+    "You are a JSON‑only API. ALL responses must be a single valid JSON object—"
+    "do not wrap it in markdown, code fences, or any additional text."
+  )
+}
+
+SNIPPET_CHARS = 3000
+
+
+def build_user_msg(host,title,snippet):
+    return {
+      "role": "user",
+      "content": (
+        "Classify this site as Illicit Online Pharmacy or not using exactly this JSON schema:\n"
+        "{\n"
+        '  "is_pharmacy": boolean,\n'
+        '  "confidence": number,\n'
+        '  "reason": string\n'
+        "}\n\n"
+        f"Host: {host}\nTitle: {title}\nSnippet: {snippet}"
+      )
+    }
+
+
+def build_batch_msg(recs):
+    sites = [{"host": r["host"], "title": r["html_title"], "snippet": r["body_snippet"]} for r in recs]
+    return {
+      "role": "user",
+      "content": (
+        "Classify each site below as Illicit Online Pharmacy or not. Answer with a JSON object "
+        '{"results": [...]} holding exactly one item per site, using this schema for each item:\n'
+        "{\n"
+        '  "host": string,\n'
+        '  "is_pharmacy": boolean,\n'
+        '  "confidence": number,\n'
+        '  "reason": string\n'
+        "}\n\n"
+        f"Sites:\n{json.dumps(sites, ensure_ascii=False)}"
+      )
+    }
+
+
+def parse_classification(host,content):
+    try:
+        result = json.loads(content)
+    except json.JSONDecodeError:
+        print(f"[JSON PARSE ERROR] {host}: {repr(content)}")
+        result = {"is_pharmacy": False, "confidence": 0.0, "reason": "invalid JSON"}
+    return {
+        "is_pharmacy": result.get("is_pharmacy", False),
+        "confidence": result.get("confidence", 0.0),
+        "reason": result.get("reason", ""),
+    }
+
+
+def validate_batch_item(item):
+    return (isinstance(item, dict)
+            and isinstance(item.get("host"), str)
+            and isinstance(item.get("is_pharmacy"), bool)
+            and isinstance(item.get("confidence"), (int, float))
+            and isinstance(item.get("reason", ""), str))
+
+
+def parse_batch_classification(content):
+    # host -> result for every valid item; invalid or missing hosts are left out
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        print(f"[JSON PARSE ERROR] batch: {repr(content[:200])}")
+        return {}
+    items = data.get("results", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return {}
+    results = {}
+    for item in items:
+        if validate_batch_item(item):
+            results[item["host"]] = {
+                "is_pharmacy": item["is_pharmacy"],
+                "confidence": float(item["confidence"]),
+                "reason": item.get("reason", ""),
+            }
+    return results
+
+
+###################### STAGES ######################
+
+def extract_http_response(rec):
+    # title and body of the first service with an http response
+    for svc in rec.get("services", []):
+        http = svc.get("http")
+        if http and http.get("response"):
+            resp = http["response"]
+            return resp.get("html_title", "") or "", resp.get("body", "") or ""
+    return "", ""
+
+
+###################### HTML TO TEXT ######################
+# All extractors return the visible text pieces (stripped, empty ones
+# dropped, <script>/<style> skipped) joined by newlines and cut at `limit`
+# characters, i.e. the same snippet as BeautifulSoup.get_text("\n", strip=True).
+
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+
+def _join_limited(pieces,limit):
+    # joins stripped text pieces, stops pulling from the iterator once limit is filled
+    out = []
+    size = 0
+    for piece in pieces:
+        piece = piece.strip()
+        if not piece:
+            continue
+        out.append(piece)
+        size += len(piece) + 1
+        if limit is not None and size >= limit:
+            break
+    text = "\n".join(out)
+    return text[:limit] if limit is not None else text
+
+
+def extract_text_bs4(body,limit=SNIPPET_CHARS):
+    # reference implementation (full parse, then truncate)
+    soup = BeautifulSoup(body, "html.parser")
+    for tag in soup(list(SKIPPED_TAGS)):
+        tag.decompose()
+    text = soup.get_text(separator="\n", strip=True)
+    return text[:limit] if limit is not None else text
+
+
+class _StreamingTextParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.size = 0
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            data = data.strip()
+            if data:
+                self.pieces.append(data)
+                self.size += len(data) + 1
+
+
+def extract_text_stream(body,limit=SNIPPET_CHARS,chunk_size=16384):
+    # stdlib tokenizer fed in chunks, stops as soon as the snippet budget is filled
+    parser = _StreamingTextParser()
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+        if limit is not None and parser.size >= limit:
+            break
+    else:
+        parser.close()
+    return _join_limited(parser.pieces, limit)
+
+
+def extract_text_lxml(body,limit=SNIPPET_CHARS):
+    import lxml.html
+    from lxml import etree
+    if not body.strip():
+        return ""
+    try:
+        root = lxml.html.document_fromstring(body)
+    except (etree.ParserError, ValueError):
+        return extract_text_stream(body, limit)
+    etree.strip_elements(root, *SKIPPED_TAGS, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+    return _join_limited(root.itertext(), limit)
+
+
+def extract_text_selectolax(body,limit=SNIPPET_CHARS):
+    try:
+        from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+    except ImportError:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    tree = SelectolaxParser(body)
+    tree.strip_tags(list(SKIPPED_TAGS))
+    root = tree.root
+    if root is None:
+        return ""
+    return _join_limited(root.text(deep=True, separator="\n").split("\n"), limit)
+
+
+HTML_EXTRACTORS = {
+    "selectolax": extract_text_selectolax,
+    "lxml": extract_text_lxml,
+    "stream": extract_text_stream,
+    "bs4": extract_text_bs4,
+}
+
+
+# bodies longer than this many times the snippet budget are cheaper to
+# tokenize up to the budget than to parse whole, even with selectolax / lxml
+STREAM_BODY_RATIO = 64
+
+
+def fastest_html_parser():
+    # selectolax, then lxml; None when neither is installed
+    for name, module in (("selectolax", "selectolax.lexbor"), ("lxml", "lxml.html")):
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        return HTML_EXTRACTORS[name]
+    return None
+
+
+def get_html_extractor(backend="auto",limit=SNIPPET_CHARS):
+    """
+    "auto" uses the fastest installed full-document parser (selectolax, then
+    lxml) and only hands bodies longer than STREAM_BODY_RATIO x limit to the
+    early-exit stdlib stream, which then only tokenizes the head. Without
+    either parser it is the stream for everything.
+    """
+    if backend != "auto":
+        return HTML_EXTRACTORS[backend]
+    parser = fastest_html_parser()
+    if parser is None:
+        return extract_text_stream
+    if limit is None:
+        return parser
+
+    def extract_text_auto(body, limit=limit):
+        if limit is not None and len(body) > STREAM_BODY_RATIO * limit:
+            return extract_text_stream(body, limit)
+        return parser(body, limit)
+    return extract_text_auto
+
+
+HTML_BACKEND = os.getenv("HTML_EXTRACTOR", "auto")
+
+
+def html_to_text(body,limit=SNIPPET_CHARS,backend=None):
+    return get_html_extractor(backend or HTML_BACKEND, limit)(body or "", limit)
+
+
+def fetch_host(api,host,limit=SNIPPET_CHARS):
+    rec = api.view(host)
+    title, body = extract_http_response(rec)
+    return {"host": host, "html_title": title, "body_snippet": html_to_text(body, limit)}
+
+
+def classify_host(client,host,title,snippet,model="gpt-4o-mini"):
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[SYSTEM_MSG, build_user_msg(host, title, snippet)],
+        temperature=0.0,
+        max_tokens=150,
+        logit_bias={123: 10},
+    )
+    content = resp.choices[0].message.content.strip()
+    return parse_classification(host, content)
+
+
+def classify_batch(client,recs,model="gpt-4o-mini"):
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[SYSTEM_MSG, build_batch_msg(recs)],
+        temperature=0.0,
+        max_tokens=BATCH_TOKENS_PER_ITEM * len(recs),
+        response_format={"type": "json_object"},
+    )
+    content = resp.choices[0].message.content.strip()
+    results = parse_batch_classification(content)
+    hosts = {r["host"] for r in recs}
+    return {h: r for h, r in results.items() if h in hosts}
+
+
+###################### BATCHING ######################
+
+BATCH_TOKENS_PER_ITEM = 80    # completion tokens reserved per site in a batch
+PROMPT_TOKENS_OVERHEAD = 150  # system prompt + batch instructions
+
+
+def estimate_tokens(text):
+    # rough 4 characters per token estimate, good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def rec_tokens(rec):
+    return (estimate_tokens(rec["host"]) + estimate_tokens(rec["html_title"])
+            + estimate_tokens(rec["body_snippet"]) + BATCH_TOKENS_PER_ITEM)
+
+
+class SnippetBatcher:
+    """
+    Thread-safe greedy packer: hands a batch to `submit` once adding the
+    next snippet would exceed token_budget or max_batch sites, so the batch
+    size adapts to snippet sizes.
+    """
+
+    def __init__(self, submit, token_budget=8000, max_batch=20):
+        self.submit = submit
+        self.token_budget = token_budget
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.batch = []
+        self.used = PROMPT_TOKENS_OVERHEAD
+
+    def add(self, rec):
+        cost = rec_tokens(rec)
+        ready = None
+        with self.lock:
+            if self.batch and (self.used + cost > self.token_budget or len(self.batch) >= self.max_batch):
+                ready = self.batch
+                self.batch = []
+                self.used = PROMPT_TOKENS_OVERHEAD
+            self.batch.append(rec)
+            self.used += cost
+        if ready:
+            self.submit(ready)
+
+    def flush(self):
+        with self.lock:
+            ready = self.batch
+            self.batch = []
+            self.used = PROMPT_TOKENS_OVERHEAD
+        if ready:
+            self.submit(ready)
+
+
+###################### CONTENT DEDUPLICATION ######################
+
+def normalize_content(title,text):
+    # case, whitespace and digit runs (prices, ids, dates) do not change the verdict
+    content = (title + "\n" + text).lower()
+    content = re.sub(r"\d+", "0", content)
+    return re.sub(r"\s+", " ", content).strip()
+
+
+def content_hash(title,text):
+    return hashlib.sha1(normalize_content(title, text).encode("utf-8")).hexdigest()
+
+
+def simhash(text,shingle=3):
+    # 64-bit SimHash over word shingles
+    words = text.split()
+    if len(words) < shingle:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+                       for s in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.byteswap().view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int("".join("1" if v else "0" for v in votes), 2)
+
+
+class ContentDeduper:
+    """
+    Groups hosts whose extracted content is identical (normalized hash) or,
+    with near_duplicates=True, within max_distance bits of SimHash.
+
+    The first host of a group is the leader and is classified; every other
+    host is a follower and receives the leader's verdict through resolve().
+    SimHash lookups split the 64 bits into max_distance + 1 bands, so any
+    fingerprint within max_distance shares at least one band with its match.
+    """
+
+    def __init__(self, near_duplicates=False, max_distance=3):
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.n_bands = max_distance + 1
+        self.lock = threading.Lock()
+        self.leaders = {}      # content key -> leader host
+        self.followers = {}    # leader host -> follower hosts
+        self.verdicts = {}     # leader host -> (status, fields) once resolved
+        self.bands = {}        # (band, value) -> [(fingerprint, content key)]
+        self.n_hosts = 0
+
+    def _band_keys(self, fingerprint):
+        width = 64 // self.n_bands
+        mask = (1 << width) - 1
+        return [(i, (fingerprint >> (i * width)) & mask) for i in range(self.n_bands)]
+
+    def _near_key(self, normalized):
+        fingerprint = simhash(normalized)
+        for band in self._band_keys(fingerprint):
+            for other, key in self.bands.get(band, []):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return key, fingerprint
+        return None, fingerprint
+
+    def add(self, rec):
+        """
+        Returns ("leader", None), ("follower", leader) or
+        ("resolved", (leader, status, fields)) when the group already has a verdict.
+        """
+        normalized = normalize_content(rec["html_title"], rec["body_snippet"])
+        key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        with self.lock:
+            self.n_hosts += 1
+            if key not in self.leaders and self.near_duplicates:
+                near_key, fingerprint = self._near_key(normalized)
+                if near_key is not None:
+                    key = near_key
+                else:
+                    for band in self._band_keys(fingerprint):
+                        self.bands.setdefault(band, []).append((fingerprint, key))
+            leader = self.leaders.get(key)
+            if leader is None:
+                self.leaders[key] = rec["host"]
+                self.followers[rec["host"]] = []
+                return "leader", None
+            if leader in self.verdicts:
+                return "resolved", (leader,) + self.verdicts[leader]
+            self.followers[leader].append(rec["host"])
+            return "follower", leader
+
+    def resolve(self, leader, status, fields):
+        # stores the leader's verdict and returns the followers waiting for it
+        with self.lock:
+            self.verdicts[leader] = (status, fields)
+            waiting = self.followers.get(leader, [])
+            self.followers[leader] = []
+            return waiting
+
+    def stats(self):
+        n_unique = len(self.leaders)
+        return {
+            "hosts": self.n_hosts,
+            "unique": n_unique,
+            "dedup_ratio": 1 - n_unique / self.n_hosts if self.n_hosts else 0.0,
+        }
+
+
+###################### MOCK LLM BACKEND ######################
+
+MOCK_PHARMACY_TERMS = [
+    "pharmacy", "prescription", "viagra", "cialis", "xanax", "tramadol", "valium",
+    "oxycodone", "adderall", "pills", "meds", "rx",
+]
+
+
+class MockLLMClient:
+    """
+    Deterministic stand-in for the OpenAI client (client.chat.completions.create).
+
+    Sites are labelled from pharmacy vocabulary in their title/snippet, so
+    the same prompt always gets the same answer. With drop_every=n every
+    n-th site of a batch is left out of the answer to exercise re-queueing.
+    """
+
+    def __init__(self, drop_every=None):
+        self.drop_every = drop_every
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = self
+        self.completions = self
+
+    @staticmethod
+    def _judge(host, text):
+        text = text.lower()
+        hits = sorted({t for t in MOCK_PHARMACY_TERMS if t in text})
+        return {
+            "host": host,
+            "is_pharmacy": len(hits) >= 2,
+            "confidence": min(1.0, 0.5 + 0.1 * len(hits)),
+            "reason": "terms: " + ", ".join(hits) if hits else "no pharmacy terms",
+        }
+
+    def create(self, model=None, messages=None, **kwargs):
+        from types import SimpleNamespace
+        with self.lock:
+            self.calls += 1
+        content = messages[-1]["content"]
+        if "\nSites:\n" in content:
+            sites = json.loads(content.split("\nSites:\n", 1)[1])
+            items = [self._judge(site["host"], site["title"] + " " + site["snippet"])
+                     for i, site in enumerate(sites)
+                     if not (self.drop_every and (i + 1) % self.drop_every == 0)]
+            answer = json.dumps({"results": items})
+        else:
+            host = content.split("Host: ", 1)[1].split("\n", 1)[0]
+            result = self._judge(host, content.split("Title: ", 1)[1])
+            del result["host"]
+            answer = json.dumps(result)
+        message = SimpleNamespace(content=answer)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+###################### CHECKPOINT JOURNAL ######################
+
+STATUS_FETCHED = "fetched"
+STATUS_CLASSIFIED = "classified"
+STATUS_FAILED = "failed"
+
+
+class ResultJournal:
+    """
+    Append-only JSONL checkpoint journal of per-host status.
+
+    Every line is one event {"host", "status", "ts", ...} with status
+    fetched, classified or failed (plus "stage" and "error"). Lines are
+    flushed and fsynced as they are written, so a crash loses at most the
+    host in flight and a restart can pick up from load_journal_state().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        truncated = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                truncated = f.read(1) != b'\n'
+        self.f = open(path, 'a', encoding='utf-8')
+        if truncated:
+            # end the half-written line of a crashed run so the next record is not glued to it
+            self.f.write('\n')
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.f.write(line + '\n')
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def record(self, host, status, **fields):
+        self.append({"host": host, "status": status, "ts": time.time(), **fields})
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_journal(path):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # last line of a crashed run may be truncated
+                continue
+    return records
+
+
+def load_journal_state(path):
+    # host -> all fields seen for it, merged in journal order (status is the latest one)
+    state = {}
+    for rec in read_journal(path):
+        state.setdefault(rec["host"], {}).update(rec)
+    return state
+
+
+def call_with_retries(fn,retries=3,backoff=2.0):
+    # retries fn with exponential backoff (backoff, 2*backoff, ...), re-raises the last error
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+###################### PIPELINE ######################
+
+def run_classification_pipeline(hosts,api,client,journal_path,censys_rate=1.0,llm_rate=5.0,
+                                fetch_workers=8,llm_workers=8,model="gpt-4o-mini",
+                                retries=3,backoff=2.0,batch_token_budget=None,max_batch=20,
+                                dedup=True,near_duplicates=False):
+    """
+    Fetch, extract, classify and journal every host, resuming from journal_path.
+
+    Censys fetches and LLM calls run in separate thread pools, each under its
+    own token bucket (requests per second), and are retried with exponential
+    backoff. Hosts already classified in the journal are skipped, hosts that
+    were fetched but not classified go straight to the LLM stage, and hosts
+    that failed in a previous run are retried. With batch_token_budget set,
+    snippets are packed into multi-site requests of up to that many tokens
+    (and max_batch sites); only the sites missing or invalid in an answer are
+    re-queued, and sites still unanswered after `retries` re-queues are sent
+    one per request. With dedup, hosts whose extracted content matches an
+    earlier host (exactly, or by SimHash with near_duplicates) are not sent
+    to the LLM but get that host's verdict. Returns the merged journal state.
+    """
+    censys_bucket = TokenBucket(censys_rate)
+    llm_bucket = TokenBucket(llm_rate)
+    results = queue.Queue()
+
+    state = load_journal_state(journal_path)
+    hosts = [h for h in dict.fromkeys(hosts) if state.get(h, {}).get("status") != STATUS_CLASSIFIED]
+    n_skipped = sum(1 for rec in state.values() if rec.get("status") == STATUS_CLASSIFIED)
+    print(f"[Journal] {n_skipped} hosts already classified, {len(hosts)} to go")
+
+    deduper = ContentDeduper(near_duplicates) if dedup else None
+
+    def finish(host, status, **fields):
+        # journals the verdict of host and fans it out to hosts with the same content
+        journal.record(host, status, **fields)
+        results.put(host)
+        if deduper is None:
+            return
+        for follower in deduper.resolve(host, status, fields):
+            journal.record(follower, status, dedup_of=host, **fields)
+            results.put(follower)
+
+    def fetch_stage(host):
+        def attempt():
+            censys_bucket.acquire()
+            return fetch_host(api, host)
+        rec = call_with_retries(attempt, retries, backoff)
+        journal.record(host, STATUS_FETCHED, html_title=rec["html_title"], body_snippet=rec["body_snippet"])
+        return rec
+
+    def classify_stage(rec):
+        def attempt():
+            llm_bucket.acquire()
+            return classify_host(client, rec["host"], rec["html_title"], rec["body_snippet"], model)
+        return call_with_retries(attempt, retries, backoff)
+
+    def classify_batch_stage(recs, attempt=0):
+        llm_bucket.acquire()
+        try:
+            answers = classify_batch(client, recs, model)
+            error = "missing or invalid item in batch answer"
+        except Exception as e:
+            answers = {}
+            error = str(e)
+        for rec in recs:
+            if rec["host"] in answers:
+                finish(rec["host"], STATUS_CLASSIFIED, **answers[rec["host"]])
+        requeue = [rec for rec in recs if rec["host"] not in answers]
+        if not requeue:
+            return
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+            llm_pool.submit(classify_batch_stage, requeue, attempt + 1)
+        else:
+            # still no valid batch answer: fall back to one request per site
+            print(f"[OpenAI] batch failed for {len(requeue)} sites ({error}), classifying them one by one")
+            for rec in requeue:
+                host = rec["host"]
+                llm_pool.submit(classify_stage, rec).add_done_callback(lambda f, h=host: on_classified(h, f))
+
+    def on_classified(host, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"[OpenAI ERROR] {host}: {e}")
+            finish(host, STATUS_FAILED, stage="classify", error=str(e))
+        else:
+            finish(host, STATUS_CLASSIFIED, **result)
+
+    def submit_classify(rec):
+        if deduper is not None:
+            role, info = deduper.add(rec)
+            if role == "follower":
+                return
+            if role == "resolved":
+                leader, status, fields = info
+                journal.record(rec["host"], status, dedup_of=leader, **fields)
+                results.put(rec["host"])
+                return
+        if batcher is not None:
+            batcher.add(rec)
+        else:
+            host = rec["host"]
+            llm_pool.submit(classify_stage, rec).add_done_callback(lambda f: on_classified(host, f))
+
+    def fetch_finished():
+        nonlocal pending_fetches
+        with fetch_lock:
+            pending_fetches -= 1
+            last = pending_fetches == 0
+        if last and batcher is not None:
+            batcher.flush()
+
+    def on_fetched(host, future):
+        try:
+            rec = future.result()
+        except Exception as e:
+            print(f"[Censys ERROR] {host}: {e}")
+            journal.record(host, STATUS_FAILED, stage="fetch", error=str(e))
+            results.put(host)
+        else:
+            submit_classify(rec)
+        fetch_finished()
+
+    with concurrent.futures.ThreadPoolExecutor(fetch_workers) as fetch_pool, \
+         concurrent.futures.ThreadPoolExecutor(llm_workers) as llm_pool, \
+         ResultJournal(journal_path) as journal:
+        batcher = None
+        if batch_token_budget is not None:
+            batcher = SnippetBatcher(lambda recs: llm_pool.submit(classify_batch_stage, recs),
+                                     batch_token_budget, max_batch)
+
+        to_fetch = []
+        for host in hosts:
+            prev = state.get(host, {})
+            if "body_snippet" in prev:
+                # fetched in an earlier run: reuse the snippet
+                submit_classify({"host": host, "html_title": prev.get("html_title", ""),
+                                 "body_snippet": prev["body_snippet"]})
+            else:
+                to_fetch.append(host)
+
+        fetch_lock = threading.Lock()
+        pending_fetches = len(to_fetch) + 1
+        for host in to_fetch:
+            fetch_pool.submit(fetch_stage, host).add_done_callback(lambda f, h=host: on_fetched(h, f))
+        fetch_finished()
+
+        for n_done in range(1, len(hosts) + 1):
+            host = results.get()
+            print(f"[{n_done}/{len(hosts)}] {host}")
+
+    if deduper is not None:
+        stats = deduper.stats()
+        print(f"[Dedup] {stats['hosts']} hosts, {stats['unique']} unique bodies "
+              f"({stats['dedup_ratio']:.1%} of classification calls saved)")
+    return list(load_journal_state(journal_path).values())
@@ -0,0 +1,718 @@
+import os
+import re
+import json
+import unicodedata
+from collections import Counter, defaultdict, deque
+import numpy as np
+import pandas as pd
+
+
+###################### TEXT NORMALIZATION ######################
+
+# Look-alike letters used to dodge keyword filters, folded to ASCII after
+# lower-casing (only glyphs that look like the lower-case latin letter)
+HOMOGLYPHS = str.maketrans({
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "i", "ј": "j",
+    "ѕ": "s", "ѵ": "v", "ԁ": "d", "ɡ": "g", "ӏ": "l", "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+})
+LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i", "|": "l"}
+# a lone digit touching a letter (v1agra, 0xycodone, phentermin3; not 24hour or
+# 24/7) and a symbol inside a word (x@nax, pharm@cy, v!agra). Each branch starts
+# with its character class so the regex engine can skip ahead between candidates
+LEET_PATTERN = re.compile(r"[013457](?<![0-9].)(?![0-9])(?:(?<=[a-z].)|(?=[a-z]))"
+                          r"|[@$!|](?<=[a-z0-9].)(?=[a-z])")
+NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+INDEX_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# byte tables: every byte but [a-z0-9] becomes a separator
+_ALNUM = b"abcdefghijklmnopqrstuvwxyz0123456789"
+_SEPARATORS_TO_SPACE = bytes(c if c in _ALNUM else 32 for c in range(256))
+_SEPARATORS = bytes(c for c in range(256) if c not in _ALNUM)
+
+
+def _fold_non_ascii(match):
+    return COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", match.group().translate(HOMOGLYPHS)))
+
+
+def canonicalize(text,compact=False):
+    """
+    Canonical form for obfuscation-tolerant matching, in a few C-level passes:
+    lower-case, homoglyphs / accents / full-width forms to ASCII, leet digits
+    and symbols to letters, and every run of separators to one space
+    ("Rx-Meds" -> "rx meds", "V1@gra" -> "viagra"). With compact=True the
+    spaces are dropped too, so "xana x" and "v i a g r a" also meet their
+    keyword, at the price of matching across word boundaries.
+    """
+    text = (text or "").lower()
+    if not text.isascii():
+        text = NON_ASCII.sub(_fold_non_ascii, text)
+    text = LEET_PATTERN.sub(lambda m: LEET[m.group()], text)
+    raw = text.encode("ascii", "replace")
+    if compact:
+        return raw.translate(None, _SEPARATORS).decode()
+    return " ".join(raw.translate(_SEPARATORS_TO_SPACE).decode().split())
+
+
+def canonical_tokens(text):
+    return canonicalize(text).split()
+
+
+def query_form(keyword):
+    # what the server-side body search sees: case and separators don't matter,
+    # so "rx-meds" / "rx meds" / "RX Meds" are one query
+    return " ".join(INDEX_TOKEN_PATTERN.findall((keyword or "").lower())) or keyword
+
+
+def collapse_keywords(keywords,compact=False):
+    # canonical term -> the keyword variants that fold to it, in input order
+    groups = defaultdict(list)
+    for kw in dict.fromkeys(keywords):
+        groups[canonicalize(kw, compact) or kw].append(kw)
+    return dict(groups)
+
+
+###################### MULTI-PATTERN MATCHING ######################
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a keyword list.
+
+    One linear pass over a body reports every (possibly overlapping) keyword
+    occurrence with its offset, so scanning cost no longer grows with the
+    number of keywords. Matching is substring based like `kw in body`, and
+    case-insensitive by default. The C implementation from pyahocorasick is
+    used when installed, otherwise a pure-Python automaton.
+
+    With normalize=True (or "compact") keywords and bodies are both
+    canonicalize()d first, so obfuscated spellings collapse into one pattern
+    and match in the same pass; offsets then refer to the canonical text.
+    """
+
+    def __init__(self, keywords, case_insensitive=True, backend="auto", normalize=False):
+        self.case_insensitive = case_insensitive
+        self.normalize = normalize
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        # normalized pattern -> original keywords (several keywords can fold to the same pattern)
+        self.patterns = defaultdict(list)
+        for kw in self.keywords:
+            pattern = self._fold(kw)
+            if pattern:
+                self.patterns[pattern].append(kw)
+
+        self._automaton = None
+        if backend in ("auto", "pyahocorasick"):
+            try:
+                import ahocorasick
+                self._automaton = ahocorasick.Automaton()
+                for pattern in self.patterns:
+                    self._automaton.add_word(pattern, pattern)
+                self._automaton.make_automaton()
+            except ImportError:
+                if backend == "pyahocorasick":
+                    raise
+                self._automaton = None
+        if self._automaton is None:
+            self._build()
+
+    def _fold(self, text):
+        if self.normalize:
+            return canonicalize(text, compact=self.normalize == "compact")
+        return text.lower() if self.case_insensitive else text
+
+    def _build(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern in self.patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(pattern)
+
+        # breadth-first fail links; outputs of the fail state are inherited
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        # yields (start offset, normalized pattern) for every occurrence
+        text = self._fold(text or "")
+        if self._automaton is not None:
+            for end, pattern in self._automaton.iter(text):
+                yield end - len(pattern) + 1, pattern
+            return
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for pattern in out[state]:
+                    yield i - len(pattern) + 1, pattern
+
+    def find_all(self, text):
+        # keyword -> list of start offsets
+        offsets = defaultdict(list)
+        for start, pattern in self.iter_matches(text):
+            for kw in self.patterns[pattern]:
+                offsets[kw].append(start)
+        return dict(offsets)
+
+    def count(self, text):
+        # keyword -> number of occurrences
+        counts = Counter()
+        for _, pattern in self.iter_matches(text):
+            for kw in self.patterns[pattern]:
+                counts[kw] += 1
+        return counts
+
+    def present(self, text):
+        # set of keywords occurring at least once
+        found = set()
+        for _, pattern in self.iter_matches(text):
+            found.update(self.patterns[pattern])
+        return found
+
+    def scan_corpus(self, bodies):
+        """
+        Returns (document frequency, total occurrences) Counters over bodies,
+        i.e. how many bodies mention each keyword and how often overall.
+        """
+        doc_freq = Counter()
+        totals = Counter()
+        for body in bodies:
+            counts = self.count(body)
+            totals.update(counts)
+            doc_freq.update(counts.keys())
+        return doc_freq, totals
+
+
+###################### KEYWORD OVERLAP ######################
+
+def dense_host_ids(keyword_hosts):
+    # maps arbitrary host keys (ips or ids) to 0..H-1, returns (keyword -> id array, H)
+    ids = {}
+    dense = {}
+    for kw, hosts in keyword_hosts.items():
+        dense[kw] = np.fromiter((ids.setdefault(h, len(ids)) for h in hosts), dtype=np.int64)
+    return dense, len(ids)
+
+
+def keyword_host_matrix(keyword_hosts,keywords=None):
+    """
+    Sparse keywords x hosts 0/1 matrix (scipy CSR) for the given keywords
+    (default: all of keyword_hosts); keywords without results get empty rows.
+    """
+    from scipy import sparse
+    keywords = list(keyword_hosts) if keywords is None else list(keywords)
+    dense, n_hosts = dense_host_ids({kw: keyword_hosts.get(kw, ()) for kw in dict.fromkeys(keywords)})
+    rows = [np.full(len(dense[kw]), i, dtype=np.int64) for i, kw in enumerate(keywords)]
+    cols = [dense[kw] for kw in keywords]
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    data = np.ones(len(rows), dtype=np.int32)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(keywords), n_hosts))
+
+
+def keyword_bitsets(keyword_hosts,keywords=None):
+    # packed (keywords x ceil(hosts / 8)) uint8 bitsets, the no-scipy fallback
+    keywords = list(keyword_hosts) if keywords is None else list(keywords)
+    dense, n_hosts = dense_host_ids({kw: keyword_hosts.get(kw, ()) for kw in dict.fromkeys(keywords)})
+    bits = np.zeros((len(keywords), n_hosts), dtype=bool)
+    for i, kw in enumerate(keywords):
+        bits[i, dense[kw]] = True
+    return np.packbits(bits, axis=1), n_hosts
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def _bitset_overlap(packed):
+    # pairwise popcount(a & b) over 64-bit words, one row of the matrix at a time
+    pad = (-packed.shape[1]) % 8
+    words = np.ascontiguousarray(np.pad(packed, ((0, 0), (0, pad)))).view(np.uint64)
+    overlap = np.zeros((len(words), len(words)), dtype=np.int64)
+    for i in range(len(words)):
+        overlap[i] = _popcount_rows(words[i] & words)
+    return overlap
+
+
+def keyword_overlap(keyword_hosts,keywords=None):
+    """
+    Co-occurrence statistics of keyword result sets.
+
+    Returns a dict with
+      overlap: keywords x keywords DataFrame, hosts returned by both
+      jaccard: keywords x keywords DataFrame, |a & b| / |a | b|
+      unique:  Series, hosts returned by that keyword and no other keyword
+    The overlap matrix is a single sparse product M @ M.T (packed bitsets
+    when scipy is not installed).
+    """
+    keywords = list(keyword_hosts) if keywords is None else list(keywords)
+    # statistics over distinct keywords (a repeated keyword must not share hosts with itself)
+    distinct = list(dict.fromkeys(keywords))
+    try:
+        m = keyword_host_matrix(keyword_hosts, distinct)
+        overlap = (m @ m.T).toarray().astype(np.int64)
+        hosts_per_column = np.asarray(m.sum(axis=0)).ravel()
+        unique = np.asarray(m[:, hosts_per_column == 1].sum(axis=1)).ravel()
+    except ImportError:
+        packed, n_hosts = keyword_bitsets(keyword_hosts, distinct)
+        overlap = _bitset_overlap(packed)
+        bits = np.unpackbits(packed, axis=1, count=n_hosts).astype(bool)
+        unique = bits[:, bits.sum(axis=0) == 1].sum(axis=1)
+
+    pos = np.array([distinct.index(kw) for kw in keywords], dtype=np.int64) if keywords else np.zeros(0, dtype=np.int64)
+    overlap = overlap[np.ix_(pos, pos)]
+    unique = np.asarray(unique)[pos]
+
+    sizes = np.diag(overlap)
+    union = sizes[:, None] + sizes[None, :] - overlap
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaccard = np.where(union > 0, overlap / union, 0.0)
+
+    return {
+        "overlap": pd.DataFrame(overlap, index=keywords, columns=keywords),
+        "jaccard": pd.DataFrame(jaccard, index=keywords, columns=keywords),
+        "unique": pd.Series(unique, index=keywords),
+    }
+
+
+###################### INCREMENTAL COVERAGE SCORING ######################
+
+class CoverageIndex:
+    """
+    Keyword -> hosts index with incrementally maintained contribution scores.
+
+    Keywords are either baselines or candidates and can be added or removed
+    in any order; each update only touches the hosts of that keyword (and
+    the keywords sharing them). Scores kept per keyword:
+      marginal[kw]:  hosts of kw that no baseline keyword returns
+      exclusive[kw]: hosts of kw that no other keyword (baseline or not) returns
+    """
+
+    def __init__(self):
+        self.keyword_hosts = {}
+        self.baselines = set()
+        self.host_keywords = defaultdict(set)
+        self.baseline_count = Counter()
+        self.marginal = {}
+        self.exclusive = {}
+
+    def __contains__(self, keyword):
+        return keyword in self.keyword_hosts
+
+    def covered_hosts(self):
+        return set(self.host_keywords)
+
+    def baseline_hosts(self):
+        return {h for h, n in self.baseline_count.items() if n > 0}
+
+    def add_keyword(self, keyword, hosts, baseline=False):
+        if keyword in self.keyword_hosts:
+            self.remove_keyword(keyword)
+        hosts = set(hosts)
+        self.keyword_hosts[keyword] = hosts
+        self.marginal[keyword] = 0
+        self.exclusive[keyword] = 0
+        if baseline:
+            self.baselines.add(keyword)
+
+        for h in hosts:
+            others = self.host_keywords[h]
+            if len(others) == 1:
+                # the previous sole keyword loses this exclusive host
+                self.exclusive[next(iter(others))] -= 1
+            elif not others:
+                self.exclusive[keyword] += 1
+            others.add(keyword)
+
+            if baseline:
+                self.baseline_count[h] += 1
+                if self.baseline_count[h] == 1:
+                    # host is now covered by the baseline: no longer marginal for anyone
+                    for kw in others:
+                        if kw != keyword and kw not in self.baselines:
+                            self.marginal[kw] -= 1
+            elif self.baseline_count[h] == 0:
+                self.marginal[keyword] += 1
+
+    def remove_keyword(self, keyword):
+        hosts = self.keyword_hosts.pop(keyword)
+        baseline = keyword in self.baselines
+        self.baselines.discard(keyword)
+        for h in hosts:
+            others = self.host_keywords[h]
+            others.discard(keyword)
+            if len(others) == 1:
+                self.exclusive[next(iter(others))] += 1
+            elif not others:
+                del self.host_keywords[h]
+
+            if baseline:
+                self.baseline_count[h] -= 1
+                if self.baseline_count[h] == 0:
+                    del self.baseline_count[h]
+                    for kw in others:
+                        if kw not in self.baselines:
+                            self.marginal[kw] += 1
+        del self.marginal[keyword]
+        del self.exclusive[keyword]
+
+    def candidate_keywords(self):
+        return [kw for kw in self.keyword_hosts if kw not in self.baselines]
+
+    def greedy_cover(self, target=0.9, keywords=None, universe=None):
+        """
+        Greedy set cover: smallest (greedy) keyword subset reaching `target`
+        fraction of `universe` (default: every host covered by any keyword).
+        Returns a list of (keyword, new hosts, cumulative coverage fraction).
+        Uses lazy gain re-evaluation, since gains only shrink as hosts get covered.
+        """
+        import heapq
+        keywords = list(self.keyword_hosts) if keywords is None else list(keywords)
+        universe = self.covered_hosts() if universe is None else set(universe)
+        if not universe:
+            return []
+        heap = [(-len(self.keyword_hosts[kw] & universe), i, kw) for i, kw in enumerate(keywords)]
+        heapq.heapify(heap)
+        covered = set()
+        ranking = []
+        while heap and len(covered) < target * len(universe):
+            neg_gain, i, kw = heapq.heappop(heap)
+            gain = len((self.keyword_hosts[kw] & universe) - covered)
+            if gain == 0:
+                continue
+            if heap and gain < -heap[0][0]:
+                # stale estimate: push back with the real gain
+                heapq.heappush(heap, (-gain, i, kw))
+                continue
+            covered |= self.keyword_hosts[kw] & universe
+            ranking.append((kw, gain, len(covered) / len(universe)))
+        return ranking
+
+
+###################### STREAMING WORD FREQUENCIES ######################
+
+WORD_PATTERN = re.compile(r"\w[\w']+")
+
+
+def default_stopwords():
+    try:
+        from wordcloud import STOPWORDS
+        return {w.lower() for w in STOPWORDS}
+    except ImportError:
+        return set()
+
+
+def tokenize(text,stopwords=frozenset()):
+    # same tokens WordCloud.process_text counts: \w[\w']+, no trailing 's, no numbers, no stopwords
+    for word in WORD_PATTERN.findall(text or ""):
+        word = word.lower()
+        if word.endswith("'s"):
+            word = word[:-2]
+        if not word or word.isdigit() or word in stopwords:
+            continue
+        yield word
+
+
+class CountMinSketch:
+    """
+    depth x width counter array; estimates never undercount and overcount by
+    at most ~ total / width with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width=2 ** 20, depth=4, seed=0):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        # independent universal hashes ((a * h + b) mod p) mod width, one per row
+        rng = np.random.default_rng(seed)
+        self.a = [int(x) for x in rng.integers(1, self.PRIME, size=depth)]
+        self.b = [int(x) for x in rng.integers(0, self.PRIME, size=depth)]
+
+    PRIME = (1 << 61) - 1
+
+    def _cells(self, word):
+        h = hash(word) & 0xFFFFFFFFFFFFFFFF
+        return [((a * h + b) % self.PRIME) % self.width for a, b in zip(self.a, self.b)]
+
+    def add(self, word, count=1):
+        for row, col in enumerate(self._cells(word)):
+            self.table[row, col] += count
+
+    def estimate(self, word):
+        return int(min(self.table[row, col] for row, col in enumerate(self._cells(word))))
+
+
+class WordFrequencyCounter:
+    """
+    Streaming word counts for word clouds: bodies are consumed one at a time
+    and never concatenated.
+
+    By default counts are exact (one Counter entry per distinct word). With
+    top_k set, counts go to a Count-Min sketch and only the top_k heaviest
+    words are tracked, so memory stays bounded for very large corpora.
+    frequencies() feeds WordCloud.generate_from_frequencies directly.
+    """
+
+    def __init__(self, stopwords=None, top_k=None, sketch_width=2 ** 20, sketch_depth=4,
+                 normalize_plurals=True):
+        self.stopwords = default_stopwords() if stopwords is None else {w.lower() for w in stopwords}
+        self.top_k = top_k
+        self.normalize_plurals = normalize_plurals
+        self.n_docs = 0
+        self.n_tokens = 0
+        if top_k is None:
+            self.counts = Counter()
+            self.sketch = None
+        else:
+            self.counts = {}    # tracked heavy hitters -> sketch estimate
+            self.sketch = CountMinSketch(sketch_width, sketch_depth)
+
+    def update(self, text):
+        local = Counter(tokenize(text, self.stopwords))
+        self.n_docs += 1
+        self.n_tokens += sum(local.values())
+        if self.sketch is None:
+            self.counts.update(local)
+            return
+        for word, n in local.items():
+            self.sketch.add(word, n)
+            self.counts[word] = self.sketch.estimate(word)
+        if len(self.counts) > 2 * self.top_k:
+            self._prune()
+
+    def consume(self, texts):
+        for text in texts:
+            self.update(text)
+        return self
+
+    def _prune(self):
+        keep = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:self.top_k]
+        self.counts = dict(keep)
+
+    def frequencies(self, max_words=None):
+        if self.sketch is None:
+            counts = dict(self.counts)
+        else:
+            counts = {word: self.sketch.estimate(word) for word in self.counts}
+        if self.normalize_plurals:
+            # fold "pills" into "pill" when both occur, like WordCloud does
+            for word in list(counts):
+                if word.endswith("s") and not word.endswith("ss") and word[:-1] in counts:
+                    counts[word[:-1]] += counts.pop(word)
+        limit = max_words if max_words is not None else self.top_k
+        if limit is not None:
+            counts = dict(sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:limit])
+        return counts
+
+
+###################### LOCAL INVERTED INDEX ######################
+
+def index_tokens(text,leet=False):
+    # token stream for the index / phrase queries. Word tokens split on anything
+    # that isn't a letter or digit (so "rx-meds" is the phrase "rx meds");
+    # leet tokens are the canonical form, where v1agra / vi@gra / viagra meet
+    if leet:
+        return canonical_tokens(text)
+    return INDEX_TOKEN_PATTERN.findall((text or "").lower())
+
+
+class PostingsList:
+    """
+    Positional postings of one token stream in CSR form: for term id t,
+    docs[offsets[t]:offsets[t + 1]] / positions[...] are its occurrences,
+    sorted by (doc, position). New documents are buffered as arrays of term
+    ids and merged in with one lexsort by compact().
+    """
+
+    def __init__(self, terms=(), offsets=None, docs=None, positions=None):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.docs = docs if docs is not None else np.zeros(0, dtype=np.int32)
+        self.positions = positions if positions is not None else np.zeros(0, dtype=np.int32)
+        self.pending = []
+
+    def add(self, doc_id, tokens):
+        vocab = self.vocab
+        for term in set(tokens).difference(vocab):
+            vocab[term] = len(vocab)
+        self.pending.append((doc_id, np.array(list(map(vocab.__getitem__, tokens)), dtype=np.int32)))
+
+    def compact(self):
+        if not self.pending:
+            return
+        lengths = np.array([len(ids) for _, ids in self.pending], dtype=np.int64)
+        new_terms = np.concatenate([ids for _, ids in self.pending])
+        new_docs = np.repeat(np.array([doc for doc, _ in self.pending], dtype=np.int32), lengths)
+        new_positions = (np.arange(len(new_terms)) - np.repeat(np.cumsum(lengths) - lengths, lengths)).astype(np.int32)
+
+        old_terms = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int32), np.diff(self.offsets))
+        terms = np.concatenate([old_terms, new_terms])
+        docs = np.concatenate([self.docs, new_docs])
+        positions = np.concatenate([self.positions, new_positions])
+        order = np.lexsort((positions, docs, terms))
+        self.docs = docs[order]
+        self.positions = positions[order]
+        self.offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocab)), out=self.offsets[1:])
+        self.pending = []
+
+    def keys(self, term):
+        # doc << 32 | position of every occurrence (sorted), or None for unknown terms
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return None
+        self.compact()
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return (self.docs[start:end].astype(np.int64) << 32) + self.positions[start:end]
+
+    def phrase_docs(self, tokens):
+        # doc ids containing tokens[0] tokens[1] ... at consecutive positions
+        starts = None
+        for i, token in enumerate(tokens):
+            keys = self.keys(token)
+            if keys is None:
+                return np.zeros(0, dtype=np.int64)
+            keys = keys - i
+            starts = keys if starts is None else np.intersect1d(starts, keys, assume_unique=True)
+            if len(starts) == 0:
+                break
+        return np.unique(starts >> 32)
+
+
+class InvertedIndex:
+    """
+    Positional full-text index over crawled host titles and bodies, to test
+    keywords offline before spending live search quota.
+
+    Every document is indexed twice: plain lower-cased tokens ("word") and
+    leet-folded tokens ("leet", where v1agra / vi@gra / viagra meet).
+    Postings keep token positions, so multi-word keywords are phrase
+    queries like the Censys body search. With a path the index persists as
+    a directory of .npy arrays that are memory-mapped on reopen.
+    """
+
+    KINDS = ("word", "leet")
+
+    def __init__(self, path=None):
+        self.path = path
+        self.ips = []
+        self.doc_ids = {}
+        self.postings = {kind: PostingsList() for kind in self.KINDS}
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            self.load()
+
+    def __len__(self):
+        return len(self.ips)
+
+    def __contains__(self, ip):
+        return ip in self.doc_ids
+
+    def add(self, ip, title="", body=""):
+        # indexes a host once; returns its doc id
+        if ip in self.doc_ids:
+            return self.doc_ids[ip]
+        doc_id = len(self.ips)
+        self.doc_ids[ip] = doc_id
+        self.ips.append(ip)
+        text = f"{title or ''}\n{body or ''}"
+        for kind in self.KINDS:
+            self.postings[kind].add(doc_id, index_tokens(text, leet=kind == "leet"))
+        return doc_id
+
+    def add_store(self, store):
+        # every host of a censys_utils.HostContentStore
+        for host_id in range(len(store)):
+            content = store.content(host_id)
+            self.add(store.ip(host_id), content["title"], content["body"])
+        return self
+
+    def search_ids(self, phrase, leet=False):
+        tokens = index_tokens(phrase, leet=leet)
+        if not tokens:
+            return set()
+        return set(self.postings["leet" if leet else "word"].phrase_docs(tokens).tolist())
+
+    def search(self, phrase, leet=False):
+        return {self.ips[doc] for doc in self.search_ids(phrase, leet)}
+
+    def score_keywords(self, keywords, leet=False, known=()):
+        """
+        Scores candidate keywords against the indexed corpus. Returns a
+        DataFrame with, per keyword, the hosts it matches, those not in
+        `known` (e.g. the baseline hosts' ips) and those no other candidate
+        term matches (variants of one term don't count against each other),
+        sorted by new hosts.
+        """
+        keywords = list(dict.fromkeys(keywords))
+        known_ids = {self.doc_ids[ip] for ip in known if ip in self.doc_ids}
+        # variants with the same tokens ("rx-meds" / "rx meds", or v1agra / viagra with leet) are searched once
+        by_tokens = {}
+        matches = {}
+        for kw in keywords:
+            tokens = tuple(index_tokens(kw, leet=leet))
+            if tokens not in by_tokens:
+                by_tokens[tokens] = self.search_ids(kw, leet)
+            matches[kw] = by_tokens[tokens]
+        counts = Counter(doc for docs in by_tokens.values() for doc in docs)
+        rows = [{"keyword": kw, "hosts": len(docs), "new_hosts": len(docs - known_ids),
+                 "unique_hosts": sum(1 for doc in docs if counts[doc] == 1 and doc not in known_ids)}
+                for kw, docs in matches.items()]
+        df = pd.DataFrame(rows, columns=["keyword", "hosts", "new_hosts", "unique_hosts"])
+        return df.sort_values(["new_hosts", "hosts"], ascending=False, kind="stable").reset_index(drop=True)
+
+    def load(self):
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        column = lambda name: np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+        self.ips = meta["ips"]
+        self.doc_ids = {ip: i for i, ip in enumerate(self.ips)}
+        for kind in self.KINDS:
+            self.postings[kind] = PostingsList(meta["terms"][kind], column(kind + "_offsets"),
+                                               column(kind + "_docs"), column(kind + "_positions"))
+
+    def save(self, path=None):
+        self.path = path or self.path
+        os.makedirs(self.path, exist_ok=True)
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            # an index without meta.json is incomplete, so a crash below can't mix old and new columns
+            os.remove(meta_path)
+        meta = {"ips": self.ips, "terms": {}}
+        for kind in self.KINDS:
+            postings = self.postings[kind]
+            postings.compact()
+            for name in ("offsets", "docs", "positions"):
+                # through a temp file: after load() the columns are memory-mapped from these very files
+                column = os.path.join(self.path, f"{kind}_{name}.npy")
+                with open(column + ".tmp", "wb") as f:
+                    np.save(f, np.asarray(getattr(postings, name)))
+                os.replace(column + ".tmp", column)
+            meta["terms"][kind] = list(postings.vocab)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
@@ -0,0 +1,427 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+###################### ARTIFACTS ######################
+
+def file_digest(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def artifact_files(path):
+    # the files of a file / directory artifact, relative to `path`, in a stable order
+    if os.path.isfile(path):
+        return ['']
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            files.append(os.path.relpath(os.path.join(dirpath, name), path))
+    return files
+
+
+def artifact_digests(path):
+    # [(relative file, sha256)] of an artifact; missing artifacts have none
+    if not os.path.exists(path):
+        return []
+    return [(rel, file_digest(os.path.join(path, rel) if rel else path)) for rel in artifact_files(path)]
+
+
+def combined_digest(digests):
+    h = hashlib.sha256()
+    for rel, digest in digests:
+        h.update(f"{rel}\0{digest}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+class Artifact:
+    """
+    A file or directory produced by a stage, with a kind checked once the
+    stage finished: csv (readable, with the declared columns), json
+    (parses), dir (not empty) or file / figure (exists, not empty). The kind
+    defaults from the extension.
+    """
+
+    KINDS = {'.csv': 'csv', '.json': 'json', '.png': 'figure', '.jpg': 'figure', '.pdf': 'figure', '.svg': 'figure'}
+
+    def __init__(self, path, kind=None, columns=()):
+        self.path = os.path.normpath(path)
+        self.kind = kind or self.KINDS.get(os.path.splitext(path)[1].lower(), 'file')
+        self.columns = tuple(columns)
+
+    def __repr__(self):
+        return f"Artifact({self.path!r}, {self.kind!r})"
+
+    def validate(self, root):
+        path = os.path.join(root, self.path)
+        if self.kind == 'dir':
+            if not os.path.isdir(path) or not artifact_files(path):
+                raise PipelineError(f"{self.path}: expected a non-empty directory")
+            return
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            raise PipelineError(f"{self.path}: missing or empty {self.kind}")
+        if self.kind == 'csv':
+            import pandas as pd
+            header = pd.read_csv(path, nrows=0).columns
+            missing = [c for c in self.columns if c not in header]
+            if missing:
+                raise PipelineError(f"{self.path}: missing columns {', '.join(missing)}")
+        elif self.kind == 'json':
+            with open(path, encoding='utf-8') as f:
+                try:
+                    json.load(f)
+                except ValueError as e:
+                    raise PipelineError(f"{self.path}: invalid json ({e})")
+
+
+###################### CONTENT STORE ######################
+
+class ContentStore:
+    """
+    Content-addressed cache of stage outputs under `root`:
+      objects/<sha[:2]>/<sha>   file contents by sha256
+      runs/<key>.json           per stage key: the output files and their digests
+      logs/<stage>.log          output of the last run of each stage
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for sub in ('objects', 'runs', 'logs'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def put_file(self, path, digest):
+        target = self.object_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target))
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+
+    def restore_file(self, digest, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(self.object_path(digest), path)
+
+    def has_objects(self, record):
+        return all(os.path.exists(self.object_path(digest))
+                   for files in record['outputs'].values() for _, digest in files)
+
+    def run_path(self, key):
+        return os.path.join(self.root, 'runs', key + '.json')
+
+    def load_run(self, key):
+        try:
+            with open(self.run_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_run(self, key, record):
+        tmp = self.run_path(key) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(record, f, indent=1)
+        os.replace(tmp, self.run_path(key))
+
+    def log_path(self, name):
+        return os.path.join(self.root, 'logs', name + '.log')
+
+
+###################### STAGES ######################
+
+UTILS_IMPORT = re.compile(r'^\s*from\s+(?:utils\.)?(\w+)\s+import', re.M)
+
+
+def code_dependencies(path, root='.', utils_dir='utils'):
+    # the script plus every utils module it imports, transitively (paths relative to root)
+    seen = [os.path.normpath(path)]
+    i = 0
+    while i < len(seen):
+        with open(os.path.join(root, seen[i]), encoding='utf-8') as f:
+            source = f.read()
+        if seen[i].endswith('.ipynb'):
+            source = '\n'.join(''.join(c['source']) for c in json.loads(source)['cells'] if c['cell_type'] == 'code')
+        for module in UTILS_IMPORT.findall(source):
+            dep = os.path.join(utils_dir, module + '.py')
+            if os.path.exists(os.path.join(root, dep)) and dep not in seen:
+                seen.append(dep)
+        i += 1
+    return seen
+
+
+class Stage:
+    """
+    One step of the pipeline: `command` (argv, run from `cwd` under the
+    pipeline root) reads `inputs` (paths) and writes `outputs` (Artifacts).
+
+    A stage's key hashes its code (script + imported utils modules), the
+    content of its inputs, its fixed `env` and the current values of the
+    environment variables named in `params`. Inputs that are another
+    stage's outputs are what makes the DAG. Stages naming the same entry in
+    `resources` (e.g. an API quota they share) never run at the same time.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=(), env=None, params=(), code=(), cwd='.',
+                 resources=()):
+        self.name = name
+        self.command = list(command)
+        self.inputs = [os.path.normpath(p) for p in inputs]
+        self.outputs = [o if isinstance(o, Artifact) else Artifact(o) for o in outputs]
+        self.env = dict(env or {})
+        self.params = tuple(params)
+        self.code = list(code)
+        self.cwd = cwd
+        self.resources = frozenset(resources)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def script_stage(name, script, root='.', **kwargs):
+    # a Python script / notebook (path relative to root) run as-is; its code
+    # deps are found from its imports
+    kwargs.setdefault('code', code_dependencies(script, root))
+    if script.endswith('.ipynb'):
+        command = [sys.executable, '-c', 'import sys; from utils.pipeline_utils import run_notebook; '
+                                         'run_notebook(sys.argv[1])', os.path.basename(script)]
+        kwargs.setdefault('cwd', os.path.dirname(script))
+    else:
+        command = [sys.executable, script]
+    return Stage(name, command, **kwargs)
+
+
+def run_notebook(path):
+    """
+    Executes the code cells of a notebook top to bottom in one namespace
+    from the notebook's directory, like "Run All". IPython magics and shell
+    lines (%, !) are skipped.
+    """
+    with open(path, encoding='utf-8') as f:
+        nb = json.load(f)
+    namespace = {'__name__': '__main__', '__file__': path}
+    for i, cell in enumerate(nb['cells']):
+        if cell['cell_type'] != 'code':
+            continue
+        lines = [line for line in ''.join(cell['source']).splitlines() if not line.lstrip().startswith(('%', '!'))]
+        exec(compile('\n'.join(lines), f"{os.path.basename(path)}[{i}]", 'exec'), namespace)
+
+
+###################### DAG RUNNER ######################
+
+STATUS_CACHED = 'cached'
+STATUS_RESTORED = 'restored'
+STATUS_RAN = 'ran'
+STATUS_STALE = 'stale'
+STATUS_FAILED = 'failed'
+STATUS_BLOCKED = 'blocked'
+
+
+class Pipeline:
+    """
+    Runs stages as a DAG with content-addressed caching.
+
+    A stage whose key is already in the store is skipped; if its outputs
+    were changed or deleted on disk they are restored from the store. As
+    downstream keys hash the content (not timestamps) of upstream outputs,
+    a rerun that reproduces the same files does not invalidate anything
+    below it. Up to `jobs` independent stages run at once, except stages
+    sharing a resource, which run one after the other.
+    """
+
+    def __init__(self, stages, root='.', cache_dir='.pipeline_cache', jobs=4):
+        self.root = os.path.abspath(root)
+        self.stages = {s.name: s for s in stages}
+        self.store = ContentStore(os.path.join(self.root, cache_dir))
+        self.jobs = jobs
+        self.print_lock = threading.Lock()
+
+        producers = {}
+        for stage in stages:
+            for artifact in stage.outputs:
+                if artifact.path in producers:
+                    raise PipelineError(f"{artifact.path} is produced by {producers[artifact.path]} and {stage.name}")
+                producers[artifact.path] = stage.name
+        self.deps = {s.name: sorted({producers[p] for p in s.inputs if p in producers}) for s in stages}
+        self.order = self._toposort()
+
+    def _toposort(self):
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise PipelineError(f"cycle: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self.deps[name]:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def select(self, targets=None):
+        # the targets and everything upstream of them, in dependency order
+        if not targets:
+            return list(self.order)
+        unknown = [t for t in targets if t not in self.stages]
+        if unknown:
+            raise PipelineError(f"unknown stages: {', '.join(unknown)} (known: {', '.join(self.order)})")
+        needed = set()
+        todo = list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.deps[name])
+        return [name for name in self.order if name in needed]
+
+    def _log(self, message):
+        with self.print_lock:
+            print(message, flush=True)
+
+    ###################### keys ######################
+
+    def stage_key(self, stage):
+        inputs = {}
+        for path in stage.inputs:
+            digests = artifact_digests(os.path.join(self.root, path))
+            if not digests:
+                raise PipelineError(f"{stage.name}: missing input {path}")
+            inputs[path] = combined_digest(digests)
+        payload = {
+            'stage': stage.name,
+            'command': stage.command[1:],   # not the interpreter path
+            'code': {p: file_digest(os.path.join(self.root, p)) for p in stage.code},
+            'inputs': inputs,
+            'env': stage.env,
+            'params': {p: os.getenv(p) for p in stage.params},
+            'outputs': [(a.path, a.kind, a.columns) for a in stage.outputs],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    ###################### execution ######################
+
+    def _outputs_match(self, record):
+        for path, files in record['outputs'].items():
+            if artifact_digests(os.path.join(self.root, path)) != [tuple(f) for f in files]:
+                return False
+        return True
+
+    def _restore(self, record):
+        for path, files in record['outputs'].items():
+            for rel, digest in files:
+                self.store.restore_file(digest, os.path.join(self.root, path, rel) if rel else os.path.join(self.root, path))
+
+    def _execute(self, stage):
+        env = dict(os.environ)
+        env.update(stage.env)
+        env.setdefault('MPLBACKEND', 'Agg')   # scripts call plt.show()
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (self.root, env.get('PYTHONPATH')) if p)
+        with open(self.store.log_path(stage.name), 'w') as log:
+            proc = subprocess.run(stage.command, cwd=os.path.join(self.root, stage.cwd), env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            raise PipelineError(f"exit {proc.returncode}, see {os.path.relpath(self.store.log_path(stage.name))}")
+        for artifact in stage.outputs:
+            artifact.validate(self.root)
+
+    def run_stage(self, stage, force=False):
+        start = time.perf_counter()
+        try:
+            key = self.stage_key(stage)
+            record = None if force else self.store.load_run(key)
+            if record is not None and self._outputs_match(record):
+                status = STATUS_CACHED
+            elif record is not None and self.store.has_objects(record):
+                self._restore(record)
+                status = STATUS_RESTORED
+            else:
+                self._execute(stage)
+                outputs = {}
+                for artifact in stage.outputs:
+                    files = artifact_digests(os.path.join(self.root, artifact.path))
+                    for rel, digest in files:
+                        self.store.put_file(os.path.join(self.root, artifact.path, rel) if rel
+                                            else os.path.join(self.root, artifact.path), digest)
+                    outputs[artifact.path] = files
+                self.store.save_run(key, {'stage': stage.name, 'key': key, 'outputs': outputs,
+                                          'seconds': time.perf_counter() - start,
+                                          'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+                status = STATUS_RAN
+        except Exception as e:
+            self._log(f"[Pipeline] {stage.name}: {STATUS_FAILED} ({e})")
+            return STATUS_FAILED
+        self._log(f"[Pipeline] {stage.name}: {status} ({time.perf_counter() - start:.1f}s)")
+        return status
+
+    def plan(self, targets=None, force=()):
+        # what run() would do, without running anything: cached or stale per stage
+        status = {}
+        for name in self.select(targets):
+            stage = self.stages[name]
+            if name in force or 'all' in force or any(status[d] != STATUS_CACHED for d in self.deps[name]):
+                status[name] = STATUS_STALE
+                continue
+            try:
+                record = self.store.load_run(self.stage_key(stage))
+            except PipelineError:
+                record = None
+            status[name] = STATUS_CACHED if record is not None else STATUS_STALE
+        return status
+
+    def _busy(self, stage, running):
+        # a resource of stage is held by a running stage
+        return any(stage.resources & self.stages[name].resources for name in running.values())
+
+    def run(self, targets=None, force=()):
+        """
+        Runs the selected stages (all by default) and what they depend on.
+        force: stage names (or "all") to rerun even when cached. Returns
+        {stage: status}; stages downstream of a failure are "blocked".
+        """
+        force = set(force)
+        pending = self.select(targets)
+        status = {}
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.deps[name]
+                    if any(status.get(d) in (STATUS_FAILED, STATUS_BLOCKED) for d in deps):
+                        pending.remove(name)
+                        status[name] = STATUS_BLOCKED
+                        self._log(f"[Pipeline] {name}: {STATUS_BLOCKED}")
+                    elif all(d in status for d in deps) and not self._busy(self.stages[name], running):
+                        pending.remove(name)
+                        stage = self.stages[name]
+                        running[pool.submit(self.run_stage, stage, name in force or 'all' in force)] = name
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    status[running.pop(future)] = future.result()
+        return status
@@ -0,0 +1,355 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+
+###################### REPLAY ARCHIVE ######################
+
+class ReplayMiss(KeyError):
+    pass
+
+
+class ReplayRateLimitError(Exception):
+    # what an injected 429 raises; the pipelines retry on any exception
+    status_code = 429
+
+    def __init__(self, message='429 Too Many Requests (replay)'):
+        super().__init__(message)
+
+
+def request_key(request):
+    return hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ReplayArchive:
+    """
+    Gzip NDJSON archive of recorded API responses keyed by request.
+
+    Every line is {"key", "request", "response", "seconds"} where key is the
+    sha1 of the canonical request JSON and seconds the upstream latency.
+    Records are appended (one gzip member per flush), a later record for
+    the same request replaces an earlier one, and a truncated tail left by
+    an interrupted recording is ignored (and dropped before the next record
+    is appended, which would otherwise be unreadable behind it).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.f = None
+        self.truncated = False
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        self.truncated = True
+                        break
+                    self.entries[record['key']] = record
+            except (EOFError, OSError, zlib.error):
+                self.truncated = True
+
+    def _rewrite(self):
+        # the readable records only, replacing the file atomically
+        tmp = self.path + '.tmp'
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            for record in self.entries.values():
+                f.write(json.dumps(record, default=str) + '\n')
+        os.replace(tmp, self.path)
+        self.truncated = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, request):
+        return request_key(request) in self.entries
+
+    def get(self, request):
+        entry = self.entries.get(request_key(request))
+        if entry is None:
+            raise ReplayMiss(f"not in {self.path}: {json.dumps(request, sort_keys=True, default=str)[:200]}")
+        return entry
+
+    def put(self, request, response, seconds=0.0):
+        record = {'key': request_key(request), 'request': request, 'response': response, 'seconds': seconds}
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            self.entries[record['key']] = record
+            if self.f is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if self.truncated:
+                    self._rewrite()
+                self.f = gzip.open(self.path, 'at', encoding='utf-8')
+            self.f.write(line)
+            self.f.flush()
+        return record
+
+    def close(self):
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+
+###################### SIMULATED CONDITIONS ######################
+
+class ReplayConditions:
+    """
+    Timing and failures applied to every replayed request.
+
+    latency:    seconds per request, or None to sleep the recorded upstream
+                time; either is multiplied by `scale` and spread by +-jitter
+    rate_limit: requests per second the fake server accepts (burst of
+                `burst`); requests over it fail with ReplayRateLimitError
+                instead of waiting, like a real 429
+    error_rate: probability of an additional random 429
+    Random draws come from one seeded generator, so a run is repeatable.
+    """
+
+    def __init__(self, latency=None, scale=1.0, jitter=0.0, rate_limit=None, burst=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.scale = scale
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(1.0, rate_limit or 1.0)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'injected': 0}
+
+    @classmethod
+    def from_env(cls, prefix='REPLAY'):
+        def number(name, cast=float):
+            value = os.getenv(f'{prefix}_{name}')
+            return cast(value) if value not in (None, '', 'recorded') else None
+        return cls(latency=number('LATENCY'),
+                   scale=number('LATENCY_SCALE') or 1.0,
+                   jitter=number('JITTER') or 0.0,
+                   rate_limit=number('RATE_LIMIT'),
+                   burst=number('BURST'),
+                   error_rate=number('429_RATE') or 0.0,
+                   seed=number('SEED', int) or 0)
+
+    def _admit(self):
+        # non-blocking token bucket: an empty bucket is a 429, not a wait
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate_limit)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def apply(self, recorded_seconds=0.0):
+        with self.lock:
+            self.stats['requests'] += 1
+            admitted = self._admit()
+            injected = admitted and self.error_rate > 0 and self.rng.random() < self.error_rate
+            spread = 1 + self.jitter * (2 * self.rng.random() - 1) if self.jitter else 1
+            if not admitted:
+                self.stats['throttled'] += 1
+            if injected:
+                self.stats['injected'] += 1
+        delay = (recorded_seconds if self.latency is None else self.latency) * self.scale * spread
+        if delay > 0:
+            time.sleep(delay)
+        if not admitted or injected:
+            raise ReplayRateLimitError()
+
+
+def replay_mode(prefix):
+    # "<prefix>_REPLAY=path" turns replay on, "<prefix>_REPLAY_MODE=record" records instead
+    path = os.getenv(f'{prefix}_REPLAY')
+    if not path:
+        return None, None
+    return path, os.getenv(f'{prefix}_REPLAY_MODE', 'replay')
+
+
+###################### CENSYS ######################
+
+class ReplayCensysHosts:
+    """
+    Drop-in for CensysHosts (view / search) backed by a ReplayArchive.
+
+    mode="record" forwards to the real client (built by `upstream`, a
+    callable, on first use) and archives every response; mode="replay"
+    serves the archive under `conditions` and never touches the network.
+
+    Searches are archived as one hit list per query (paging parameters are
+    not part of the key) and re-paged on replay, so a replay may use any
+    per_page / pages / max_records the recording covers. Each replayed
+    page costs one request's latency and may be throttled.
+    """
+
+    def __init__(self, archive, mode='replay', upstream=None, conditions=None):
+        self.archive = archive if isinstance(archive, ReplayArchive) else ReplayArchive(archive)
+        self.mode = mode
+        self.upstream = upstream
+        self.conditions = conditions if conditions is not None else ReplayConditions()
+        self._api = None
+
+    @property
+    def api(self):
+        if self._api is None:
+            if self.upstream is None:
+                raise ReplayMiss('no upstream client to record from')
+            self._api = self.upstream()
+        return self._api
+
+    def view(self, ip, **kwargs):
+        request = {'api': 'censys', 'method': 'view', 'ip': ip, **kwargs}
+        if self.mode == 'record':
+            start = time.perf_counter()
+            record = self.api.view(ip, **kwargs)
+            self.archive.put(request, record, time.perf_counter() - start)
+            return record
+        entry = self.archive.get(request)
+        self.conditions.apply(entry['seconds'])
+        return entry['response']
+
+    def search(self, query, per_page=100, pages=1, max_records=None, **kwargs):
+        request = {'api': 'censys', 'method': 'search', 'query': query, **kwargs}
+        if self.mode == 'record':
+            yield from self._record_search(request, query, per_page, pages, max_records, **kwargs)
+            return
+        entry = self.archive.get(request)
+        hits = entry['response']['hits']
+        limit = max_records if max_records is not None else (per_page * pages if pages and pages > 0 else None)
+        if limit is None or limit > len(hits):
+            if not entry['response']['complete']:
+                raise ReplayMiss(f"recording of {query!r} has {len(hits)} hits, {limit or 'all'} requested")
+            limit = len(hits)
+        for start in range(0, limit, per_page):
+            self.conditions.apply(entry['seconds'])
+            yield hits[start:min(start + per_page, limit)]
+
+    def _record_search(self, request, query, per_page, pages, max_records, **kwargs):
+        # pages are passed through as they arrive; the archive is written when
+        # the search ends, also when the caller stops reading early, and keeps
+        # the longer recording
+        hits = []
+        seconds = []
+        complete = False
+        finished = False
+        start = time.perf_counter()
+        if max_records is not None:
+            kwargs['max_records'] = max_records
+        upstream = self.api.search(query, per_page=per_page, pages=pages, **kwargs)
+        try:
+            for page in upstream:
+                seconds.append(time.perf_counter() - start)
+                page = page if isinstance(page, list) else [page]
+                hits.extend(page)
+                complete = len(page) < per_page
+                yield page
+                start = time.perf_counter()
+            finished = True
+        finally:
+            if hasattr(upstream, 'close'):
+                upstream.close()
+            # fewer pages than allowed also means the result set ran out
+            if finished:
+                complete = complete or not seconds or (max_records is None and pages is not None
+                                                       and 0 < len(seconds) < pages)
+            self._archive_search(request, hits, complete, seconds)
+
+    def _archive_search(self, request, hits, complete, seconds):
+        if not hits and not complete:
+            return
+        if request in self.archive:
+            previous = self.archive.get(request)['response']
+            if previous['complete'] or len(previous['hits']) > len(hits):
+                return
+        self.archive.put(request, {'hits': hits, 'complete': complete}, sum(seconds) / max(1, len(seconds)))
+
+
+def censys_replay_from_env(api_kwargs=None):
+    # CENSYS_REPLAY / CENSYS_REPLAY_MODE, conditions from REPLAY_* (see ReplayConditions)
+    path, mode = replay_mode('CENSYS')
+    if path is None:
+        return None
+
+    def upstream():
+        from censys.search import CensysHosts
+        return CensysHosts(**(api_kwargs or {}))
+    return ReplayCensysHosts(path, mode, upstream, ReplayConditions.from_env())
+
+
+###################### LLM ######################
+
+def to_namespace(value):
+    # recorded response dicts back into attribute access (resp.choices[0].message.content)
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [to_namespace(v) for v in value]
+    return value
+
+
+def response_to_dict(response):
+    if hasattr(response, 'model_dump'):
+        return response.model_dump()
+    # plain objects (e.g. MockLLMClient answers): keep what the pipeline reads
+    return {'choices': [{'message': {'content': choice.message.content}} for choice in response.choices]}
+
+
+class ReplayLLMClient:
+    """
+    Drop-in for the OpenAI client's chat.completions.create backed by a
+    ReplayArchive, keyed by the full call (model, messages, parameters).
+    Same record / replay modes and conditions as ReplayCensysHosts.
+    """
+
+    def __init__(self, archive, mode='replay', upstream=None, conditions=None):
+        self.archive = archive if isinstance(archive, ReplayArchive) else ReplayArchive(archive)
+        self.mode = mode
+        self.upstream = upstream
+        self.conditions = conditions if conditions is not None else ReplayConditions()
+        self._client = None
+        self.chat = self
+        self.completions = self
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.upstream is None:
+                raise ReplayMiss('no upstream client to record from')
+            self._client = self.upstream()
+        return self._client
+
+    def create(self, **kwargs):
+        request = {'api': 'llm', 'method': 'chat.completions.create', **kwargs}
+        if self.mode == 'record':
+            start = time.perf_counter()
+            response = self.client.chat.completions.create(**kwargs)
+            self.archive.put(request, response_to_dict(response), time.perf_counter() - start)
+            return response
+        entry = self.archive.get(request)
+        self.conditions.apply(entry['seconds'])
+        return to_namespace(entry['response'])
+
+
+def llm_replay_from_env(upstream):
+    # OPENAI_REPLAY / OPENAI_REPLAY_MODE, conditions from REPLAY_* (see ReplayConditions)
+    path, mode = replay_mode('OPENAI')
+    if path is None:
+        return None
+    return ReplayLLMClient(path, mode, upstream, ReplayConditions.from_env())